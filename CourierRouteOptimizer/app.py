@@ -1,8 +1,25 @@
 import os
+import base64
+import hashlib
 import logging
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session
+import click
+from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session, Response, stream_with_context
 import config
-from route_optimizer import optimize_route, geocode_address, get_route_details
+from route_optimizer import (optimize_route, get_route_details, parse_departure_time, service_times,
+                             without_weather, attach_weather)
+from traffic_refresher import merge_traffic_state, traffic_delta, traffic_event_stream
+from route_store import load_session_route, save_session_route
+from http_cache import json_response
+from result_cache import optimization_cache, optimization_key, geocode_cache, cached_geocode
+from auth_cache import api_key_cache
+from bulk_export import ndjson_stream, zip_stream
+from route_archive import archive_saved_route
+from cold_storage import archive_completed_routes
+from route_import import route_row, location_row, insert_routes, import_routes, IMPORT_FORMATS
+from migrations import run_migrations
+from query_counter import query_budget, install_query_budget
+from analytics_rollups import record_route_completed, record_route_deleted, dashboard_stats, route_count
+from geometry import route_for_zoom, zoom_for_tolerance
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
@@ -26,13 +43,89 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 # Initialize the app with the extension
 db.init_app(app)
 
+def _encode_keyset_cursor(timestamp, row_id):
+    """Opaque keyset cursor pointing after the row with this sort timestamp and id"""
+    key = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_keyset_cursor(cursor):
+    """
+    Decode a cursor from _encode_keyset_cursor()
+    
+    Returns:
+        (timestamp, id) tuple; raises ValueError if malformed
+    """
+    import datetime
+    
+    key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    timestamp, row_id = key.rsplit('|', 1)
+    return datetime.datetime.fromisoformat(timestamp), int(row_id)
+
+def _route_summaries(cursor=None, limit=None):
+    """
+    One page of saved routes, newest first, without coordinates or locations
+    
+    Args:
+        cursor: next_cursor of the previous page
+        limit: Routes per page, SAVED_ROUTES_PAGE_SIZE by default
+    
+    Returns:
+        (list of summary dictionaries, next_cursor or None); raises
+        ValueError for a malformed cursor
+    """
+    from models import Route, Location
+    from sqlalchemy import and_, func, or_, select
+    
+    limit = limit or config.SAVED_ROUTES_PAGE_SIZE
+    stop_count = select(func.count(Location.id)).where(
+        Location.route_id == Route.id
+    ).correlate(Route).scalar_subquery()
+    query = db.session.query(
+        Route.id, Route.name, Route.created_at, Route.total_distance, Route.total_time, stop_count.label('stop_count')
+    )
+    if cursor:
+        created_at, route_id = _decode_keyset_cursor(cursor)
+        query = query.filter(or_(
+            Route.created_at < created_at, and_(Route.created_at == created_at, Route.id < route_id)
+        ))
+    
+    # One extra row tells whether there is a next page
+    rows = query.order_by(Route.created_at.desc(), Route.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_keyset_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return [row._asdict() for row in rows[:limit]], next_cursor
+
 @app.route('/')
+@query_budget(2)
 def index():
     """Display the main page with the navigation form"""
-    from models import Route
-    # Get saved routes for display
-    saved_routes = Route.query.order_by(Route.created_at.desc()).all()
-    return render_template('index.html', api_key=config.OPENROUTE_API_KEY, saved_routes=saved_routes)
+    # First page of saved routes; the page fetches more from /saved_routes
+    saved_routes, next_cursor = _route_summaries()
+    return render_template('index.html', api_key=config.OPENROUTE_API_KEY, saved_routes=saved_routes,
+                           saved_routes_cursor=next_cursor, saved_route_count=route_count(db.session))
+
+@app.route('/saved_routes')
+@query_budget(1)
+def saved_routes_page():
+    """
+    Next page of saved route summaries as JSON
+    
+    Query parameters: cursor (next_cursor of the previous page) and limit
+    """
+    try:
+        try:
+            limit = min(max(int(request.args.get('limit', config.SAVED_ROUTES_PAGE_SIZE)), 1),
+                        config.SAVED_ROUTES_MAX_PAGE_SIZE)
+            routes, next_cursor = _route_summaries(request.args.get('cursor'), limit)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({"error": "Invalid cursor or limit"}), 400
+        
+        for route in routes:
+            route['created_at'] = route['created_at'].isoformat()
+        return jsonify({"routes": routes, "next_cursor": next_cursor})
+        
+    except Exception as e:
+        logging.error(f"Error loading saved routes: {str(e)}")
+        return jsonify({"error": "Failed to load saved routes"}), 500
 
 @app.route('/optimize', methods=['POST'])
 def optimize():
@@ -81,22 +174,6 @@ def optimize():
             flash("Please enter at least two valid locations to optimize a route.", "danger")
             return redirect(url_for('index'))
 
-        # Geocode addresses to coordinates
-        coords = []
-        formatted_addresses = []
-        for idx, address in enumerate(locations):
-            geocode_result = geocode_address(address)
-            if geocode_result and 'coordinates' in geocode_result:
-                coords.append(geocode_result['coordinates'])
-                formatted_addresses.append(geocode_result['formatted_address'])
-                # Add coordinates to location details
-                location_details[idx]['longitude'] = geocode_result['coordinates'][0]
-                location_details[idx]['latitude'] = geocode_result['coordinates'][1]
-                location_details[idx]['formatted_address'] = geocode_result['formatted_address']
-            else:
-                flash(f"Could not geocode address: {address}", "danger")
-                return redirect(url_for('index'))
-
         # Get current location if provided
         current_lat = request.form.get('current_lat')
         current_lon = request.form.get('current_lon')
@@ -104,19 +181,61 @@ def optimize():
         if current_lat and current_lon:
             start_location = [float(current_lon), float(current_lat)]
             
-        # Optimize route with current location
-        optimized_route, total_time, total_distance = optimize_route(coords, start_location)
-        
-        if not optimized_route:
-            flash("Could not optimize route. Please try different locations.", "danger")
-            return redirect(url_for('index'))
-
-        # Get route details with real-time traffic information
+        # Departure time makes the optimizer cost each leg at the time it is driven
+        departure_time = parse_departure_time(request.form.get('departure_time', ''))
         include_traffic = request.form.get('include_traffic', 'true').lower() == 'true'
-        route_details = get_route_details(optimized_route, include_traffic=include_traffic)
-        
-        # Store in session for display
-        session['optimized_route'] = {
+
+        # Re-submitted stop lists are served from the result cache
+        stop_service_times = service_times(location_details)
+        cache_key = optimization_key(locations, start_location, include_traffic, departure_time, stop_service_times)
+        result = optimization_cache.get(cache_key)
+        if result is None:
+            # Geocode addresses to coordinates
+            coords = []
+            geocoded = []
+            for address in locations:
+                geocode_result = cached_geocode(address)
+                if geocode_result and 'coordinates' in geocode_result:
+                    coords.append(geocode_result['coordinates'])
+                    geocoded.append({
+                        'coordinates': geocode_result['coordinates'],
+                        'formatted_address': geocode_result['formatted_address']
+                    })
+                else:
+                    flash(f"Could not geocode address: {address}", "danger")
+                    return redirect(url_for('index'))
+
+            # Optimize route with current location
+            optimized_route, total_time, total_distance = optimize_route(coords, start_location, departure_time,
+                                                                      stop_service_times)
+
+            if not optimized_route:
+                flash("Could not optimize route. Please try different locations.", "danger")
+                return redirect(url_for('index'))
+
+            # Get route details with real-time traffic information
+            route_details = get_route_details(optimized_route, include_traffic=include_traffic, departure_time=departure_time)
+
+            result = {'geocoded': geocoded, 'optimized_route': optimized_route, 'route_details': route_details}
+            # Routes with straight-line fallback legs are worth retrying later
+            if all(segment.get('traffic_color') != 'gray' for segment in route_details.get('segments', [])):
+                # Weather is current conditions, looked up again on every hit
+                optimization_cache.put(cache_key, dict(result, route_details=without_weather(route_details)))
+        else:
+            attach_weather(result['route_details'], result['optimized_route'])
+
+        optimized_route = result['optimized_route']
+        route_details = result['route_details']
+        formatted_addresses = []
+        for idx, stop in enumerate(result['geocoded']):
+            formatted_addresses.append(stop['formatted_address'])
+            # Add coordinates to location details
+            location_details[idx]['longitude'] = stop['coordinates'][0]
+            location_details[idx]['latitude'] = stop['coordinates'][1]
+            location_details[idx]['formatted_address'] = stop['formatted_address']
+        
+        # Store server-side; the session only keeps the route id
+        save_session_route({
             'coordinates': optimized_route,
             'addresses': [formatted_addresses[i] for i in range(len(formatted_addresses))],
             'total_time': route_details['total_duration'],
@@ -127,8 +246,9 @@ def optimize():
             'traffic_delay_text': route_details.get('traffic_delay_text', ''),
             'has_traffic_data': route_details.get('has_traffic_data', False),
             'traffic_conditions': route_details.get('traffic_conditions', []),
+            'departure_time': departure_time.isoformat() if departure_time else None,
             'last_traffic_update': int(time.time())
-        }
+        }, new_route=True)
         
         flash("Route optimized successfully!", "success")
         return redirect(url_for('index'))
@@ -141,48 +261,65 @@ def optimize():
 @app.route('/get_route')
 def get_route():
     """Return the optimized route data for AJAX requests"""
-    import json
-    import time
-    from route_optimizer import check_for_traffic_updates
-    
-    route_data = session.get('optimized_route', {})
-    
-    # Check if we need to update for traffic changes
+    route_data = load_session_route()
+    since = request.args.get('since', type=int)
+    zoom = _requested_zoom()
+
+    # Traffic is refreshed by the background worker; a poll only reads its shared state
     if route_data and 'coordinates' in route_data:
-        # Check if route is older than 2 minutes or check_traffic parameter is provided
-        current_time = int(time.time())
-        last_update = route_data.get('last_traffic_update', 0)
-        force_check = request.args.get('check_traffic', 'false').lower() == 'true'
-        
-        if force_check or (current_time - last_update > 120):  # 2 minutes
-            logging.debug("Checking for traffic updates...")
-            traffic_update = check_for_traffic_updates(route_data)
-            
-            if traffic_update.get('needs_update', False):
-                logging.debug(f"Traffic update needed: {traffic_update['reason']}")
-                
-                # Update the route with new traffic data
-                new_route = traffic_update.get('new_route')
-                if new_route:
-                    # Update duration and traffic information
-                    route_data['total_time'] = new_route['total_duration']
-                    route_data['total_duration_seconds'] = new_route['total_duration_seconds']
-                    route_data['traffic_delay_text'] = new_route.get('traffic_delay_text', '')
-                    route_data['traffic_conditions'] = new_route.get('traffic_conditions', [])
-                    route_data['route_details'] = new_route
-                    route_data['last_traffic_update'] = current_time
-                    route_data['has_traffic_update'] = True
-                    route_data['traffic_update_reason'] = traffic_update['reason']
-                    
-                    # Store the updated route back in the session
-                    session['optimized_route'] = route_data
-            else:
-                # Still update the last check timestamp
-                route_data['last_traffic_update'] = current_time
-                session['optimized_route'] = route_data
-    
+        route_data, update = merge_traffic_state(route_data)
+        if update:
+            logging.debug(f"Traffic update published: {update['reason']}")
+            save_session_route(route_data)
+
+        # Clients passing their last version only get what changed since then
+        if since is not None:
+            delta = traffic_delta(route_data, since, zoom)
+            if delta is None:
+                return '', 304
+            if delta:
+                return json_response(delta)
+
+        def build_payload():
+            # Only the simplified geometry matching the client's zoom level is sent
+            payload = route_for_zoom(route_data, zoom)
+            if update:
+                payload = dict(payload, has_traffic_update=True, traffic_update_reason=update['reason'])
+            return payload
+
+        # The body only changes with the route, its traffic version and the zoom level
+        cache_key = ('get_route', session.get('route_id'), route_data.get('traffic_version', 0), zoom, bool(update))
+        return json_response(build_payload, cache_key)
+
     return jsonify(route_data)
 
+def _requested_zoom():
+    """Map zoom level from the `zoom` or `tolerance` (metres) query parameter, if any"""
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None:
+        tolerance = request.args.get('tolerance', type=float)
+        if tolerance is not None:
+            zoom = zoom_for_tolerance(tolerance)
+    return zoom
+
+@app.route('/route_stream')
+def route_stream():
+    """Push traffic updates of the session route as server-sent events"""
+    route_data = load_session_route()
+    if not route_data or 'coordinates' not in route_data:
+        return jsonify({'error': 'No route available'}), 404
+
+    # EventSource resends the last event id when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    return Response(
+        stream_with_context(traffic_event_stream(route_data, since, zoom=_requested_zoom())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/get_navigation')
 def get_navigation():
     """Return navigation route from current location to first stop"""
@@ -218,11 +355,8 @@ def get_navigation():
 def save_route():
     """Save the current route to the database"""
     try:
-        from models import Route, Location
-        import datetime
-        
         # Get route data from session
-        route_data = session.get('optimized_route')
+        route_data = load_session_route()
         if not route_data:
             flash("No route to save.", "danger")
             return redirect(url_for('index'))
@@ -230,98 +364,25 @@ def save_route():
         # Get route name from form
         route_name = request.form.get('route_name', '')
         
-        # Create new route
-        new_route = Route(
-            name=route_name,
-            total_distance=float(route_data['total_distance']),
-            total_time=route_data['total_time']
-        )
-        new_route.coordinates = route_data['coordinates']
-        
-        # Add locations
-        location_details = route_data.get('location_details', [])
-        
         # Create a mapping between addresses and location details
-        details_map = {}
-        if location_details:
-            for detail in location_details:
-                formatted_addr = detail.get('formatted_address', '')
-                if formatted_addr:
-                    details_map[formatted_addr] = detail
-        
-        for i, address in enumerate(route_data['addresses']):
-            # Initialize location data
-            location_data = {
-                'formatted_address': address,
-                'position': i
-            }
-            
-            # Try to use stored location details if available
-            if address in details_map:
-                detail = details_map[address]
-                location_data['city'] = detail.get('city', '')
-                location_data['street'] = detail.get('street', '')
-                location_data['number'] = detail.get('number', '')
-                location_data['category'] = detail.get('category', 'home')
-                location_data['longitude'] = detail.get('longitude')
-                location_data['latitude'] = detail.get('latitude')
-                
-                # Convert time strings to time objects if present
-                time_window_start = detail.get('time_window_start', '')
-                time_window_end = detail.get('time_window_end', '')
-                
-                if time_window_start:
-                    try:
-                        location_data['time_window_start'] = datetime.datetime.strptime(time_window_start, '%H:%M').time()
-                    except:
-                        location_data['time_window_start'] = None
-                
-                if time_window_end:
-                    try:
-                        location_data['time_window_end'] = datetime.datetime.strptime(time_window_end, '%H:%M').time()
-                    except:
-                        location_data['time_window_end'] = None
-                
-                try:
-                    location_data['estimated_duration'] = int(detail.get('estimated_duration', 10))
-                except:
-                    location_data['estimated_duration'] = 10
-            else:
-                # Fallback to parsing from the address
-                parts = address.split(',')
-                if len(parts) >= 2:
-                    street_parts = parts[0].strip().split(' ')
-                    if len(street_parts) >= 2:
-                        location_data['street'] = ' '.join(street_parts[:-1])
-                        location_data['number'] = street_parts[-1]
-                    else:
-                        location_data['street'] = parts[0].strip()
-                        location_data['number'] = ''
-                    
-                    location_data['city'] = parts[1].strip()
-                else:
-                    # Fallback
-                    location_data['street'] = address
-                    location_data['city'] = 'Unknown'
-                    location_data['number'] = ''
-                    
-                # Get coordinates from route data
-                coords = route_data['coordinates'][i]
-                location_data['longitude'] = coords[0]
-                location_data['latitude'] = coords[1]
-                
-                # Set default category and estimated_duration
-                location_data['category'] = 'home'
-                location_data['estimated_duration'] = 10
-            
-            # Create location
-            new_location = Location(**location_data)
-            new_route.locations.append(new_location)
+        details_map = {
+            detail['formatted_address']: detail
+            for detail in route_data.get('location_details', []) if detail.get('formatted_address')
+        }
         
-        # Save to database
-        db.session.add(new_route)
+        new_route = route_row(route_name, route_data['coordinates'], route_data['total_distance'], route_data['total_time'])
+        locations = [
+            location_row(i, address, details_map.get(address), route_data['coordinates'][i])
+            for i, address in enumerate(route_data['addresses'])
+        ]
+        
+        # Bulk insert, counting the route in the analytics rollups in the same transaction
+        route_id = insert_routes(db.session, [(new_route, locations)])[0]
         db.session.commit()
         
+        # Keep the leg geometries and timings for historical analysis
+        archive_saved_route(route_id, new_route['created_at'], route_data)
+        
         flash("Route saved successfully!", "success")
         return redirect(url_for('index'))
     
@@ -335,10 +396,10 @@ def save_route():
 def load_route(route_id):
     """Load a saved route from the database"""
     try:
-        from models import Route
+        from models import Route, ArchivedRoute
         
-        # Get route from database
-        route = Route.query.get_or_404(route_id)
+        # Get route from database, or from the archive once its deliveries are long done
+        route = db.session.get(Route, route_id) or ArchivedRoute.query.get_or_404(route_id)
         
         # Convert to route data format
         addresses = []
@@ -376,15 +437,15 @@ def load_route(route_id):
         # Create route_details
         route_details = get_route_details(route.coordinates)
         
-        # Store in session
-        session['optimized_route'] = {
+        # Store server-side; the session only keeps the route id
+        save_session_route({
             'coordinates': route.coordinates,
             'addresses': addresses,
             'total_time': route.total_time,
             'total_distance': str(route.total_distance),
             'route_details': route_details,
             'location_details': location_details
-        }
+        }, new_route=True)
         
         flash("Route loaded successfully!", "success")
         return redirect(url_for('index'))
@@ -404,6 +465,8 @@ def delete_route(route_id):
         route = Route.query.get_or_404(route_id)
         
         # Delete from database
+        record_route_deleted(db.session, route)
+        record_route_tombstones(db.session, route)
         db.session.delete(route)
         db.session.commit()
         
@@ -416,54 +479,29 @@ def delete_route(route_id):
         flash(f"Error deleting route: {str(e)}", "danger")
         return redirect(url_for('index'))
 
+def record_route_tombstones(session, route):
+    """
+    Remember a route that is about to be deleted for the couriers it was assigned to
+    
+    Tombstones older than the change feed's retention are dropped here too.
+    """
+    from models import RouteTombstone
+    from sqlalchemy import delete
+    import datetime
+    
+    session.execute(delete(RouteTombstone).where(
+        RouteTombstone.deleted_at < datetime.datetime.utcnow() - datetime.timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS)
+    ))
+    for courier_id in {assignment.courier_id for assignment in route.assigned_couriers}:
+        session.add(RouteTombstone(courier_id=courier_id, route_id=route.id))
+
 # Analytics endpoint
 @app.route('/analytics/data')
 def analytics_data():
     """Return analytics data for the dashboard"""
     try:
-        from models import Route, Location
-        
-        # Get all routes
-        routes = Route.query.all()
-        
-        # Calculate total distance
-        total_distance = sum(route.total_distance for route in routes)
-        
-        # Calculate total routes
-        total_routes = len(routes)
-        
-        # Calculate distribution of location categories
-        locations = Location.query.all()
-        category_counts = {}
-        for location in locations:
-            category = location.category or 'other'
-            if category in category_counts:
-                category_counts[category] += 1
-            else:
-                category_counts[category] = 1
-        
-        # Get routes by month (for time series chart)
-        from sqlalchemy import func
-        import datetime
-        
-        # Get data for the last 6 months
-        six_months_ago = datetime.datetime.now() - datetime.timedelta(days=180)
-        
-        monthly_counts = db.session.query(
-            func.strftime('%Y-%m', Route.created_at).label('month'), 
-            func.count(Route.id).label('count')
-        ).filter(Route.created_at >= six_months_ago).group_by('month').all()
-        
-        # Format into chart-friendly format
-        months_data = {month: count for month, count in monthly_counts}
-        
-        # Return all analytics data
-        return jsonify({
-            'total_distance': round(total_distance, 1),
-            'total_routes': total_routes,
-            'category_distribution': category_counts,
-            'monthly_routes': months_data
-        })
+        # Aggregates come from the incrementally maintained rollup tables
+        return jsonify(dashboard_stats(db.session))
     
     except Exception as e:
         logging.error(f"Error generating analytics data: {str(e)}")
@@ -472,9 +510,20 @@ def analytics_data():
 # ----------------- Mobile API Endpoints -----------------
 
 def get_courier_from_api_key(api_key):
-    """Helper function to get courier from API key"""
+    """
+    Helper function to get courier from API key
+    
+    Valid keys are cached for API_KEY_CACHE_TTL seconds, so most requests
+    don't query the courier table.
+    """
     from models import Courier
-    return Courier.query.filter_by(api_key=api_key).first()
+    
+    courier = api_key_cache.courier(db.session, Courier, api_key)
+    if courier is None:
+        courier = Courier.query.filter_by(api_key=api_key).first()
+        if courier:
+            api_key_cache.put(api_key, courier)
+    return courier
 
 def api_key_required(f):
     """Decorator to require API key for routes"""
@@ -496,6 +545,32 @@ def api_key_required(f):
     
     return decorated_function
 
+def _assignments_fingerprint(assignments):
+    """
+    Hash of the versions of assigned routes, used as their cache version
+    
+    Every update bumps the version of the row it changes, so the count and
+    version total of each route's stops change whenever any stop does.
+    """
+    from models import Route, Location
+    from sqlalchemy import func
+    
+    digest = hashlib.sha1()
+    for assignment in assignments:
+        digest.update(repr((assignment.id, assignment.version)).encode('utf-8'))
+    
+    route_ids = [assignment.route_id for assignment in assignments]
+    if route_ids:
+        rows = db.session.query(
+            Route.id, Route.version, func.count(Location.id), func.sum(Location.version)
+        ).outerjoin(Location, Location.route_id == Route.id).filter(
+            Route.id.in_(route_ids)
+        ).group_by(Route.id, Route.version).order_by(Route.id)
+        for row in rows:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    
+    return digest.hexdigest()
+
 @app.route('/api/auth/login', methods=['POST'])
 def api_login():
     """API endpoint for courier login"""
@@ -533,28 +608,84 @@ def api_login():
         return jsonify({"error": "An error occurred during login"}), 500
 
 @app.route('/api/routes', methods=['GET'])
+@query_budget(5)
 @api_key_required
 def api_get_routes(courier):
-    """API endpoint to get routes assigned to courier"""
+    """
+    API endpoint to get routes assigned to courier, newest assignment first
+    
+    Query parameters:
+        limit: Routes per page, up to API_ROUTES_MAX_PAGE_SIZE
+        cursor: next_cursor of the previous page
+        status: Comma-separated assignment statuses to include
+        fields: Comma-separated route fields to include (see Route.API_FIELDS);
+            leaving out coordinates and locations avoids loading them
+    """
     try:
-        # Get assigned routes for courier
-        assignments = courier.assigned_routes
-        
-        # Extract route details
-        routes_data = []
-        for assignment in assignments:
-            route = assignment.route
-            if route:
-                route_data = route.to_dict()
-                route_data['assignment'] = {
-                    'status': assignment.status,
-                    'assigned_at': assignment.assigned_at.isoformat(),
-                    'started_at': assignment.started_at.isoformat() if assignment.started_at else None,
-                    'completed_at': assignment.completed_at.isoformat() if assignment.completed_at else None
-                }
-                routes_data.append(route_data)
-        
-        return jsonify({"routes": routes_data})
+        from models import Route, CourierRouteAssignment
+        from sqlalchemy import and_, or_
+        from sqlalchemy.orm import selectinload, defer
+        
+        try:
+            limit = min(max(int(request.args.get('limit', config.API_ROUTES_PAGE_SIZE)), 1),
+                        config.API_ROUTES_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        
+        cursor = request.args.get('cursor')
+        statuses = sorted(filter(None, request.args.get('status', '').split(',')))
+        fields = request.args.get('fields')
+        if fields is not None:
+            fields = tuple(field for field in Route.API_FIELDS if field in fields.split(','))
+        
+        query = CourierRouteAssignment.query.filter(CourierRouteAssignment.courier_id == courier.id)
+        if statuses:
+            query = query.filter(CourierRouteAssignment.status.in_(statuses))
+        if cursor:
+            try:
+                assigned_at, assignment_id = _decode_keyset_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({"error": "Invalid cursor"}), 400
+            query = query.filter(or_(
+                CourierRouteAssignment.assigned_at < assigned_at,
+                and_(CourierRouteAssignment.assigned_at == assigned_at, CourierRouteAssignment.id < assignment_id)
+            ))
+        
+        # Routes (and their locations, if asked for) are loaded with one IN query each
+        route_loader = selectinload(CourierRouteAssignment.route)
+        if fields is None or 'locations' in fields:
+            route_loader = route_loader.selectinload(Route.locations)
+        if fields is not None and 'coordinates' not in fields:
+            route_loader = route_loader.options(defer(Route.coordinates_json), defer(Route.coordinates_blob))
+        
+        # One extra row tells whether there is a next page
+        assignments = query.options(route_loader).order_by(
+            CourierRouteAssignment.assigned_at.desc(), CourierRouteAssignment.id.desc()
+        ).limit(limit + 1).all()
+        next_cursor = None
+        if len(assignments) > limit:
+            next_cursor = _encode_keyset_cursor(assignments[limit - 1].assigned_at, assignments[limit - 1].id)
+        assignments = assignments[:limit]
+        
+        def build_payload():
+            # Extract route details
+            routes_data = []
+            for assignment in assignments:
+                route = assignment.route
+                if route:
+                    route_data = route.to_dict(fields)
+                    route_data['assignment'] = {
+                        'status': assignment.status,
+                        'assigned_at': assignment.assigned_at.isoformat(),
+                        'started_at': assignment.started_at.isoformat() if assignment.started_at else None,
+                        'completed_at': assignment.completed_at.isoformat() if assignment.completed_at else None
+                    }
+                    routes_data.append(route_data)
+            return {"routes": routes_data, "next_cursor": next_cursor}
+        
+        cache_key = ('api_routes', courier.id, cursor, limit, tuple(statuses), fields, next_cursor,
+                     _assignments_fingerprint(assignments))
+        return json_response(build_payload, cache_key)
         
     except Exception as e:
         logging.error(f"API get routes error: {str(e)}")
@@ -576,21 +707,23 @@ def api_get_route_details(courier, route_id):
         if not assignment:
             return jsonify({"error": "Route not found or not assigned to courier"}), 404
             
-        # Get route details
-        route = Route.query.get(route_id)
-        if not route:
-            return jsonify({"error": "Route not found"}), 404
+        def build_payload():
+            # Get route details
+            route = Route.query.get(route_id)
             
-        # Return detailed route info
-        route_data = route.to_dict()
-        route_data['assignment'] = {
-            'status': assignment.status,
-            'assigned_at': assignment.assigned_at.isoformat(),
-            'started_at': assignment.started_at.isoformat() if assignment.started_at else None,
-            'completed_at': assignment.completed_at.isoformat() if assignment.completed_at else None
-        }
+            # Return detailed route info
+            route_data = route.to_dict()
+            route_data['assignment'] = {
+                'status': assignment.status,
+                'assigned_at': assignment.assigned_at.isoformat(),
+                'started_at': assignment.started_at.isoformat() if assignment.started_at else None,
+                'completed_at': assignment.completed_at.isoformat() if assignment.completed_at else None
+            }
+            return {"route": route_data}
         
-        return jsonify({"route": route_data})
+        # An assignment can't outlive its route, so the route exists here
+        cache_key = ('api_route', courier.id, route_id, _assignments_fingerprint([assignment]))
+        return json_response(build_payload, cache_key)
         
     except Exception as e:
         logging.error(f"API get route details error: {str(e)}")
@@ -657,6 +790,7 @@ def api_complete_route(courier, route_id):
             
         assignment.status = 'completed'
         assignment.completed_at = datetime.datetime.utcnow()
+        record_route_completed(db.session, assignment.route, assignment.completed_at)
         
         # Save changes
         db.session.commit()
@@ -672,6 +806,8 @@ def api_complete_route(courier, route_id):
         logging.error(f"API complete route error: {str(e)}")
         return jsonify({"error": "Failed to complete route"}), 500
 
+LOCATION_STATUSES = ['pending', 'in_progress', 'completed', 'failed']
+
 @app.route('/api/locations/<int:location_id>/update', methods=['POST'])
 @api_key_required
 def api_update_location_status(courier, location_id):
@@ -701,7 +837,7 @@ def api_update_location_status(courier, location_id):
         # Update location status
         status = data.get('status')
         if status:
-            if status not in ['pending', 'in_progress', 'completed', 'failed']:
+            if status not in LOCATION_STATUSES:
                 return jsonify({"error": "Invalid status"}), 400
                 
             location.status = status
@@ -729,6 +865,264 @@ def api_update_location_status(courier, location_id):
         logging.error(f"API update location error: {str(e)}")
         return jsonify({"error": "Failed to update location"}), 500
 
+def _client_timestamp(value, now):
+    """
+    Parse an update's ISO 8601 client timestamp as naive UTC, no later than now
+    
+    Returns:
+        datetime, or now when no timestamp was sent; raises ValueError if malformed
+    """
+    import datetime
+    
+    if not value:
+        return now
+    timestamp = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return min(timestamp, now)
+
+def _apply_location_updates(courier_id, updates, now):
+    """
+    Apply validated location updates in the current transaction, without committing
+    
+    Args:
+        courier_id: Courier sending the updates
+        updates: (client timestamp, index, location_id, idempotency key, item) tuples
+        now: Server time of the request
+    
+    Returns:
+        Dictionary of index -> result fields (status, and error if any)
+    """
+    from models import Location, CourierRouteAssignment, LocationUpdateReceipt
+    from sqlalchemy import insert, select, update
+    
+    # Keys seen before, and locations on routes assigned to the courier, one query each
+    keys = [key for _, _, _, key, _ in updates if key is not None]
+    applied_keys = set(db.session.scalars(select(LocationUpdateReceipt.idempotency_key).where(
+        LocationUpdateReceipt.courier_id == courier_id, LocationUpdateReceipt.idempotency_key.in_(keys)
+    ))) if keys else set()
+    assigned = select(CourierRouteAssignment.id).where(
+        CourierRouteAssignment.courier_id == courier_id, CourierRouteAssignment.route_id == Location.route_id
+    ).exists()
+    locations = {row.id: row._asdict() for row in db.session.execute(
+        select(Location.id, Location.status, Location.delivery_notes, Location.completed_at)
+        .where(Location.id.in_({location_id for _, _, location_id, _, _ in updates}), assigned)
+    )}
+    
+    # Later client timestamps win; each location gets one row with its final values
+    changed = {}
+    receipts = []
+    outcomes = {}
+    for timestamp, i, location_id, key, item in sorted(updates, key=lambda update: (update[0], update[1])):
+        if key is not None and key in applied_keys:
+            outcomes[i] = {'status': 'duplicate'}
+            continue
+        location = locations.get(location_id)
+        if location is None:
+            outcomes[i] = {'status': 'error', 'error': "Location not found or not assigned to courier"}
+            continue
+        
+        if item.get('status'):
+            location['status'] = item['status']
+            if item['status'] == 'completed':
+                # The client timestamp only orders the updates, as clients' clocks drift
+                location['completed_at'] = now
+        if item.get('delivery_notes') is not None:  # Accept empty string
+            location['delivery_notes'] = item['delivery_notes']
+        changed[location_id] = location
+        
+        if key is not None:
+            applied_keys.add(key)
+            receipts.append({'courier_id': courier_id, 'idempotency_key': key,
+                             'location_id': location_id, 'processed_at': now})
+        outcomes[i] = {'status': 'applied'}
+    
+    if changed:
+        db.session.execute(update(Location), list(changed.values()))
+    if receipts:
+        db.session.execute(insert(LocationUpdateReceipt), receipts)
+    return outcomes
+
+def expire_location_update_receipts(retention_hours=None):
+    """
+    Delete idempotency keys older than the retention period
+    
+    Args:
+        retention_hours: Hours to keep keys; defaults to IDEMPOTENCY_KEY_RETENTION_HOURS
+    
+    Returns:
+        Number of keys deleted
+    """
+    from models import LocationUpdateReceipt
+    from sqlalchemy import delete
+    import datetime
+    
+    if retention_hours is None:
+        retention_hours = config.IDEMPOTENCY_KEY_RETENTION_HOURS
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=retention_hours)
+    deleted = db.session.execute(delete(LocationUpdateReceipt).where(LocationUpdateReceipt.processed_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+@app.route('/api/locations/update', methods=['POST'])
+@query_budget(6)
+@api_key_required
+def api_batch_update_locations(courier):
+    """
+    API endpoint to apply many location updates at once, e.g. queued while offline
+    
+    Expects {"updates": [{"location_id", "status", "delivery_notes",
+    "client_timestamp", "idempotency_key"}, ...]}. Updates are applied in
+    client timestamp order in one transaction; an update whose idempotency
+    key was already applied is reported as a duplicate and skipped.
+    
+    Returns:
+        {"results": [...]} with one result per update, in request order
+    """
+    try:
+        from sqlalchemy.exc import IntegrityError
+        import datetime
+        
+        data = request.get_json(silent=True) or {}
+        updates = data.get('updates')
+        if not isinstance(updates, list) or not updates:
+            return jsonify({"error": "No updates provided"}), 400
+        if len(updates) > config.API_BATCH_UPDATE_MAX_ITEMS:
+            return jsonify({"error": f"At most {config.API_BATCH_UPDATE_MAX_ITEMS} updates per request"}), 400
+        
+        now = datetime.datetime.utcnow()
+        results = [None] * len(updates)
+        valid = []
+        for i, item in enumerate(updates):
+            item = item if isinstance(item, dict) else {}
+            key = item.get('idempotency_key')
+            results[i] = {'idempotency_key': key, 'location_id': item.get('location_id')}
+            try:
+                location_id = int(item['location_id'])
+                timestamp = _client_timestamp(item.get('client_timestamp'), now)
+            except (KeyError, TypeError, ValueError):
+                results[i].update(status='error', error="location_id and a valid client_timestamp are required")
+                continue
+            if item.get('status') and item['status'] not in LOCATION_STATUSES:
+                results[i].update(status='error', error="Invalid status")
+                continue
+            if key is not None and (not isinstance(key, str) or len(key) > 100):
+                results[i].update(status='error', error="idempotency_key must be a string of at most 100 characters")
+                continue
+            valid.append((timestamp, i, location_id, key, item))
+        
+        # A batch racing this one may store the same idempotency key first; the
+        # insert then fails, and the retry sees the key and skips the update
+        for attempt in range(2):
+            try:
+                outcomes = _apply_location_updates(courier.id, valid, now)
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    raise
+        for i, outcome in outcomes.items():
+            results[i].update(outcome)
+        
+        return jsonify({"success": True, "results": results})
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"API batch update locations error: {str(e)}")
+        return jsonify({"error": "Failed to update locations"}), 500
+
+def _encode_sync_cursor(timestamp):
+    """Opaque change feed cursor for a server time"""
+    return base64.urlsafe_b64encode(timestamp.isoformat().encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_sync_cursor(cursor):
+    """Server time of a cursor from _encode_sync_cursor(); raises ValueError if malformed"""
+    import datetime
+    
+    return datetime.datetime.fromisoformat(
+        base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    )
+
+@app.route('/api/sync', methods=['GET'])
+@query_budget(8)
+@api_key_required
+def api_sync(courier):
+    """
+    API endpoint returning what changed for the courier since a cursor
+    
+    Without a cursor, or when too much changed, the response only has a
+    cursor and full_sync_required; the client then reloads /api/routes
+    and polls with that cursor. Otherwise it has the changed assignments,
+    routes and stops, the full routes of new assignments, and the ids of
+    deleted routes. Every entity carries a version, so the client can
+    ignore changes it has already seen.
+    """
+    try:
+        from models import Route, Location, CourierRouteAssignment, RouteTombstone
+        from sqlalchemy import select
+        from sqlalchemy.orm import selectinload
+        import datetime
+        
+        # Taken before reading, so changes made while this runs are in the next poll
+        now = datetime.datetime.utcnow()
+        cursor = request.args.get('cursor')
+        full_sync = {"cursor": _encode_sync_cursor(now), "full_sync_required": True}
+        if not cursor:
+            return jsonify(full_sync)
+        try:
+            since = _decode_sync_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        if since < now - datetime.timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS):
+            return jsonify(full_sync)
+        since -= datetime.timedelta(seconds=config.SYNC_CURSOR_OVERLAP_SECONDS)
+        limit = config.SYNC_MAX_CHANGES
+        
+        assigned_route_ids = select(CourierRouteAssignment.route_id).where(
+            CourierRouteAssignment.courier_id == courier.id
+        ).scalar_subquery()
+        
+        assignments = CourierRouteAssignment.query.filter(
+            CourierRouteAssignment.courier_id == courier.id, CourierRouteAssignment.updated_at > since
+        ).order_by(CourierRouteAssignment.updated_at).limit(limit + 1).all()
+        
+        # Routes assigned since the cursor are sent whole, with their stops
+        new_route_ids = {assignment.route_id for assignment in assignments if assignment.assigned_at > since}
+        new_routes = Route.query.options(selectinload(Route.locations)).filter(
+            Route.id.in_(new_route_ids)
+        ).all() if new_route_ids else []
+        
+        routes = Route.query.filter(
+            Route.id.in_(assigned_route_ids), Route.id.notin_(new_route_ids), Route.updated_at > since
+        ).order_by(Route.updated_at).limit(limit + 1).all()
+        
+        locations = Location.query.filter(
+            Location.route_id.in_(assigned_route_ids), Location.route_id.notin_(new_route_ids), Location.updated_at > since
+        ).order_by(Location.updated_at).limit(limit + 1).all()
+        
+        if max(len(assignments), len(routes), len(locations)) > limit:
+            return jsonify(full_sync)
+        
+        deleted_route_ids = db.session.scalars(select(RouteTombstone.route_id).where(
+            RouteTombstone.courier_id == courier.id, RouteTombstone.deleted_at > since
+        )).all()
+        
+        return jsonify({
+            "cursor": _encode_sync_cursor(now),
+            "full_sync_required": False,
+            "assignments": [assignment.to_dict() for assignment in assignments],
+            "new_routes": [route.to_dict() for route in new_routes],
+            "routes": [route.to_dict(fields=[field for field in Route.API_FIELDS if field != 'locations'])
+                       for route in routes],
+            "locations": [dict(location.to_dict(), route_id=location.route_id) for location in locations],
+            "deleted_routes": deleted_route_ids
+        })
+        
+    except Exception as e:
+        logging.error(f"API sync error: {str(e)}")
+        return jsonify({"error": "Failed to retrieve changes"}), 500
+
 @app.route('/api/profile', methods=['GET'])
 @api_key_required
 def api_get_profile(courier):
@@ -754,40 +1148,44 @@ def api_get_profile(courier):
 # ----------------- Admin Panel Routes -----------------
 
 @app.route('/admin')
+@query_budget(6)
 def admin_dashboard():
     """Admin dashboard"""
     try:
-        from models import Courier, Route, CourierRouteAssignment, Location
-        from sqlalchemy import func
+        from models import Courier, Route, CourierRouteAssignment, Location, CategoryStats
+        from sqlalchemy import func, select, extract
         import datetime
         
-        # Get counts
+        # Get counts; routes and categories come from the rollups, which include archived routes
         courier_count = Courier.query.count()
-        route_count = Route.query.count()
+        saved_route_count = route_count(db.session)
         active_assignments = CourierRouteAssignment.query.filter(
             CourierRouteAssignment.status.in_(['assigned', 'in_progress'])
         ).count()
         
-        # Get recent activities
-        recent_assignments = CourierRouteAssignment.query.order_by(
+        # Get recent activities, with courier, route and stop count in one query
+        stop_count = select(func.count(Location.id)).where(
+            Location.route_id == Route.id
+        ).correlate(Route).scalar_subquery()
+        recent_assignments = db.session.query(CourierRouteAssignment, Courier, Route, stop_count).join(
+            Courier, Courier.id == CourierRouteAssignment.courier_id
+        ).join(
+            Route, Route.id == CourierRouteAssignment.route_id
+        ).order_by(
             CourierRouteAssignment.assigned_at.desc()
         ).limit(5).all()
         
         recent_activities = []
-        for assignment in recent_assignments:
-            courier = Courier.query.get(assignment.courier_id)
-            route = Route.query.get(assignment.route_id)
+        for assignment, courier, route, stops in recent_assignments:
+            courier_name = f"{courier.first_name} {courier.last_name}" if courier.first_name else courier.username
             
-            if courier and route:
-                courier_name = f"{courier.first_name} {courier.last_name}" if courier.first_name else courier.username
-                
-                activity = {
-                    'timestamp': assignment.assigned_at.strftime('%Y-%m-%d %H:%M'),
-                    'courier': courier_name,
-                    'action': 'Assigned to route',
-                    'details': f"{route.name or f'Route {route.id}'} ({len(route.locations)} stops)"
-                }
-                recent_activities.append(activity)
+            activity = {
+                'timestamp': assignment.assigned_at.strftime('%Y-%m-%d %H:%M'),
+                'courier': courier_name,
+                'action': 'Assigned to route',
+                'details': f"{route.name or f'Route {route.id}'} ({stops} stops)"
+            }
+            recent_activities.append(activity)
         
         # Get delivery statistics for chart
         # Last 7 days
@@ -798,13 +1196,23 @@ def admin_dashboard():
             'failed': []
         }
         
-        for i in range(days - 1, -1, -1):
-            date = datetime.datetime.now().date() - datetime.timedelta(days=i)
+        # Deliveries per day and status in a single GROUP BY
+        first_day = datetime.datetime.now().date() - datetime.timedelta(days=days - 1)
+        day_parts = [extract(field, Location.completed_at) for field in ('year', 'month', 'day')]
+        daily_counts = {}
+        for year, month, day, status, count in db.session.query(
+            *day_parts, Location.status, func.count(Location.id)
+        ).filter(
+            Location.completed_at >= datetime.datetime.combine(first_day, datetime.time.min),
+            Location.status.in_(['completed', 'failed'])
+        ).group_by(*day_parts, Location.status):
+            daily_counts[(datetime.date(int(year), int(month), int(day)), status)] = count
+        
+        for i in range(days):
+            date = first_day + datetime.timedelta(days=i)
             delivery_stats['labels'].append(date.strftime('%m-%d'))
-            
-            # Placeholder data - in a real app, this would be actual data from database
-            delivery_stats['completed'].append(0)
-            delivery_stats['failed'].append(0)
+            delivery_stats['completed'].append(daily_counts.get((date, 'completed'), 0))
+            delivery_stats['failed'].append(daily_counts.get((date, 'failed'), 0))
             
         # Get category distribution
         category_stats = {
@@ -813,13 +1221,13 @@ def admin_dashboard():
         }
         
         # Get actual category counts
+        category_counts = dict(db.session.query(CategoryStats.category, CategoryStats.location_count).all())
         for category in ['home', 'office', 'business', 'pickup_point', 'other']:
-            count = Location.query.filter_by(category=category).count()
-            category_stats['data'].append(count)
+            category_stats['data'].append(category_counts.get(category, 0))
         
         return render_template('admin/index.html', 
                               courier_count=courier_count,
-                              route_count=route_count,
+                              route_count=saved_route_count,
                               active_assignments=active_assignments,
                               recent_activities=recent_activities,
                               delivery_stats=delivery_stats,
@@ -831,18 +1239,25 @@ def admin_dashboard():
         return redirect(url_for('index'))
 
 @app.route('/admin/couriers')
+@query_budget(2)
 def admin_couriers():
     """Admin couriers management page"""
     try:
         from models import Courier, CourierRouteAssignment
         
+        from sqlalchemy import func
+        
+        # Active route counts of all couriers in one GROUP BY
+        active_counts = dict(db.session.query(
+            CourierRouteAssignment.courier_id, func.count(CourierRouteAssignment.id)
+        ).filter(
+            CourierRouteAssignment.status.in_(['assigned', 'in_progress'])
+        ).group_by(CourierRouteAssignment.courier_id).all())
+        
         # Get all couriers with active route count
         couriers = []
         for courier in Courier.query.all():
-            active_routes = CourierRouteAssignment.query.filter(
-                CourierRouteAssignment.courier_id == courier.id,
-                CourierRouteAssignment.status.in_(['assigned', 'in_progress'])
-            ).count()
+            active_routes = active_counts.get(courier.id, 0)
             
             courier_data = {
                 'id': courier.id,
@@ -949,6 +1364,7 @@ def admin_edit_courier():
             courier.set_password(password)
         
         db.session.commit()
+        api_key_cache.invalidate_courier(courier.id)
         
         flash(f"Courier '{username}' updated successfully", "success")
         return redirect(url_for('admin_couriers'))
@@ -984,6 +1400,7 @@ def admin_delete_courier(courier_id):
         # Delete courier
         db.session.delete(courier)
         db.session.commit()
+        api_key_cache.invalidate_courier(courier_id)
         
         flash(f"Courier '{courier.username}' deleted successfully", "success")
         return redirect(url_for('admin_couriers'))
@@ -1009,6 +1426,7 @@ def admin_regenerate_api_key(courier_id):
         # Regenerate API key
         new_key = courier.regenerate_api_key()
         db.session.commit()
+        api_key_cache.invalidate_courier(courier.id)
         
         flash(f"API key regenerated successfully for '{courier.username}': {new_key}", "success")
         return redirect(url_for('admin_couriers'))
@@ -1019,33 +1437,174 @@ def admin_regenerate_api_key(courier_id):
         flash(f"Error regenerating API key: {str(e)}", "danger")
         return redirect(url_for('admin_couriers'))
 
+@app.route('/admin/cache-stats')
+def admin_cache_stats():
+    """Hit rates and sizes of this worker's in-memory caches"""
+    return jsonify({
+        'api_key_cache': api_key_cache.stats(),
+        'optimization_cache': optimization_cache.stats(),
+        'geocode_cache': geocode_cache.stats()
+    })
+
 @app.route('/admin/routes')
+@query_budget(2)
 def admin_routes():
     """Admin routes management page"""
     try:
-        from models import Route
-        
-        # Get all routes
-        routes = Route.query.order_by(Route.created_at.desc()).all()
+        # First page of route summaries with stop counts; more are fetched from /saved_routes
+        routes, next_cursor = _route_summaries()
         
-        return render_template('admin/routes.html', routes=routes)
+        return render_template('admin/routes.html', routes=routes, next_cursor=next_cursor,
+                               route_count=route_count(db.session))
         
     except Exception as e:
         logging.error(f"Admin routes error: {str(e)}")
         flash(f"Error loading routes: {str(e)}", "danger")
         return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/routes/export')
+def admin_export_routes():
+    """
+    Stream all saved routes created in a date range as NDJSON or a ZIP archive
+
+    Archived routes are included, merged in by id.
+
+    Query parameters: format (ndjson or zip), files (for zip: gpx, csv or
+    both, comma-separated), from and to (inclusive YYYY-MM-DD dates)
+    """
+    try:
+        from models import Route, ArchivedRoute
+        from sqlalchemy.orm import selectinload
+        import datetime
+        import heapq
+        
+        export_format = request.args.get('format', 'ndjson')
+        file_formats = [f for f in request.args.get('files', 'gpx,csv').split(',') if f]
+        if export_format not in ('ndjson', 'zip') or not set(file_formats) <= {'gpx', 'csv'}:
+            return jsonify({"error": "Unsupported export format"}), 400
+        
+        try:
+            start = datetime.datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from') else None
+            end = datetime.datetime.strptime(request.args['to'], '%Y-%m-%d') + datetime.timedelta(days=1) \
+                if request.args.get('to') else None
+        except ValueError:
+            return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
+        
+        def export_query(model):
+            # Rows come from a server-side cursor in bounded batches, each with its
+            # locations loaded in one extra query
+            query = model.query
+            if start:
+                query = query.filter(model.created_at >= start)
+            if end:
+                query = query.filter(model.created_at < end)
+            return query.order_by(model.id).options(
+                selectinload(model.locations)
+            ).yield_per(config.BULK_EXPORT_BATCH_SIZE)
+        
+        routes = heapq.merge(export_query(Route), export_query(ArchivedRoute), key=lambda route: route.id)
+        
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        if export_format == 'zip':
+            body, mimetype, filename = zip_stream(routes, file_formats), 'application/zip', f'routes_{timestamp}.zip'
+        else:
+            body, mimetype, filename = ndjson_stream(routes), 'application/x-ndjson', f'routes_{timestamp}.ndjson'
+        
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        logging.error(f"Admin export routes error: {str(e)}")
+        return jsonify({"error": "Failed to export routes"}), 500
+
+@app.route('/admin/routes/import', methods=['POST'])
+def admin_import_routes():
+    """
+    Import routes from an upstream system as CSV or NDJSON
+    
+    The file is sent as the 'file' upload or as the request body, and read
+    as a stream. Query parameter format (csv or ndjson) defaults to the
+    upload's extension or the body's content type.
+    
+    Returns:
+        Numbers of routes and stops imported, and errors of skipped routes
+    """
+    try:
+        import io
+        
+        upload = request.files.get('file')
+        if upload:
+            stream, default_format = upload.stream, upload.filename.rsplit('.', 1)[-1].lower()
+        else:
+            stream, default_format = request.stream, 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        import_format = request.args.get('format', default_format)
+        if import_format == 'jsonl':
+            import_format = 'ndjson'
+        if import_format not in IMPORT_FORMATS:
+            return jsonify({"error": "Unsupported import format"}), 400
+        
+        result = import_routes(db.session, io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), import_format)
+        errors = result['errors']
+        return jsonify({
+            "success": True,
+            "imported_routes": result['routes'],
+            "imported_stops": result['stops'],
+            "error_count": len(errors),
+            "errors": [{"line": line, "error": message} for line, message in errors[:config.IMPORT_MAX_REPORTED_ERRORS]]
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Admin import routes error: {str(e)}")
+        return jsonify({"error": f"Failed to import routes: {str(e)}"}), 500
+
 @app.route('/admin/assignments')
+@query_budget(3)
 def admin_assignments():
-    """Admin assignments management page"""
+    """
+    Admin assignments management page
+    
+    Assignments are listed newest first, ADMIN_ASSIGNMENTS_PAGE_SIZE at a
+    time; the cursor query parameter is next_cursor of the previous page.
+    """
     try:
         from models import CourierRouteAssignment, Courier, Route
+        from sqlalchemy import and_, or_
+        from sqlalchemy.orm import joinedload
+        
+        # One page of assignments with their courier and route name joined in
+        limit = config.ADMIN_ASSIGNMENTS_PAGE_SIZE
+        query = CourierRouteAssignment.query.options(
+            joinedload(CourierRouteAssignment.courier),
+            joinedload(CourierRouteAssignment.route).load_only(Route.id, Route.name)
+        )
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                assigned_at, assignment_id = _decode_keyset_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                flash("Invalid page of assignments", "danger")
+                return redirect(url_for('admin_assignments'))
+            query = query.filter(or_(
+                CourierRouteAssignment.assigned_at < assigned_at,
+                and_(CourierRouteAssignment.assigned_at == assigned_at, CourierRouteAssignment.id < assignment_id)
+            ))
+        
+        # One extra row tells whether there is a next page
+        page = query.order_by(
+            CourierRouteAssignment.assigned_at.desc(), CourierRouteAssignment.id.desc()
+        ).limit(limit + 1).all()
+        next_cursor = None
+        if len(page) > limit:
+            next_cursor = _encode_keyset_cursor(page[limit - 1].assigned_at, page[limit - 1].id)
         
-        # Get all assignments
         assignments = []
-        for assignment in CourierRouteAssignment.query.order_by(CourierRouteAssignment.assigned_at.desc()).all():
-            courier = Courier.query.get(assignment.courier_id)
-            route = Route.query.get(assignment.route_id)
+        for assignment in page[:limit]:
+            courier = assignment.courier
+            route = assignment.route
             
             if courier and route:
                 courier_name = f"{courier.first_name} {courier.last_name}" if courier.first_name else courier.username
@@ -1063,14 +1622,17 @@ def admin_assignments():
                 }
                 assignments.append(assignment_data)
                 
-        # Get couriers and routes for assignment form
+        # Get couriers and the newest routes for assignment form; the route
+        # select fetches older pages from /saved_routes (saved-routes.js)
         couriers_list = Courier.query.all()
-        routes_list = Route.query.all()
+        routes_list, routes_next_cursor = _route_summaries()
         
         return render_template('admin/assignments.html', 
                               assignments=assignments,
+                              next_cursor=next_cursor,
                               couriers_list=couriers_list,
-                              routes_list=routes_list)
+                              routes_list=routes_list,
+                              routes_next_cursor=routes_next_cursor)
         
     except Exception as e:
         logging.error(f"Admin assignments error: {str(e)}")
@@ -1128,20 +1690,25 @@ def admin_create_assignment():
         return redirect(url_for('admin_assignments'))
 
 @app.route('/admin/assignments/<int:assignment_id>')
+@query_budget(2)
 def admin_view_assignment(assignment_id):
     """View assignment details"""
     try:
         from models import CourierRouteAssignment, Courier, Route, Location
         
-        # Get assignment
-        assignment = CourierRouteAssignment.query.get(assignment_id)
+        from sqlalchemy.orm import joinedload
+        
+        # Get assignment with its courier and route
+        assignment = CourierRouteAssignment.query.options(
+            joinedload(CourierRouteAssignment.courier), joinedload(CourierRouteAssignment.route)
+        ).filter_by(id=assignment_id).first()
         if not assignment:
             flash("Assignment not found", "danger")
             return redirect(url_for('admin_assignments'))
             
         # Get courier and route
-        courier = Courier.query.get(assignment.courier_id)
-        route = Route.query.get(assignment.route_id)
+        courier = assignment.courier
+        route = assignment.route
         
         if not courier or not route:
             flash("Assignment data incomplete", "danger")
@@ -1202,10 +1769,11 @@ def admin_cancel_assignment(assignment_id):
         return redirect(url_for('admin_assignments'))
 
 @app.route('/admin/courier/<int:courier_id>/routes')
+@query_budget(2)
 def admin_courier_routes(courier_id):
     """View routes assigned to a courier"""
     try:
-        from models import Courier, CourierRouteAssignment, Route
+        from models import Courier, CourierRouteAssignment, Route, Location
         
         # Get courier
         courier = Courier.query.get(courier_id)
@@ -1213,17 +1781,24 @@ def admin_courier_routes(courier_id):
             flash("Courier not found", "danger")
             return redirect(url_for('admin_couriers'))
             
-        # Get assignments
+        from sqlalchemy import func, select
+        
+        # Get assignments with their route and stop count in one query
+        stop_count = select(func.count(Location.id)).where(
+            Location.route_id == Route.id
+        ).correlate(Route).scalar_subquery()
         assignments = []
-        for assignment in CourierRouteAssignment.query.filter_by(courier_id=courier_id).order_by(CourierRouteAssignment.assigned_at.desc()).all():
-            route = Route.query.get(assignment.route_id)
-            
+        for assignment, route, stops in db.session.query(CourierRouteAssignment, Route, stop_count).join(
+            Route, Route.id == CourierRouteAssignment.route_id
+        ).filter(
+            CourierRouteAssignment.courier_id == courier_id
+        ).order_by(CourierRouteAssignment.assigned_at.desc()).all():
             if route:
                 assignment_data = {
                     'id': assignment.id,
                     'route_id': route.id,
                     'route_name': route.name or f'Route {route.id}',
-                    'stops': len(route.locations),
+                    'stops': stops,
                     'total_distance': route.total_distance,
                     'total_time': route.total_time,
                     'status': assignment.status,
@@ -1240,10 +1815,30 @@ def admin_courier_routes(courier_id):
         flash(f"Error loading courier routes: {str(e)}", "danger")
         return redirect(url_for('admin_couriers'))
 
+@app.cli.command('archive-routes')
+@click.option('--older-than-days', type=int, default=None,
+              help="Archive routes finished this many days ago; defaults to ARCHIVE_COMPLETED_AFTER_DAYS")
+@click.option('--batch-size', type=int, default=None, help="Routes moved per transaction")
+@click.option('--max-batches', type=int, default=None, help="Stop after this many batches")
+def archive_routes_command(older_than_days, batch_size, max_batches):
+    """Move routes whose assignments all finished long ago to the archive tables"""
+    totals = archive_completed_routes(db.session, older_than_days, batch_size, max_batches)
+    click.echo(f"Archived {totals['routes']} routes, {totals['locations']} locations and "
+               f"{totals['assignments']} assignments in {totals['batches']} batches")
+
+@app.cli.command('expire-update-receipts')
+@click.option('--retention-hours', type=int, default=None,
+              help="Keep keys this many hours; defaults to IDEMPOTENCY_KEY_RETENTION_HOURS")
+def expire_update_receipts_command(retention_hours):
+    """Forget the idempotency keys of location updates applied long ago"""
+    click.echo(f"Deleted {expire_location_update_receipts(retention_hours)} idempotency keys")
+
 # Create database tables
 with app.app_context():
     import models  # noqa: F401
     db.create_all()
+    run_migrations(db)
+    install_query_budget(app, db.engine)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
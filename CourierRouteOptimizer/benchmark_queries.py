@@ -0,0 +1,163 @@
+"""
+Seed a database with realistic volumes and measure the database-backed endpoints
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmark_queries.py [--locations 1000000]
+
+Seeding is skipped when the database already has routes, so the seeded data
+can be reused between runs (e.g. before and after a migration). For each
+endpoint the script prints the number of queries, its latencies and
+the query plan of every statement the endpoint ran.
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+from unittest import mock
+
+import app as courier_app
+from app import app, db
+from analytics_rollups import rebuild_rollups
+from geometry import pack_coordinates
+from models import Courier, Route, Location, CourierRouteAssignment
+from sqlalchemy import event, insert
+
+CATEGORIES = ['home', 'home', 'home', 'office', 'business', 'pickup_point', 'other']
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def seed(locations, stops_per_route, couriers, batch_size=10000):
+    """Insert couriers, routes with their locations, and one assignment per route"""
+    random.seed(42)
+    route_count = locations // stops_per_route
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+
+    db.session.execute(insert(Courier.__table__), [{
+        'username': f'courier{i}', 'email': f'courier{i}@example.com', 'password_hash': '-',
+        'api_key': f'bench-key-{i}', 'created_at': start
+    } for i in range(couriers)])
+    courier_ids = [row.id for row in db.session.query(Courier.id)]
+
+    def routes():
+        for i in range(route_count):
+            coords = [[round(random.uniform(16.8, 17.2), 6), round(random.uniform(48.0, 48.3), 6)]
+                      for _ in range(stops_per_route)]
+            yield {
+                'id': i + 1, 'name': f'Route {i + 1}',
+                'created_at': start + datetime.timedelta(days=365 * i / route_count),
+                'total_distance': round(random.uniform(5, 80), 1), 'total_time': '1h 30m',
+                'coordinates_json': json.dumps(coords), 'coordinates_blob': pack_coordinates(coords)
+            }
+
+    for batch in _batches(routes(), batch_size // stops_per_route or 1):
+        db.session.execute(insert(Route.__table__), batch)
+        location_rows = []
+        for route in batch:
+            completed = random.random() < 0.7
+            for position, (lon, lat) in enumerate(json.loads(route['coordinates_json'])):
+                location_rows.append({
+                    'route_id': route['id'], 'city': 'Bratislava', 'street': f'Street {position}',
+                    'position': position, 'longitude': lon, 'latitude': lat,
+                    'category': random.choice(CATEGORIES), 'estimated_duration': 10,
+                    'status': ('completed' if random.random() < 0.95 else 'failed') if completed else 'pending',
+                    'completed_at': route['created_at'] + datetime.timedelta(hours=2) if completed else None
+                })
+        db.session.execute(insert(Location.__table__), location_rows)
+        db.session.execute(insert(CourierRouteAssignment.__table__), [{
+            'courier_id': random.choice(courier_ids), 'route_id': route['id'],
+            'assigned_at': route['created_at'], 'status': random.choice(['assigned', 'in_progress', 'completed', 'completed']),
+        } for route in batch])
+        db.session.commit()
+        print(f"  seeded {batch[-1]['id']}/{route_count} routes", end='\r', flush=True)
+    print()
+
+    with db.engine.begin() as connection:
+        rebuild_rollups(connection)
+
+def _explain(connection, statement, parameters):
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+    return [row[0] for row in rows]
+
+def benchmark(client, name, url, headers=None, repeat=5):
+    """Time an endpoint and print the plans of the statements it runs"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        started = time.perf_counter()
+        status = client.get(url, headers=headers).status_code
+        first = (time.perf_counter() - started) * 1000
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(url, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # The first request is cold; later ones may be served from the response cache
+    print(f"\n{name}: {url} -> {status}, {len(statements)} queries, first {first:.1f} ms, "
+          f"then median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms")
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            print('  ' + ' '.join(statement.split())[:160])
+            for line in _explain(connection, statement, parameters):
+                print('      ' + line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--locations', type=int, default=1000000)
+    parser.add_argument('--stops-per-route', type=int, default=20)
+    parser.add_argument('--couriers', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not db.session.query(Route.id).first():
+            print(f"Seeding {args.locations} locations...")
+            seed(args.locations, args.stops_per_route, args.couriers)
+
+        courier = db.session.query(Courier).first()
+        assignment = db.session.query(CourierRouteAssignment).filter_by(courier_id=courier.id).first()
+        headers = {'X-API-Key': courier.api_key}
+
+    endpoints = [
+        ('Saved routes', '/', None),
+        ('Analytics', '/analytics/data', None),
+        ('API routes page', '/api/routes', headers),
+        ('API routes page, no geometry', '/api/routes?fields=id,name,total_distance', headers),
+        ('API active routes', '/api/routes?status=assigned,in_progress', headers),
+        ('API route details', f'/api/routes/{assignment.route_id}', headers),
+        ('Admin dashboard', '/admin', None),
+        ('Admin couriers', '/admin/couriers', None),
+        ('Admin routes', '/admin/routes', None),
+        ('Admin assignments', '/admin/assignments', None),
+        ('Admin assignment', f'/admin/assignments/{assignment.id}', None),
+        ('Admin courier routes', f'/admin/courier/{courier.id}/routes', None),
+    ]
+
+    # Only the database work is measured, not template rendering
+    with app.app_context(), mock.patch.object(courier_app, 'render_template', lambda *args, **kwargs: ''):
+        client = app.test_client()
+        for name, url, endpoint_headers in endpoints:
+            benchmark(client, name, url, endpoint_headers, args.repeat)
+
+if __name__ == '__main__':
+    main()
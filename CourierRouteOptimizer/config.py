@@ -8,6 +8,129 @@ OPENROUTE_GEOCODE_URL = "https://api.openrouteservice.org/geocode/search"
 OPENROUTE_DIRECTIONS_URL = "https://api.openrouteservice.org/v2/directions/driving-car"
 OPENROUTE_MATRIX_URL = "https://api.openrouteservice.org/v2/matrix/driving-car"
 
+# Async HTTP client settings (pooled connections shared by the *_async providers)
+ASYNC_HTTP_TIMEOUT = float(os.environ.get("ASYNC_HTTP_TIMEOUT", "15"))
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.environ.get("ASYNC_HTTP_MAX_CONNECTIONS", "200"))
+ASYNC_HTTP_MAX_KEEPALIVE = int(os.environ.get("ASYNC_HTTP_MAX_KEEPALIVE", "50"))
+# Maximum number of route legs requested from the Directions API at once
+ASYNC_DIRECTIONS_CONCURRENCY = int(os.environ.get("ASYNC_DIRECTIONS_CONCURRENCY", "8"))
+
+# Background traffic refresh: seconds between refresh passes, and how long a
+# route stays tracked after its last poll
+TRAFFIC_REFRESH_INTERVAL = int(os.environ.get("TRAFFIC_REFRESH_INTERVAL", "120"))
+TRAFFIC_ROUTE_IDLE_TIMEOUT = int(os.environ.get("TRAFFIC_ROUTE_IDLE_TIMEOUT", "600"))
+
+# Seconds between keep-alive comments on the traffic event stream
+SSE_KEEPALIVE_SECONDS = 25
+
+# Each open traffic event stream holds a worker thread (gunicorn gthread, see
+# render.yaml). At most SSE_MAX_STREAMS are served per process, leaving the
+# other threads to regular requests; clients over the limit are told to poll
+# /get_route instead. Streams end after SSE_STREAM_MAX_SECONDS and EventSource
+# reconnects, so the slots of clients that went away are freed.
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", "32"))
+SSE_STREAM_MAX_SECONDS = int(os.environ.get("SSE_STREAM_MAX_SECONDS", "600"))
+
+# Seed for the per-segment variation of the traffic model (unset = no variation)
+TRAFFIC_MODEL_SEED = int(os.environ["TRAFFIC_MODEL_SEED"]) if os.environ.get("TRAFFIC_MODEL_SEED") else None
+
+# Time-dependent travel-time matrices used for departure-aware optimization
+TD_MATRIX_SLOT_MINUTES = 15
+TD_MATRIX_HORIZON_HOURS = 12
+
+# Routes with up to this many points are optimized by trying every ordering
+# (n! route evaluations); longer ones use nearest neighbour
+OPTIMIZE_EXHAUSTIVE_MAX_STOPS = 8
+
+# Server-side store for optimized routes; the session only holds the route id.
+# "sqlite" is shared by all workers on a host, "memory" only suits a single worker.
+ROUTE_STORE_BACKEND = os.environ.get("ROUTE_STORE_BACKEND", "sqlite")
+ROUTE_STORE_PATH = os.environ.get("ROUTE_STORE_PATH", "")
+ROUTE_STORE_MAX_ROUTES = int(os.environ.get("ROUTE_STORE_MAX_ROUTES", "10000"))
+ROUTE_STORE_TTL = int(os.environ.get("ROUTE_STORE_TTL", str(7 * 24 * 3600)))
+
+# Precision (5 or 6 decimal places) of encoded-polyline segment geometries
+POLYLINE_PRECISION = int(os.environ.get("POLYLINE_PRECISION", "5"))
+
+# Zoom levels with precomputed simplified segment geometries; clients zoomed in
+# further get the full geometry. The tolerance is a fraction of a map pixel.
+GEOMETRY_SIMPLIFY_ZOOMS = (8, 10, 12, 14)
+GEOMETRY_SIMPLIFY_PIXELS = float(os.environ.get("GEOMETRY_SIMPLIFY_PIXELS", "0.5"))
+
+# Cached JSON response bodies (per route version) and their compression.
+# Brotli is used when the optional brotli package is installed.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_COMPRESS_MIN_BYTES = 1024
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 5
+
+# Cache of complete /optimize results (geocoding, solve and directions) keyed by
+# the stop list, exact start location and options. Traffic-aware results are
+# only reused within the same time bucket. Weather isn't cached.
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "500"))
+RESULT_CACHE_TRAFFIC_BUCKET_MINUTES = 15
+
+# Geocoding results by address, shared by the optimizer and route imports
+GEOCODE_CACHE_MAX_ENTRIES = int(os.environ.get("GEOCODE_CACHE_MAX_ENTRIES", "20000"))
+GEOCODE_CONCURRENCY = int(os.environ.get("GEOCODE_CONCURRENCY", "8"))
+
+# Bulk route imports: stops inserted per batch (and transaction)
+IMPORT_BATCH_STOPS = int(os.environ.get("IMPORT_BATCH_STOPS", "2000"))
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+# Number of track points written per chunk of streamed GPX/KML/GeoJSON exports
+EXPORT_CHUNK_POINTS = 500
+
+# Routes fetched per database round trip by the bulk route export
+BULK_EXPORT_BATCH_SIZE = int(os.environ.get("BULK_EXPORT_BATCH_SIZE", "500"))
+
+# Columnar, memory-mappable archive of saved routes (stops, leg timings and
+# geometries), one directory per month. Off unless ROUTE_ARCHIVE_DIR is set;
+# use an absolute path on persistent storage. Routes that fail to archive
+# are logged and still saved to the database.
+ROUTE_ARCHIVE_DIR = os.environ.get("ROUTE_ARCHIVE_DIR", "")
+ROUTE_ARCHIVE_ENABLED = bool(ROUTE_ARCHIVE_DIR) and \
+    os.environ.get("ROUTE_ARCHIVE_ENABLED", "true").lower() == "true"
+
+# Saved routes per page of the index and admin route lists, and of /saved_routes
+SAVED_ROUTES_PAGE_SIZE = 20
+SAVED_ROUTES_MAX_PAGE_SIZE = 100
+
+# Assignments per page of the admin assignments list
+ADMIN_ASSIGNMENTS_PAGE_SIZE = 50
+
+# Routes per page of the mobile /api/routes endpoint (limit= may ask for up to the maximum)
+API_ROUTES_PAGE_SIZE = 50
+API_ROUTES_MAX_PAGE_SIZE = 200
+
+# Cache of API key -> courier lookups done by every mobile API request
+API_KEY_CACHE_MAX_ENTRIES = int(os.environ.get("API_KEY_CACHE_MAX_ENTRIES", "10000"))
+API_KEY_CACHE_TTL = int(os.environ.get("API_KEY_CACHE_TTL", "60"))  # seconds
+
+# Batch location updates from the mobile app: items per request, and how long
+# idempotency keys are remembered so replayed updates are not applied twice
+# (older keys are deleted by `flask expire-update-receipts`, run periodically)
+API_BATCH_UPDATE_MAX_ITEMS = 500
+IDEMPOTENCY_KEY_RETENTION_HOURS = 72
+
+# Mobile change feed (/api/sync). Each poll re-reads changes from slightly
+# before its cursor, so writes whose transaction committed late aren't
+# missed; clients skip repeats by version. Feeds with more changes than the
+# maximum, or cursors older than the tombstone retention, ask for a full sync.
+SYNC_CURSOR_OVERLAP_SECONDS = 5
+SYNC_MAX_CHANGES = 1000
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+# Archival of finished routes: routes whose assignments were all completed or
+# canceled more than this many days ago move, with their locations and
+# assignments, to the archive tables; keep it above the admin dashboard's
+# 7-day delivery chart. Run with `flask --app app archive-routes`.
+ARCHIVE_COMPLETED_AFTER_DAYS = int(os.environ.get("ARCHIVE_COMPLETED_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_ROUTES = 500
+
+# Fail requests that exceed their view's query budget instead of logging a warning
+QUERY_BUDGET_ENFORCE = os.environ.get("QUERY_BUDGET_ENFORCE", "false").lower() == "true"
+
 # Maximum number of locations the form can handle
 MAX_LOCATIONS = 15
 
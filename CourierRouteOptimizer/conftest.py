@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pytest
+
+# The app reads its database URL when imported, and uses the models and
+# helpers kept in the repository root
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['ROUTE_ARCHIVE_ENABLED'] = 'false'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as courier_app  # noqa: E402
+from auth_cache import api_key_cache  # noqa: E402
+from result_cache import optimization_cache, geocode_cache  # noqa: E402
+
+@pytest.fixture
+def app():
+    """The database app with empty tables and caches"""
+    courier_app.app.testing = True
+    with courier_app.app.app_context():
+        courier_app.db.drop_all()
+        courier_app.db.create_all()
+        api_key_cache.clear()
+        optimization_cache.clear()
+        geocode_cache.clear()
+        yield courier_app.app
+        courier_app.db.session.remove()
+
+@pytest.fixture
+def db(app):
+    return courier_app.db
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def rendered():
+    """
+    Render nothing and record (template, context) of each render_template call
+
+    The admin templates aren't part of this tree, and the tests only look at
+    what views compute.
+    """
+    calls = []
+
+    def render_template(template, **context):
+        calls.append((template, context))
+        return ''
+
+    with mock.patch.object(courier_app, 'render_template', render_template):
+        yield calls
@@ -0,0 +1,114 @@
+import datetime
+
+import pytest
+
+import config
+from query_counter import QueryCounter
+
+ADMIN_PAGES = [
+    '/admin',
+    '/admin/couriers',
+    '/admin/assignments',
+    '/admin/assignments/{assignment_id}',
+    '/admin/courier/{courier_id}/routes',
+]
+
+STATUSES = ['assigned', 'in_progress', 'completed', 'canceled']
+
+def seed(db, scale):
+    """Couriers, routes with stops and assignments, all growing with scale"""
+    from models import Courier, Route, Location, CourierRouteAssignment
+
+    now = datetime.datetime.utcnow()
+    couriers = [Courier(username=f'courier{i}', email=f'courier{i}@example.com', password_hash='-')
+                for i in range(2 * scale)]
+    db.session.add_all(couriers)
+    for i in range(3 * scale):
+        route = Route(name=f'Route {i}', total_distance=10.0, total_time='1h', coordinates=[[17.1, 48.1], [17.2, 48.2]])
+        route.locations = [
+            Location(city='Bratislava', street=f'Street {position}', position=position, category='home',
+                     status='completed', completed_at=now - datetime.timedelta(days=position))
+            for position in range(3)
+        ]
+        db.session.add(route)
+        # Every route is also assigned to the first courier, so its page grows too
+        for courier in {couriers[0], couriers[i % len(couriers)]}:
+            db.session.add(CourierRouteAssignment(courier=courier, route=route, status=STATUSES[i % len(STATUSES)],
+                                                  assigned_at=now - datetime.timedelta(hours=i)))
+    db.session.commit()
+    return couriers[0].id, CourierRouteAssignment.query.first().id
+
+def page_query_counts(client, db, scale):
+    """Seed a fresh database and count the statements each admin page runs"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    courier_id, assignment_id = seed(db, scale)
+    db.session.remove()
+
+    counts = {}
+    for page in ADMIN_PAGES:
+        url = page.format(courier_id=courier_id, assignment_id=assignment_id)
+        with QueryCounter(db.engine) as counter:
+            response = client.get(url)
+        # The views redirect on errors, which would hide missing queries
+        assert response.status_code == 200, url
+        counts[page] = counter.count
+    return counts
+
+def test_admin_pages_run_constant_queries(client, db, rendered, monkeypatch):
+    # Over-budget requests fail instead of only being logged
+    monkeypatch.setattr(config, 'QUERY_BUDGET_ENFORCE', True)
+
+    small = page_query_counts(client, db, 3)
+    large = page_query_counts(client, db, 30)
+    assert small == large
+
+@pytest.mark.parametrize('page', ADMIN_PAGES)
+def test_admin_pages_render(client, db, rendered, page):
+    courier_id, assignment_id = seed(db, 2)
+    response = client.get(page.format(courier_id=courier_id, assignment_id=assignment_id))
+    assert response.status_code == 200
+    assert rendered[-1][0].startswith('admin/')
+
+def test_assignment_form_lists_one_page_of_routes(client, db, rendered, monkeypatch):
+    monkeypatch.setattr(config, 'SAVED_ROUTES_PAGE_SIZE', 5)
+    seed(db, 4)
+
+    assert client.get('/admin/assignments').status_code == 200
+    context = rendered[-1][1]
+    assert len(context['routes_list']) == 5
+    assert 'coordinates_json' not in context['routes_list'][0]
+
+    # The select fetches the rest from /saved_routes
+    response = client.get(f"/saved_routes?cursor={context['routes_next_cursor']}")
+    ids = [route['id'] for route in context['routes_list']] + [route['id'] for route in response.get_json()['routes']]
+    assert len(set(ids)) == 10
+
+def test_assignments_are_paged_without_route_coordinates(client, db, rendered, monkeypatch):
+    from models import CourierRouteAssignment
+
+    monkeypatch.setattr(config, 'ADMIN_ASSIGNMENTS_PAGE_SIZE', 7)
+    seed(db, 4)
+    total = CourierRouteAssignment.query.count()
+
+    ids, cursor, pages = [], None, 0
+    while True:
+        with QueryCounter(db.engine) as counter:
+            assert client.get('/admin/assignments' + (f'?cursor={cursor}' if cursor else '')).status_code == 200
+        context = rendered[-1][1]
+        ids += [assignment['id'] for assignment in context['assignments']]
+        assert len(context['assignments']) <= 7
+        assert not any('coordinates_blob' in statement for statement in counter.statements)
+        pages += 1
+        cursor = context['next_cursor']
+        if cursor is None:
+            break
+
+    assert sorted(ids) == sorted(set(ids)) and len(ids) == total
+    assert pages == -(-total // 7)
+
+def test_assignments_with_a_bad_cursor_go_back_to_the_first_page(client, db, rendered):
+    response = client.get('/admin/assignments?cursor=not-a-cursor')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/assignments')
@@ -0,0 +1,43 @@
+from auth_cache import api_key_cache
+from query_counter import QueryCounter
+
+def add_courier(db):
+    from models import Courier
+
+    courier = Courier(username='courier', email='courier@example.com', first_name='Ana')
+    courier.set_password('secret')
+    db.session.add(courier)
+    db.session.commit()
+    return courier
+
+def test_cache_keeps_no_credentials(client, db):
+    courier = add_courier(db)
+    assert client.get('/api/profile', headers={'X-API-Key': courier.api_key}).status_code == 200
+
+    values = api_key_cache.get(courier.api_key)
+    assert values['id'] == courier.id
+    assert 'password_hash' not in values
+
+def test_cached_courier_is_served_without_querying(client, db):
+    from models import Courier
+
+    courier = add_courier(db)
+    api_key, courier_id = courier.api_key, courier.id
+    client.get('/api/profile', headers={'X-API-Key': api_key})
+    db.session.remove()
+
+    with QueryCounter(db.engine) as counter:
+        cached = api_key_cache.courier(db.session, Courier, api_key)
+        assert (cached.id, cached.username, cached.first_name) == (courier_id, 'courier', 'Ana')
+    assert counter.count == 0
+
+    # Columns that aren't cached are loaded when needed
+    assert cached.check_password('secret')
+
+def test_regenerated_key_stops_working(client, db):
+    courier = add_courier(db)
+    old_key = courier.api_key
+    assert client.get('/api/profile', headers={'X-API-Key': old_key}).status_code == 200
+
+    assert client.get(f'/admin/couriers/{courier.id}/regenerate-api-key').status_code == 302
+    assert client.get('/api/profile', headers={'X-API-Key': old_key}).status_code == 401
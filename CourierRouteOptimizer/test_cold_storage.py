@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from cold_storage import archivable_route_ids, archive_completed_routes
+
+NOW = datetime.datetime.utcnow()
+OLD = NOW - datetime.timedelta(days=200)
+CUTOFF = NOW - datetime.timedelta(days=90)
+
+@pytest.fixture
+def courier(db):
+    from models import Courier
+
+    courier = Courier(username='courier', email='courier@example.com', password_hash='-')
+    db.session.add(courier)
+    db.session.commit()
+    return courier
+
+def add_route(db, courier, *assignments):
+    """Route with one stop and (status, assigned_at, completed_at) assignments"""
+    from models import Route, Location, CourierRouteAssignment
+
+    route = Route(total_distance=5.0, total_time='1h', coordinates=[[17.1, 48.1]])
+    route.locations = [Location(city='Bratislava', street='Main', position=0)]
+    db.session.add(route)
+    for status, assigned_at, completed_at in assignments:
+        db.session.add(CourierRouteAssignment(courier=courier, route=route, status=status,
+                                              assigned_at=assigned_at, completed_at=completed_at))
+    db.session.commit()
+    return route.id
+
+def test_only_routes_with_all_assignments_finished_before_cutoff(db, courier):
+    completed = add_route(db, courier, ('completed', OLD, OLD))
+    canceled_without_time = add_route(db, courier, ('canceled', OLD, None))
+    add_route(db, courier, ('completed', OLD, OLD), ('in_progress', OLD, None))
+    add_route(db, courier, ('completed', OLD, NOW))
+    add_route(db, courier, ('completed', OLD, OLD), ('completed', NOW, NOW))
+    add_route(db, courier)
+    # The highest id is kept so SQLite can't reuse it
+    add_route(db, courier, ('completed', OLD, OLD))
+
+    assert archivable_route_ids(db.session, CUTOFF, 100) == [completed, canceled_without_time]
+    assert archivable_route_ids(db.session, CUTOFF, 1) == [completed]
+
+def test_archive_moves_rows_in_batches(db, courier):
+    from models import Route, Location, CourierRouteAssignment, ArchivedRoute, ArchivedLocation, ArchivedAssignment
+
+    archived = [add_route(db, courier, ('completed', OLD, OLD)) for _ in range(3)]
+    kept = add_route(db, courier, ('completed', OLD, OLD))
+
+    totals = archive_completed_routes(db.session, older_than_days=90, batch_size=2)
+
+    assert totals == {'batches': 2, 'routes': 3, 'locations': 3, 'assignments': 3}
+    assert [route.id for route in Route.query] == [kept]
+    assert Location.query.count() == CourierRouteAssignment.query.count() == 1
+    assert sorted(route.id for route in ArchivedRoute.query) == archived
+    assert ArchivedLocation.query.count() == ArchivedAssignment.query.count() == 3
+    assert db.session.get(ArchivedRoute, archived[0]).to_dict()['locations'][0]['address']['street'] == 'Main'
+
+def test_max_batches_stops_early(db, courier):
+    for _ in range(3):
+        add_route(db, courier, ('completed', OLD, OLD))
+    add_route(db, courier)
+
+    assert archive_completed_routes(db.session, older_than_days=90, batch_size=1, max_batches=2)['routes'] == 2
+    assert archive_completed_routes(db.session, older_than_days=90, batch_size=1)['routes'] == 1
+
+def test_sync_reports_archived_routes_as_deleted(client, db, courier):
+    archived = add_route(db, courier, ('completed', OLD, OLD))
+    add_route(db, courier, ('assigned', NOW, None))
+    headers = {'X-API-Key': courier.api_key}
+    cursor = client.get('/api/sync', headers=headers).get_json()['cursor']
+
+    archive_completed_routes(db.session, older_than_days=90)
+
+    changes = client.get(f'/api/sync?cursor={cursor}', headers=headers).get_json()
+    assert changes['deleted_routes'] == [archived]
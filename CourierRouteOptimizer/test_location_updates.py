@@ -0,0 +1,106 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+import app as courier_app
+
+@pytest.fixture
+def setup(db):
+    """A courier with an assigned two-stop route, and a stop on someone else's route"""
+    from models import Courier, Route, Location, CourierRouteAssignment
+
+    courier, other = (Courier(username=name, email=f'{name}@example.com', password_hash='-') for name in ('a', 'b'))
+    routes = []
+    for owner in (courier, other):
+        route = Route(total_distance=5.0, total_time='1h', coordinates=[[17.1, 48.1], [17.2, 48.2]])
+        route.locations = [Location(city='Bratislava', street='Main', position=i) for i in range(2)]
+        db.session.add(CourierRouteAssignment(courier=owner, route=route))
+        routes.append(route)
+    db.session.commit()
+    stops = [location.id for location in routes[0].locations]
+    return {'headers': {'X-API-Key': courier.api_key}, 'courier_id': courier.id,
+            'stops': stops, 'foreign_stop': routes[1].locations[0].id}
+
+def post(client, setup, *updates):
+    response = client.post('/api/locations/update', headers=setup['headers'], json={'updates': list(updates)})
+    assert response.status_code == 200
+    return [result['status'] for result in response.get_json()['results']]
+
+def location(db, location_id):
+    from models import Location
+    db.session.expire_all()
+    return db.session.get(Location, location_id)
+
+def test_replayed_keys_are_duplicates(client, db, setup):
+    stop = setup['stops'][0]
+    update = {'location_id': stop, 'status': 'completed', 'idempotency_key': 'k1'}
+
+    assert post(client, setup, update) == ['applied']
+    assert post(client, setup, update, dict(update, idempotency_key='k2', status='failed')) == ['duplicate', 'applied']
+    assert location(db, stop).status == 'failed'
+
+def test_updates_apply_in_client_timestamp_order(client, db, setup):
+    stop = setup['stops'][0]
+    statuses = post(client, setup,
+                    {'location_id': stop, 'status': 'failed', 'client_timestamp': '2024-05-01T10:05:00Z'},
+                    {'location_id': stop, 'status': 'completed', 'client_timestamp': '2024-05-01T10:00:00Z'})
+
+    assert statuses == ['applied', 'applied']
+    assert location(db, stop).status == 'failed'
+
+def test_invalid_and_foreign_updates_are_errors(client, db, setup):
+    statuses = post(client, setup,
+                    {'location_id': setup['foreign_stop'], 'status': 'completed'},
+                    {'location_id': setup['stops'][0], 'status': 'lost'},
+                    {'status': 'completed'},
+                    {'location_id': setup['stops'][1], 'status': 'completed'})
+
+    assert statuses == ['error', 'error', 'error', 'applied']
+    assert location(db, setup['foreign_stop']).status == 'pending'
+
+def test_key_stored_by_a_concurrent_batch_is_a_duplicate(client, db, setup, monkeypatch):
+    from models import LocationUpdateReceipt
+
+    apply_updates = courier_app._apply_location_updates
+    calls = []
+
+    def racing_apply(courier_id, updates, now):
+        calls.append(courier_id)
+        if len(calls) == 1:
+            # Another request stores the key between our lookup and our insert
+            with db.engine.begin() as connection:
+                connection.execute(insert(LocationUpdateReceipt), {
+                    'courier_id': courier_id, 'idempotency_key': 'k1',
+                    'location_id': setup['stops'][0], 'processed_at': datetime.datetime.utcnow()
+                })
+            raise IntegrityError('INSERT INTO location_update_receipt', {}, Exception('UNIQUE constraint failed'))
+        return apply_updates(courier_id, updates, now)
+
+    monkeypatch.setattr(courier_app, '_apply_location_updates', racing_apply)
+    statuses = post(client, setup,
+                    {'location_id': setup['stops'][0], 'status': 'completed', 'idempotency_key': 'k1'},
+                    {'location_id': setup['stops'][1], 'status': 'completed', 'idempotency_key': 'k2'})
+
+    assert statuses == ['duplicate', 'applied']
+    assert len(calls) == 2
+
+def test_completed_at_is_server_time(client, db, setup):
+    stop = setup['stops'][0]
+    before = datetime.datetime.utcnow()
+    post(client, setup, {'location_id': stop, 'status': 'completed', 'client_timestamp': '2024-05-01T10:00:00Z'})
+
+    assert location(db, stop).completed_at >= before
+
+def test_expire_keeps_recent_keys(client, db, setup):
+    from models import LocationUpdateReceipt
+
+    post(client, setup, {'location_id': setup['stops'][0], 'status': 'completed', 'idempotency_key': 'new'})
+    db.session.add(LocationUpdateReceipt(courier_id=setup['courier_id'], idempotency_key='old',
+                                         location_id=setup['stops'][1],
+                                         processed_at=datetime.datetime.utcnow() - datetime.timedelta(hours=100)))
+    db.session.commit()
+
+    assert courier_app.expire_location_update_receipts(retention_hours=72) == 1
+    assert [receipt.idempotency_key for receipt in LocationUpdateReceipt.query] == ['new']
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from app import db as app_db
+
+# The tables as they were before any migration
+BASELINE_SCHEMA = [
+    'CREATE TABLE courier (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(256) NOT NULL, first_name VARCHAR(80), '
+    'last_name VARCHAR(80), phone VARCHAR(20), created_at DATETIME, api_key VARCHAR(64) UNIQUE)',
+    'CREATE TABLE route (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, created_at DATETIME, '
+    'total_distance FLOAT, total_time VARCHAR(50), coordinates_json TEXT)',
+    'CREATE TABLE location (id INTEGER PRIMARY KEY, route_id INTEGER NOT NULL REFERENCES route (id), '
+    'city VARCHAR(100), street VARCHAR(100), number VARCHAR(20), position INTEGER, '
+    'formatted_address VARCHAR(255), longitude FLOAT, latitude FLOAT, category VARCHAR(50), '
+    'time_window_start TIME, time_window_end TIME, estimated_duration INTEGER, '
+    'status VARCHAR(20), delivery_notes TEXT, completed_at DATETIME)',
+    'CREATE TABLE courier_route_assignment (id INTEGER PRIMARY KEY, '
+    'courier_id INTEGER NOT NULL REFERENCES courier (id), route_id INTEGER NOT NULL REFERENCES route (id), '
+    'assigned_at DATETIME, status VARCHAR(20), started_at DATETIME, completed_at DATETIME)',
+]
+
+@pytest.fixture
+def baseline(tmp_path):
+    """A database created before any migration, holding one route"""
+    engine = create_engine('sqlite:///' + str(tmp_path / 'baseline.db'))
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO route (id, name, created_at, coordinates_json) "
+            "VALUES (1, 'Old', '2024-01-01 08:00:00', '[[19.9, 50.0], [20.0, 50.1]]')"
+        ))
+    # What the app does at startup
+    app_db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def applied(engine):
+    with engine.connect() as connection:
+        return [row[0] for row in connection.execute(text('SELECT name FROM schema_migrations ORDER BY name'))]
+
+def test_upgrades_baseline_database(baseline):
+    migrations.run_migrations(SimpleNamespace(engine=baseline))
+
+    assert applied(baseline) == [name for name, _ in migrations.MIGRATIONS]
+    inspector = inspect(baseline)
+    for table in ('route', 'location', 'courier_route_assignment'):
+        assert {'updated_at', 'version'} <= {c['name'] for c in inspector.get_columns(table)}
+    assert {'ix_location_route_position', 'ix_location_route_updated_at'} <= {
+        index['name'] for index in inspector.get_indexes('location')
+    }
+    assert {'ix_assignment_courier_assigned_at', 'ix_assignment_courier_updated_at'} <= {
+        index['name'] for index in inspector.get_indexes('courier_route_assignment')
+    }
+    with baseline.connect() as connection:
+        row = connection.execute(text('SELECT coordinates_blob, version FROM route WHERE id = 1')).first()
+    assert row.coordinates_blob is not None
+    assert row.version == 1
+
+def test_failed_migration_stops_startup(baseline, monkeypatch):
+    def broken(connection):
+        raise ValueError('boom')
+
+    ran = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        ('0001_route_coordinates_blob', migrations._route_coordinates_blob),
+        ('0002_broken', broken),
+        ('0003_later', lambda connection: ran.append(True)),
+    ])
+
+    with pytest.raises(RuntimeError):
+        migrations.run_migrations(SimpleNamespace(engine=baseline))
+
+    assert applied(baseline) == ['0001_route_coordinates_blob']
+    assert ran == []
+
+    # Nothing is left pending once the migration is fixed
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        ('0001_route_coordinates_blob', migrations._route_coordinates_blob),
+        ('0002_broken', lambda connection: None),
+        ('0003_later', lambda connection: ran.append(True)),
+    ])
+    migrations.run_migrations(SimpleNamespace(engine=baseline))
+    assert applied(baseline) == ['0001_route_coordinates_blob', '0002_broken', '0003_later']
+    assert ran == [True]
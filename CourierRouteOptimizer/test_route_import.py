@@ -0,0 +1,89 @@
+import io
+import json
+
+import pytest
+
+import config
+import route_import
+from route_import import import_routes, read_csv, read_ndjson
+
+CSV = '''route,address,street,number,city,latitude,longitude,category
+Morning,,Obchodná,1,Bratislava,48.1,17.1,office
+Morning,"Hlavná 5, Košice",,,,48.7,21.2,
+Evening,Unknown street,,,,,,
+Morning,"Mýtna 3, Bratislava",,,,48.2,17.1,
+'''
+
+@pytest.fixture
+def geocoded(monkeypatch):
+    """Geocode 'Unknown street' to nothing and any other address to a fixed point"""
+    addresses = []
+
+    def cached_geocode_many(batch):
+        addresses.extend(batch)
+        return {address: None if address == 'Unknown street' else
+                {'coordinates': [17.0, 48.0], 'formatted_address': f'{address}, Slovakia'}
+                for address in batch}
+
+    monkeypatch.setattr(route_import, 'cached_geocode_many', cached_geocode_many)
+    return addresses
+
+def test_csv_routes_are_runs_of_rows_with_the_same_name():
+    routes = [(line, route['name'], len(route['stops'])) for line, route in read_csv(io.StringIO(CSV))]
+    assert routes == [(2, 'Morning', 2), (4, 'Evening', 1), (5, 'Morning', 1)]
+
+def test_ndjson_yields_bad_lines_as_errors():
+    stream = io.StringIO('{"name": "A", "stops": []}\n\nnot json\n{"name": "B"}\n')
+    routes = list(read_ndjson(stream))
+
+    assert [line for line, _ in routes] == [1, 3, 4]
+    assert isinstance(routes[1][1], ValueError)
+    assert routes[2][1] == {'name': 'B'}
+
+def test_csv_import_reports_skipped_routes_by_line(db, geocoded):
+    from models import Route
+
+    result = import_routes(db.session, io.StringIO(CSV), 'csv')
+
+    assert result == {'routes': 2, 'stops': 3, 'errors': [(4, 'Could not geocode address: Unknown street')]}
+    routes = Route.query.order_by(Route.id).all()
+    assert [route.name for route in routes] == ['Morning', 'Morning']
+    assert [location.formatted_address for location in routes[0].locations] == ['Obchodná 1, Bratislava',
+                                                                                 'Hlavná 5, Košice']
+    assert routes[0].locations[0].category == 'office'
+    assert routes[0].coordinates == [[17.1, 48.1], [21.2, 48.7]]
+    # Stops with coordinates aren't geocoded
+    assert geocoded == ['Unknown street']
+
+def test_ndjson_import_geocodes_stops_without_coordinates(db, geocoded):
+    from models import Route
+
+    lines = [
+        {'name': 'Geocoded', 'total_time': '1h', 'stops': [{'address': 'Mýtna 3, Bratislava'},
+                                                          {'street': 'Hlavná', 'number': '5', 'city': 'Košice'}]},
+        {'name': 'Empty', 'stops': []},
+        {'name': 'No address', 'stops': [{'category': 'home'}]},
+        ['not', 'a', 'route'],
+    ]
+    stream = io.StringIO('\n'.join(json.dumps(line) for line in lines) + '\n{broken\n')
+
+    result = import_routes(db.session, stream, 'ndjson')
+
+    assert result['routes'] == 1 and result['stops'] == 2
+    assert [line for line, _ in result['errors']] == [2, 3, 4, 5]
+    assert result['errors'][:2] == [(2, 'Route has no stops'), (3, 'Stop has no address')]
+    assert geocoded == ['Mýtna 3, Bratislava', 'Hlavná 5, Košice']
+    route = Route.query.one()
+    assert (route.name, route.total_time) == ('Geocoded', '1h')
+    assert route.locations[1].street == 'Hlavná' and route.locations[1].city == 'Košice'
+
+def test_batches_are_committed_separately(db, geocoded, monkeypatch):
+    from models import Route
+
+    monkeypatch.setattr(config, 'IMPORT_BATCH_STOPS', 2)
+    commits = []
+    monkeypatch.setattr(db.session, 'commit', lambda commit=db.session.commit: commits.append(1) or commit())
+
+    assert import_routes(db.session, io.StringIO(CSV), 'csv')['routes'] == 2
+    assert len(commits) == 2
+    assert Route.query.count() == 2
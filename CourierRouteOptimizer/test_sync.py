@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+
+import config
+from app import _decode_sync_cursor, _encode_sync_cursor
+
+NOW = datetime.datetime.utcnow()
+DAY_AGO = NOW - datetime.timedelta(days=1)
+
+@pytest.fixture
+def couriers(db):
+    from models import Courier
+
+    couriers = [Courier(username=name, email=f'{name}@example.com', password_hash='-') for name in ('anna', 'boris')]
+    db.session.add_all(couriers)
+    db.session.commit()
+    return couriers
+
+def add_route(db, courier, assigned_at):
+    """Route with two stops assigned to the courier, all last changed at assigned_at"""
+    from models import Route, Location, CourierRouteAssignment
+
+    route = Route(total_distance=5.0, total_time='1h', coordinates=[[17.1, 48.1], [17.2, 48.2]], updated_at=assigned_at)
+    route.locations = [Location(city='Bratislava', street=f'Main {position}', position=position,
+                                updated_at=assigned_at) for position in range(2)]
+    db.session.add(CourierRouteAssignment(courier=courier, route=route, assigned_at=assigned_at,
+                                          updated_at=assigned_at))
+    db.session.commit()
+    return route
+
+def sync(client, courier, cursor=None):
+    query = f'?cursor={cursor}' if cursor else ''
+    return client.get(f'/api/sync{query}', headers={'X-API-Key': courier.api_key})
+
+def test_cursor_round_trip():
+    assert _decode_sync_cursor(_encode_sync_cursor(NOW)) == NOW
+
+def test_first_sync_only_returns_a_cursor(client, couriers):
+    body = sync(client, couriers[0]).get_json()
+
+    assert body['full_sync_required'] is True
+    assert set(body) == {'cursor', 'full_sync_required'}
+    assert _decode_sync_cursor(body['cursor']) >= NOW
+
+# The last cursor is 'yesterday' encoded
+@pytest.mark.parametrize('cursor', ['not-a-cursor', '!!!', 'eWVzdGVyZGF5'])
+def test_malformed_cursor_is_rejected(client, couriers, cursor):
+    assert sync(client, couriers[0], cursor).status_code == 400
+
+def test_cursor_older_than_tombstones_requires_full_sync(client, couriers):
+    cursor = _encode_sync_cursor(NOW - datetime.timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS + 1))
+    body = sync(client, couriers[0], cursor).get_json()
+
+    assert body['full_sync_required'] is True
+    assert 'assignments' not in body
+
+def test_changes_since_cursor(client, db, couriers):
+    anna, boris = couriers
+    changed = add_route(db, anna, DAY_AGO)
+    add_route(db, anna, DAY_AGO)
+    add_route(db, boris, DAY_AGO)
+    cursor = _encode_sync_cursor(NOW - datetime.timedelta(hours=1))
+
+    changed.locations[1].status = 'completed'
+    new = add_route(db, anna, NOW)
+    # Changes to other couriers' routes aren't reported
+    boris_route = add_route(db, boris, NOW)
+    boris_route.locations[0].status = 'completed'
+    db.session.commit()
+
+    body = sync(client, anna, cursor).get_json()
+    assert body['full_sync_required'] is False
+    assert [assignment['route_id'] for assignment in body['assignments']] == [new.id]
+    assert [route['id'] for route in body['new_routes']] == [new.id]
+    assert len(body['new_routes'][0]['locations']) == 2
+    assert body['routes'] == []
+    assert [(location['route_id'], location['version']) for location in body['locations']] == [(changed.id, 2)]
+    assert body['deleted_routes'] == []
+
+    # Nothing changed after the next cursor
+    later = sync(client, anna, _encode_sync_cursor(NOW + datetime.timedelta(minutes=1))).get_json()
+    assert later['assignments'] == later['new_routes'] == later['locations'] == []
+
+def test_too_many_changes_require_full_sync(client, db, couriers, monkeypatch):
+    monkeypatch.setattr(config, 'SYNC_MAX_CHANGES', 1)
+    add_route(db, couriers[0], NOW)
+    add_route(db, couriers[0], NOW)
+
+    cursor = _encode_sync_cursor(NOW - datetime.timedelta(hours=1))
+    assert sync(client, couriers[0], cursor).get_json()['full_sync_required'] is True
@@ -0,0 +1,170 @@
+import datetime
+from collections import Counter, defaultdict
+from sqlalchemy import delete, extract, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+ROLLUP_FIELDS = ('routes_saved', 'distance_saved', 'stops_saved', 'routes_completed', 'distance_completed')
+
+def _increment(session, model, key, **deltas):
+    """
+    Add to the counters of a rollup row, creating the row if needed
+
+    Uses UPDATE ... SET x = x + n followed by an INSERT in a savepoint, which
+    is atomic on every backend without dialect-specific upserts.
+    """
+    key_column = model.__table__.primary_key.columns.values()[0]
+    statement = update(model.__table__).where(key_column == key).values(
+        {name: model.__table__.c[name] + delta for name, delta in deltas.items()}
+    )
+    if session.execute(statement).rowcount:
+        return
+
+    row = {field: 0 for field in model.__table__.c.keys() if field != key_column.name}
+    row.update(deltas)
+    row[key_column.name] = key
+    try:
+        with session.begin_nested():
+            session.execute(insert(model.__table__).values(row))
+    except IntegrityError:
+        # Created concurrently by another request; add to that row instead
+        session.execute(statement)
+
+def _record_day(session, when, **deltas):
+    from models import DailyRouteStats, MonthlyRouteStats
+    _increment(session, DailyRouteStats, when.date(), **deltas)
+    _increment(session, MonthlyRouteStats, when.strftime('%Y-%m'), **deltas)
+
+def record_routes_saved(session, routes, sign=1):
+    """
+    Count newly saved routes in the rollups, in the caller's transaction
+
+    Args:
+        routes: Iterable of (created_at, total_distance, stop categories) tuples
+    """
+    from models import CategoryStats
+    days = defaultdict(Counter)
+    categories = Counter()
+    for created_at, total_distance, stop_categories in routes:
+        days[created_at.date()].update(
+            routes_saved=sign, distance_saved=sign * total_distance, stops_saved=sign * len(stop_categories)
+        )
+        categories.update(category or 'other' for category in stop_categories)
+
+    for day, deltas in days.items():
+        _record_day(session, datetime.datetime.combine(day, datetime.time()), **deltas)
+    for category, count in categories.items():
+        _increment(session, CategoryStats, category, location_count=sign * count)
+
+def record_route_saved(session, route, sign=1):
+    """
+    Count a newly saved route in the rollups, in the caller's transaction
+
+    The route must be flushed so its created_at is set.
+    """
+    record_routes_saved(
+        session, [(route.created_at, route.total_distance, [location.category for location in route.locations])], sign
+    )
+
+def record_route_completed(session, route, completed_at, sign=1):
+    """Count a completed route assignment in the rollups, in the caller's transaction"""
+    _record_day(session, completed_at, routes_completed=sign, distance_completed=sign * route.total_distance)
+
+def record_route_deleted(session, route):
+    """Take a route that is about to be deleted, and its completions, out of the rollups"""
+    record_route_saved(session, route, sign=-1)
+    for assignment in route.assigned_couriers:
+        if assignment.status == 'completed' and assignment.completed_at:
+            record_route_completed(session, route, assignment.completed_at, sign=-1)
+
+def _daily_totals(connection, timestamp, *columns, from_=None, where=None):
+    """Run a per-day GROUP BY using EXTRACT, which every backend supports"""
+    parts = [extract(field, timestamp) for field in ('year', 'month', 'day')]
+    query = select(*parts, *columns).group_by(*parts)
+    if from_ is not None:
+        query = query.select_from(from_)
+    if where is not None:
+        query = query.where(where)
+    for year, month, day, *values in connection.execute(query):
+        yield datetime.date(int(year), int(month), int(day)), values
+
+def rebuild_rollups(connection):
+    """Recompute all rollup tables from the routes, locations and assignments, live and archived"""
+    from models import (Route, Location, CourierRouteAssignment, ArchivedRoute, ArchivedLocation, ArchivedAssignment,
+                        DailyRouteStats, MonthlyRouteStats, CategoryStats)
+
+    days = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    categories = Counter()
+    for route, location, assignment in ((Route, Location, CourierRouteAssignment),
+                                        (ArchivedRoute, ArchivedLocation, ArchivedAssignment)):
+        for day, (routes, distance) in _daily_totals(
+                connection, route.created_at, func.count(route.id), func.coalesce(func.sum(route.total_distance), 0)):
+            days[day]['routes_saved'] += routes
+            days[day]['distance_saved'] += distance
+        for day, (stops,) in _daily_totals(
+                connection, route.created_at, func.count(location.id),
+                from_=route.__table__.join(location.__table__, location.route_id == route.id)):
+            days[day]['stops_saved'] += stops
+        for day, (routes, distance) in _daily_totals(
+                connection, assignment.completed_at,
+                func.count(assignment.id), func.coalesce(func.sum(route.total_distance), 0),
+                from_=assignment.__table__.join(route.__table__, assignment.route_id == route.id),
+                where=(assignment.status == 'completed') & assignment.completed_at.isnot(None)):
+            days[day]['routes_completed'] += routes
+            days[day]['distance_completed'] += distance
+
+        categories.update(dict(connection.execute(
+            select(func.coalesce(location.category, 'other'), func.count(location.id))
+            .group_by(func.coalesce(location.category, 'other'))
+        ).all()))
+
+    months = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for day, values in days.items():
+        for field, value in values.items():
+            months[day.strftime('%Y-%m')][field] += value
+
+    for model in (DailyRouteStats, MonthlyRouteStats, CategoryStats):
+        connection.execute(delete(model.__table__))
+    if days:
+        connection.execute(insert(DailyRouteStats.__table__), [dict(values, day=day) for day, values in days.items()])
+        connection.execute(insert(MonthlyRouteStats.__table__), [dict(values, month=month) for month, values in months.items()])
+    if categories:
+        connection.execute(insert(CategoryStats.__table__), [
+            {'category': category, 'location_count': count} for category, count in categories.items()
+        ])
+
+def route_count(session):
+    """Number of saved routes, from the monthly rollups instead of counting the route table"""
+    from models import MonthlyRouteStats
+    return session.scalar(select(func.coalesce(func.sum(MonthlyRouteStats.routes_saved), 0)))
+
+def dashboard_stats(session, months=6):
+    """
+    Analytics dashboard figures read from the rollup tables
+
+    The cost depends on the number of months and categories, not on the
+    number of routes ever saved.
+    """
+    from models import MonthlyRouteStats, CategoryStats
+
+    total_routes, total_distance = session.execute(select(
+        func.coalesce(func.sum(MonthlyRouteStats.routes_saved), 0),
+        func.coalesce(func.sum(MonthlyRouteStats.distance_saved), 0)
+    )).one()
+
+    category_counts = dict(session.execute(
+        select(CategoryStats.category, CategoryStats.location_count).where(CategoryStats.location_count > 0)
+    ).all())
+
+    first_month = (datetime.datetime.now() - datetime.timedelta(days=30 * months)).strftime('%Y-%m')
+    monthly_counts = session.execute(
+        select(MonthlyRouteStats.month, MonthlyRouteStats.routes_saved)
+        .where(MonthlyRouteStats.month >= first_month, MonthlyRouteStats.routes_saved > 0)
+        .order_by(MonthlyRouteStats.month)
+    ).all()
+
+    return {
+        'total_distance': round(total_distance, 1),
+        'total_routes': total_routes,
+        'category_distribution': category_counts,
+        'monthly_routes': {month: count for month, count in monthly_counts}
+    }
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+import config
+
+# Courier columns kept in the cache: the identity fields the mobile API reads,
+# never credentials such as password_hash
+CACHED_FIELDS = ('id', 'api_key', 'username', 'email', 'first_name', 'last_name', 'phone', 'created_at')
+
+class ApiKeyCache:
+    """
+    Size-bounded TTL cache of API key -> courier identity fields
+
+    Couriers are cached as plain values rather than ORM objects, which belong
+    to the session of the request that loaded them; courier() rebuilds an
+    instance attached to the current session without querying. Columns
+    outside CACHED_FIELDS are loaded from the database if accessed. Only
+    valid keys are cached. Invalidation is per process, so on other workers
+    a regenerated or deleted key keeps working for at most the TTL.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # api_key -> (expires, column values)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, api_key):
+        """Cached column values of the courier with this API key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[api_key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(api_key)
+            return entry[1]
+
+    def put(self, api_key, courier):
+        values = {field: getattr(courier, field) for field in CACHED_FIELDS}
+        with self._lock:
+            self._entries[api_key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def courier(self, session, model, api_key):
+        """
+        Courier with this API key, attached to the session, if cached
+
+        Args:
+            session: Session the courier is used in
+            model: The Courier model class
+            api_key: Key sent by the client
+        """
+        values = self.get(api_key)
+        if values is None:
+            return None
+        courier = model(**values)
+        make_transient_to_detached(courier)
+        return session.merge(courier, load=False)
+
+    def invalidate(self, api_key):
+        with self._lock:
+            self._entries.pop(api_key, None)
+
+    def invalidate_courier(self, courier_id):
+        """Drop every cached key of a courier, e.g. after it was edited or deleted"""
+        with self._lock:
+            for api_key in [key for key, (_, values) in self._entries.items() if values['id'] == courier_id]:
+                del self._entries[api_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring the cache's effectiveness"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared per-process cache
+api_key_cache = ApiKeyCache(config.API_KEY_CACHE_MAX_ENTRIES, config.API_KEY_CACHE_TTL)
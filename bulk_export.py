@@ -0,0 +1,90 @@
+import json
+import zipfile
+from route_export import csv_stream, gpx_stream
+
+class _ZipOutput:
+    """
+    Write-only file object for zipfile that hands out what was written
+
+    zipfile treats it as unseekable and writes data descriptors after each
+    member, so the archive can be sent while it is being built.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def saved_route_data(route):
+    """
+    Shape a saved Route like a session route so the export writers accept it
+
+    Saved routes have no segment geometry, so tracks are left empty. Each
+    stop is placed at its location's own coordinates. The route's coordinate
+    list may include a start point or miss removed stops, so it is only used
+    for stops without coordinates when it has exactly one point per stop;
+    stops that still have no position are left out.
+    """
+    locations = sorted(route.locations, key=lambda location: location.position)
+    route_coordinates = route.coordinates if len(route.coordinates) == len(locations) else None
+
+    stops = []
+    for i, location in enumerate(locations):
+        if location.longitude is not None and location.latitude is not None:
+            stops.append((location, [location.longitude, location.latitude]))
+        elif route_coordinates:
+            stops.append((location, route_coordinates[i]))
+
+    return {
+        'coordinates': [point for _, point in stops],
+        'addresses': [location.formatted_address or f"{location.street} {location.number or ''}, {location.city}"
+                      for location, _ in stops],
+        'location_details': [{
+            'category': location.category,
+            'time_window_start': location.time_window_start.strftime('%H:%M') if location.time_window_start else '',
+            'time_window_end': location.time_window_end.strftime('%H:%M') if location.time_window_end else ''
+        } for location, _ in stops],
+        'total_distance': route.total_distance,
+        'total_time': route.total_time
+    }
+
+def ndjson_stream(routes):
+    """Generate one JSON document per line for each route, with its locations"""
+    for route in routes:
+        yield json.dumps(route.to_dict(), separators=(',', ':')) + '\n'
+
+def zip_stream(routes, file_formats=('gpx', 'csv')):
+    """
+    Generate a ZIP archive with one file per route and format
+
+    Args:
+        routes: Iterable of Route objects, ideally fetched in batches
+        file_formats: Any of 'gpx' and 'csv'
+    """
+    writers = {'gpx': gpx_stream, 'csv': csv_stream}
+    output = _ZipOutput()
+
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for route in routes:
+            route_data = saved_route_data(route)
+            created = route.created_at.strftime('%Y%m%d_%H%M%S')
+            for file_format in file_formats:
+                with archive.open(f'route_{route.id}_{created}.{file_format}', 'w') as member:
+                    for chunk in writers[file_format](route_data, created):
+                        member.write(chunk.encode('utf-8'))
+                data = output.drain()
+                if data:
+                    yield data
+
+    # Central directory
+    yield output.drain()
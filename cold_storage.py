@@ -0,0 +1,132 @@
+import datetime
+import logging
+from sqlalchemy import and_, delete, exists, func, insert, literal, not_, or_, select
+from sqlalchemy.orm import aliased
+import config
+
+# Assignment statuses after which a route is no longer worked on
+FINISHED_STATUSES = ('completed', 'canceled')
+
+def _finished_before(assignment, cutoff):
+    """Condition: the assignment was completed or canceled before the cutoff"""
+    return and_(
+        assignment.status.in_(FINISHED_STATUSES),
+        func.coalesce(assignment.completed_at, assignment.assigned_at) < cutoff
+    )
+
+def archivable_route_ids(session, cutoff, limit):
+    """
+    Ids of routes whose assignments were all finished before the cutoff
+
+    Routes that were never assigned stay in the hot tables. The route with
+    the highest id is never archived, so backends that reuse the highest
+    deleted id (SQLite) can't give a new route the id of an archived one.
+
+    Args:
+        cutoff: Naive UTC datetime
+        limit: Most ids returned, lowest first
+    """
+    from models import Route, CourierRouteAssignment
+
+    other = aliased(CourierRouteAssignment)
+    return session.scalars(
+        select(CourierRouteAssignment.route_id).distinct().where(
+            # Assignments are finished after they start, so this is a range on ix_assignment_assigned_at
+            CourierRouteAssignment.assigned_at < cutoff,
+            _finished_before(CourierRouteAssignment, cutoff),
+            ~exists().where(other.route_id == CourierRouteAssignment.route_id,
+                            or_(other.assigned_at >= cutoff, not_(_finished_before(other, cutoff)))),
+            CourierRouteAssignment.route_id < select(func.max(Route.id)).scalar_subquery()
+        ).order_by(CourierRouteAssignment.route_id).limit(limit)
+    ).all()
+
+def _move(session, model, archive_model, condition, archived_at):
+    """Copy the rows matching the condition into the archive table with INSERT ... SELECT, then delete them"""
+    columns = list(model.__table__.columns)
+    session.execute(insert(archive_model.__table__).from_select(
+        [column.name for column in columns] + ['archived_at'],
+        select(*columns, literal(archived_at, archive_model.__table__.c.archived_at.type)).where(condition)
+    ))
+    return session.execute(delete(model.__table__).where(condition)).rowcount
+
+def _record_tombstones(session, route_ids, archived_at):
+    """
+    Tell the couriers of archived routes, through the change feed, that the routes are gone
+
+    Tombstones older than the change feed's retention are dropped here too.
+    """
+    from models import CourierRouteAssignment, RouteTombstone
+
+    session.execute(delete(RouteTombstone).where(
+        RouteTombstone.deleted_at < archived_at - datetime.timedelta(days=config.SYNC_TOMBSTONE_RETENTION_DAYS)
+    ))
+    session.execute(insert(RouteTombstone).from_select(
+        ['courier_id', 'route_id', 'deleted_at'],
+        select(CourierRouteAssignment.courier_id, CourierRouteAssignment.route_id,
+               literal(archived_at, RouteTombstone.deleted_at.type))
+        .where(CourierRouteAssignment.route_id.in_(route_ids)).distinct()
+    ))
+
+def archive_route_batch(session, route_ids):
+    """
+    Move routes with their locations and assignments to the archive tables
+
+    All three tables are moved in one transaction, committed here, along
+    with tombstones that make /api/sync report the routes as deleted. The
+    analytics rollups are left as they are, since archived routes still
+    count as saved and completed.
+
+    Returns:
+        Dictionary with the numbers of routes, locations and assignments moved
+    """
+    from models import (Route, Location, CourierRouteAssignment,
+                        ArchivedRoute, ArchivedLocation, ArchivedAssignment)
+
+    archived_at = datetime.datetime.utcnow()
+    _record_tombstones(session, route_ids, archived_at)
+    # Children first, as the hot tables have foreign keys to route
+    moved = {
+        'assignments': _move(session, CourierRouteAssignment, ArchivedAssignment,
+                             CourierRouteAssignment.route_id.in_(route_ids), archived_at),
+        'locations': _move(session, Location, ArchivedLocation, Location.route_id.in_(route_ids), archived_at),
+        'routes': _move(session, Route, ArchivedRoute, Route.id.in_(route_ids), archived_at)
+    }
+    session.commit()
+    return moved
+
+def archive_completed_routes(session, older_than_days=None, batch_size=None, max_batches=None):
+    """
+    Move routes finished more than older_than_days ago out of the hot tables
+
+    Routes are moved in batches of batch_size, one transaction each, so a
+    run can be interrupted and resumed, and locks are held briefly.
+
+    Args:
+        older_than_days: Defaults to ARCHIVE_COMPLETED_AFTER_DAYS
+        batch_size: Routes per batch, defaults to ARCHIVE_BATCH_ROUTES
+        max_batches: Stop after this many batches; None runs until done
+
+    Returns:
+        Dictionary with the numbers of batches, routes, locations and
+        assignments moved
+    """
+    older_than_days = config.ARCHIVE_COMPLETED_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or config.ARCHIVE_BATCH_ROUTES
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+
+    totals = {'batches': 0, 'routes': 0, 'locations': 0, 'assignments': 0}
+    while max_batches is None or totals['batches'] < max_batches:
+        route_ids = archivable_route_ids(session, cutoff, batch_size)
+        if not route_ids:
+            break
+        try:
+            moved = archive_route_batch(session, route_ids)
+        except Exception:
+            session.rollback()
+            raise
+        totals['batches'] += 1
+        for key, count in moved.items():
+            totals[key] += count
+        logging.info(f"Archived {moved['routes']} routes, {moved['locations']} locations, "
+                     f"{moved['assignments']} assignments")
+    return totals
@@ -0,0 +1,167 @@
+import math
+import numpy as np
+import polyline
+import config
+
+# Web Mercator metres per pixel at zoom level 0 (256 px tiles)
+MERCATOR_METERS_PER_PIXEL = 156543.03392804097
+EARTH_RADIUS = 6378137.0
+
+def encode_geometry(coordinates, precision=None):
+    """Encode a list of [lon, lat] points as an encoded polyline string"""
+    precision = precision or config.POLYLINE_PRECISION
+    return polyline.encode([(point[0], point[1]) for point in coordinates], precision, geojson=True)
+
+def decode_geometry(encoded, precision=None):
+    """Decode an encoded polyline string into a list of [lon, lat] points"""
+    precision = precision or config.POLYLINE_PRECISION
+    return [[lon, lat] for lon, lat in polyline.decode(encoded, precision, geojson=True)]
+
+def segment_coordinates(segment):
+    """
+    Return the [lon, lat] points of a route segment
+
+    Segments carry their geometry as an encoded polyline; routes stored before
+    that still hold plain coordinate lists, which are returned as they are.
+    """
+    geometry = segment.get('geometry')
+    if not geometry:
+        return []
+    if isinstance(geometry, str):
+        return decode_geometry(geometry, segment.get('geometry_precision'))
+    return geometry
+
+def segment_endpoints(segment):
+    """Return the (start, end) points of a segment without decoding its geometry if possible"""
+    if 'start' in segment and 'end' in segment:
+        return segment['start'], segment['end']
+    points = segment_coordinates(segment)
+    return points[0], points[-1]
+
+def pack_coordinates(coordinates):
+    """Pack a list of [lon, lat] points as little-endian float64 pairs"""
+    return np.asarray(coordinates, dtype='<f8').reshape(-1, 2).tobytes()
+
+def unpack_coordinates(data):
+    """Unpack float64 pairs written by pack_coordinates into [lon, lat] lists"""
+    return np.frombuffer(data, dtype='<f8').reshape(-1, 2).tolist()
+
+def tolerance_for_zoom(zoom):
+    """Simplification tolerance, in Web Mercator metres, for a map zoom level"""
+    return config.GEOMETRY_SIMPLIFY_PIXELS * MERCATOR_METERS_PER_PIXEL / 2 ** zoom
+
+def zoom_for_tolerance(tolerance):
+    """Lowest zoom level whose simplification tolerance is within `tolerance` metres"""
+    if tolerance <= 0:
+        return None
+    return max(0, math.ceil(math.log2(config.GEOMETRY_SIMPLIFY_PIXELS * MERCATOR_METERS_PER_PIXEL / tolerance)))
+
+def _mercator(points):
+    """Project [lon, lat] points to Web Mercator metres"""
+    lon = np.radians(points[:, 0])
+    lat = np.radians(np.clip(points[:, 1], -85.05112878, 85.05112878))
+    return np.column_stack((EARTH_RADIUS * lon, EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat / 2))))
+
+def _point_importance(xy, min_tolerance):
+    """
+    Douglas-Peucker run recording the tolerance up to which each point survives
+
+    A point split off at distance d below a parent split at distance p is kept
+    by every tolerance smaller than min(d, p), so a single pass down to the
+    finest tolerance yields all coarser levels as thresholds.
+    """
+    importance = np.zeros(len(xy))
+    importance[0] = importance[-1] = np.inf
+
+    stack = [(0, len(xy) - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+
+        # Distances of all interior points to the chord, in one pass
+        start = xy[first]
+        chord = xy[last] - start
+        offsets = xy[first + 1:last] - start
+        length = np.hypot(chord[0], chord[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] <= min_tolerance:
+            continue
+
+        index = first + 1 + farthest
+        importance[index] = min(distances[farthest], parent)
+        stack.append((first, index, importance[index]))
+        stack.append((index, last, importance[index]))
+
+    return importance
+
+def simplified_levels(coordinates, precision=None):
+    """
+    Precompute simplified geometries of a line for the configured zoom levels
+
+    Args:
+        coordinates: List of [lon, lat] points
+        precision: Polyline precision of the encoded results
+
+    Returns:
+        Dictionary of zoom level (as a string) to encoded polyline; levels
+        that would keep every point are left out
+    """
+    if len(coordinates) < 3:
+        return {}
+
+    points = np.asarray(coordinates, dtype=float)[:, :2]
+    zooms = sorted(config.GEOMETRY_SIMPLIFY_ZOOMS)
+    importance = _point_importance(_mercator(points), tolerance_for_zoom(zooms[-1]))
+
+    levels = {}
+    for zoom in zooms:
+        keep = importance > tolerance_for_zoom(zoom)
+        if keep.all():
+            break
+        levels[str(zoom)] = encode_geometry(points[keep].tolist(), precision)
+    return levels
+
+def segment_geometry(segment, zoom=None):
+    """
+    Return the encoded geometry of a segment to draw at a zoom level
+
+    The finest precomputed level at or above `zoom` is used; without a zoom,
+    or beyond the precomputed levels, the full geometry is returned.
+    """
+    levels = segment.get('simplified') or {}
+    if zoom is not None:
+        candidates = [int(level) for level in levels if int(level) >= zoom]
+        if candidates:
+            return levels[str(min(candidates))]
+    return segment.get('geometry')
+
+def route_for_zoom(route_data, zoom=None):
+    """
+    Return a copy of a route for the client with geometries for a zoom level
+
+    The precomputed levels themselves are never sent; `geometry_zoom` tells
+    the client up to which zoom level the geometry stays accurate (None when
+    it is the full geometry).
+    """
+    route_details = route_data.get('route_details')
+    if not route_details or 'segments' not in route_details:
+        return route_data
+
+    segments = []
+    for segment in route_details['segments']:
+        segment = dict(segment)
+        segment['geometry'] = segment_geometry(segment, zoom)
+        segment.pop('simplified', None)
+        segments.append(segment)
+
+    geometry_zoom = None
+    if zoom is not None:
+        geometry_zoom = next((level for level in sorted(config.GEOMETRY_SIMPLIFY_ZOOMS) if level >= zoom), None)
+
+    return dict(route_data, route_details=dict(route_details, segments=segments), geometry_zoom=geometry_zoom)
@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+import config
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+class CachedBody:
+    """A serialized JSON body with its ETag and lazily compressed variants"""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """Return the body in the given content encoding, compressing it once"""
+        if encoding == 'identity':
+            return self.body
+
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == 'br':
+                    data = brotli.compress(self.body, quality=config.RESPONSE_BROTLI_QUALITY)
+                else:
+                    data = gzip.compress(self.body, compresslevel=config.RESPONSE_GZIP_LEVEL, mtime=0)
+                self._encoded[encoding] = data
+            return data
+
+class ResponseCache:
+    """LRU cache of serialized response bodies keyed by resource and version"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_ENTRIES)
+
+def negotiate_encoding(body):
+    """Pick the content encoding for a body from the request's Accept-Encoding"""
+    if len(body) < config.RESPONSE_COMPRESS_MIN_BYTES:
+        return 'identity'
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return 'identity'
+
+def json_response(build, cache_key=None, status=200):
+    """
+    Serve JSON with a content-hash ETag, 304 handling and negotiated compression
+
+    Args:
+        build: The payload, or a callable returning it (only called on a cache miss)
+        cache_key: Hashable key identifying the resource version; the serialized
+            and compressed bodies are reused for as long as the key is the same
+        status: HTTP status code of the response
+
+    Returns:
+        Flask response
+    """
+    body = response_cache.get(cache_key) if cache_key is not None else None
+    if body is None:
+        payload = build() if callable(build) else build
+        body = CachedBody(current_app.json.dumps(payload).encode('utf-8'))
+        if cache_key is not None:
+            response_cache.put(cache_key, body)
+
+    # Each encoding is a different representation, so it gets its own strong ETag
+    encoding = negotiate_encoding(body.body)
+    etag = body.etag if encoding == 'identity' else f"{body.etag}-{encoding}"
+
+    response = current_app.response_class(status=status, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+
+    if status == 200 and request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    response.set_data(body.encoded(encoding))
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -1,12 +1,17 @@
 import os
-import csv
-import io
 import time
 import logging
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session, make_response
+from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session, make_response, Response, stream_with_context
 import config
-from route_optimizer import optimize_route, geocode_address, get_route_details, check_for_traffic_updates
+from route_optimizer import (optimize_route, get_route_details, parse_departure_time, service_times,
+                             without_weather, attach_weather)
+from traffic_refresher import merge_traffic_state, traffic_delta, traffic_event_stream
+from route_store import load_session_route, save_session_route
+from http_cache import json_response
+from result_cache import optimization_cache, optimization_key, cached_geocode
+from geometry import route_for_zoom, zoom_for_tolerance
+from route_export import EXPORT_FORMATS
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -69,41 +74,66 @@ def optimize():
             flash("Please enter at least two valid locations to optimize a route.", "danger")
             return redirect(url_for('index'))
 
-        # Geocode addresses to coordinates
-        coords = []
-        formatted_addresses = []
-        for idx, address in enumerate(locations):
-            geocode_result = geocode_address(address)
-            if geocode_result and 'coordinates' in geocode_result:
-                coords.append(geocode_result['coordinates'])
-                formatted_addresses.append(geocode_result['formatted_address'])
-                # Add coordinates to location details
-                location_details[idx]['longitude'] = geocode_result['coordinates'][0]
-                location_details[idx]['latitude'] = geocode_result['coordinates'][1]
-                location_details[idx]['formatted_address'] = geocode_result['formatted_address']
-            else:
-                flash(f"Could not geocode address: {address}", "danger")
+        # Departure time makes the optimizer cost each leg at the time it is driven
+        departure_time = parse_departure_time(request.form.get('departure_time', ''))
+        include_traffic = request.form.get('include_traffic', 'true').lower() == 'true'
+
+        # Re-submitted stop lists are served from the result cache
+        stop_service_times = service_times(location_details)
+        cache_key = optimization_key(locations, None, include_traffic, departure_time, stop_service_times)
+        result = optimization_cache.get(cache_key)
+        if result is None:
+            # Geocode addresses to coordinates
+            coords = []
+            geocoded = []
+            for address in locations:
+                geocode_result = cached_geocode(address)
+                if geocode_result and 'coordinates' in geocode_result:
+                    coords.append(geocode_result['coordinates'])
+                    geocoded.append({
+                        'coordinates': geocode_result['coordinates'],
+                        'formatted_address': geocode_result['formatted_address']
+                    })
+                else:
+                    flash(f"Could not geocode address: {address}", "danger")
+                    return redirect(url_for('index'))
+
+            # Optimize route
+            optimized_route, total_time, total_distance = optimize_route(coords, departure_time=departure_time,
+                                                                      stop_service_times=stop_service_times)
+
+            if not optimized_route:
+                flash("Could not optimize route. Please try different locations.", "danger")
                 return redirect(url_for('index'))
 
-        # Optimize route
-        optimized_route, total_time, total_distance = optimize_route(coords)
-        
-        if not optimized_route:
-            flash("Could not optimize route. Please try different locations.", "danger")
-            return redirect(url_for('index'))
+            # Get route details with real-time traffic information
+            route_details = get_route_details(optimized_route, include_traffic=include_traffic, departure_time=departure_time)
 
-        # Get route details with real-time traffic information
-        include_traffic = request.form.get('include_traffic', 'true').lower() == 'true'
-        route_details = get_route_details(optimized_route, include_traffic=include_traffic)
+            result = {'geocoded': geocoded, 'optimized_route': optimized_route, 'route_details': route_details}
+            # Routes with straight-line fallback legs are worth retrying later
+            if all(segment.get('traffic_color') != 'gray' for segment in route_details.get('segments', [])):
+                # Weather is current conditions, looked up again on every hit
+                optimization_cache.put(cache_key, dict(result, route_details=without_weather(route_details)))
+        else:
+            attach_weather(result['route_details'], result['optimized_route'])
+
+        optimized_route = result['optimized_route']
+        route_details = result['route_details']
+        formatted_addresses = []
+        for idx, stop in enumerate(result['geocoded']):
+            formatted_addresses.append(stop['formatted_address'])
+            # Add coordinates to location details
+            location_details[idx]['longitude'] = stop['coordinates'][0]
+            location_details[idx]['latitude'] = stop['coordinates'][1]
+            location_details[idx]['formatted_address'] = stop['formatted_address']
         
         # Sprawdź, czy mamy geometrię tras
         for i, segment in enumerate(route_details.get('segments', [])):
             if 'geometry' in segment:
-                num_points = len(segment['geometry'])
-                logging.debug(f"Segment {i} ma {num_points} punktów geometrycznych")
+                logging.debug(f"Segment {i} ma {len(segment['geometry'])} znaków zakodowanej geometrii")
         
-        # Store in session for display
-        session['optimized_route'] = {
+        # Store server-side; the session only keeps the route id
+        save_session_route({
             'coordinates': optimized_route,
             'addresses': [formatted_addresses[i] for i in range(len(formatted_addresses))],
             'total_time': route_details['total_duration'],
@@ -114,10 +144,9 @@ def optimize():
             'traffic_delay_text': route_details.get('traffic_delay_text', ''),
             'has_traffic_data': route_details.get('has_traffic_data', False),
             'traffic_conditions': route_details.get('traffic_conditions', []),
-            'last_traffic_update': int(time.time()),
-            # Dodatkowo wyciągamy segmenty trasy na górny poziom dla łatwiejszego dostępu w JavaScript
-            'segments': route_details.get('segments', [])
-        }
+            'departure_time': departure_time.isoformat() if departure_time else None,
+            'last_traffic_update': int(time.time())
+        }, new_route=True)
         
         flash("Route optimized successfully!", "success")
         return redirect(url_for('index'))
@@ -130,46 +159,65 @@ def optimize():
 @app.route('/get_route')
 def get_route():
     """Return the optimized route data for AJAX requests"""
-    import time
-    
-    route_data = session.get('optimized_route', {})
-    
-    # Check if we need to update for traffic changes
+    route_data = load_session_route()
+    since = request.args.get('since', type=int)
+    zoom = _requested_zoom()
+
+    # Traffic is refreshed by the background worker; a poll only reads its shared state
     if route_data and 'coordinates' in route_data:
-        # Check if route is older than 2 minutes or check_traffic parameter is provided
-        current_time = int(time.time())
-        last_update = route_data.get('last_traffic_update', 0)
-        force_check = request.args.get('check_traffic', 'false').lower() == 'true'
-        
-        if force_check or (current_time - last_update > 120):  # 2 minutes
-            logging.debug("Checking for traffic updates...")
-            traffic_update = check_for_traffic_updates(route_data)
-            
-            if traffic_update.get('needs_update', False):
-                logging.debug(f"Traffic update needed: {traffic_update['reason']}")
-                
-                # Update the route with new traffic data
-                new_route = traffic_update.get('new_route')
-                if new_route:
-                    # Update duration and traffic information
-                    route_data['total_time'] = new_route['total_duration']
-                    route_data['total_duration_seconds'] = new_route['total_duration_seconds']
-                    route_data['traffic_delay_text'] = new_route.get('traffic_delay_text', '')
-                    route_data['traffic_conditions'] = new_route.get('traffic_conditions', [])
-                    route_data['route_details'] = new_route
-                    route_data['last_traffic_update'] = current_time
-                    route_data['has_traffic_update'] = True
-                    route_data['traffic_update_reason'] = traffic_update['reason']
-                    
-                    # Store the updated route back in the session
-                    session['optimized_route'] = route_data
-            else:
-                # Still update the last check timestamp
-                route_data['last_traffic_update'] = current_time
-                session['optimized_route'] = route_data
-    
+        route_data, update = merge_traffic_state(route_data)
+        if update:
+            logging.debug(f"Traffic update published: {update['reason']}")
+            save_session_route(route_data)
+
+        # Clients passing their last version only get what changed since then
+        if since is not None:
+            delta = traffic_delta(route_data, since, zoom)
+            if delta is None:
+                return '', 304
+            if delta:
+                return json_response(delta)
+
+        def build_payload():
+            # Only the simplified geometry matching the client's zoom level is sent
+            payload = route_for_zoom(route_data, zoom)
+            if update:
+                payload = dict(payload, has_traffic_update=True, traffic_update_reason=update['reason'])
+            return payload
+
+        # The body only changes with the route, its traffic version and the zoom level
+        cache_key = ('get_route', session.get('route_id'), route_data.get('traffic_version', 0), zoom, bool(update))
+        return json_response(build_payload, cache_key)
+
     return jsonify(route_data)
 
+def _requested_zoom():
+    """Map zoom level from the `zoom` or `tolerance` (metres) query parameter, if any"""
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None:
+        tolerance = request.args.get('tolerance', type=float)
+        if tolerance is not None:
+            zoom = zoom_for_tolerance(tolerance)
+    return zoom
+
+@app.route('/route_stream')
+def route_stream():
+    """Push traffic updates of the session route as server-sent events"""
+    route_data = load_session_route()
+    if not route_data or 'coordinates' not in route_data:
+        return jsonify({'error': 'No route available'}), 404
+
+    # EventSource resends the last event id when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    return Response(
+        stream_with_context(traffic_event_stream(route_data, since, zoom=_requested_zoom())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/get_navigation')
 def get_navigation():
     """Return navigation route from current location to first stop"""
@@ -205,7 +253,7 @@ def export_route():
     """Export route data in various formats"""
     try:
         export_format = request.args.get('format', 'json')
-        route_data = session.get('optimized_route', {})
+        route_data = load_session_route()
         
         if not route_data or 'coordinates' not in route_data:
             flash("No route data available to export.", "warning")
@@ -221,102 +269,14 @@ def export_route():
             response.headers.set('Content-Disposition', f'attachment; filename=route_{timestamp}.json')
             return response
             
-        elif export_format == 'csv':
-            # Export as CSV
-            csv_data = io.StringIO()
-            writer = csv.writer(csv_data)
-            
-            # Write header
-            writer.writerow(['Stop', 'Address', 'Coordinates', 'Category', 'Time Window'])
-            
-            # Write data for each stop
-            for i, address in enumerate(route_data.get('addresses', [])):
-                # Skip the last point if it's a return to start
-                if i == len(route_data.get('addresses', [])) - 1 and i > 0 and address == route_data['addresses'][0]:
-                    continue
-                
-                coords = route_data['coordinates'][i]
-                details = route_data.get('location_details', {})[i] if route_data.get('location_details') and i < len(route_data.get('location_details', {})) else {}
-                
-                category = details.get('category', 'home')
-                time_window = f"{details.get('time_window_start', '')} - {details.get('time_window_end', '')}" if details.get('time_window_start') else ''
-                
-                writer.writerow([
-                    i + 1,
-                    address,
-                    f"{coords[1]},{coords[0]}",  # Lat, Lon format
-                    category,
-                    time_window
-                ])
-            
-            # Add route summary
-            writer.writerow([])
-            writer.writerow(['Total Distance', f"{route_data.get('total_distance', 0)} km"])
-            writer.writerow(['Estimated Time', route_data.get('total_time', '')])
-            if route_data.get('traffic_delay_text'):
-                writer.writerow(['Traffic Info', route_data.get('traffic_delay_text', '')])
-            
-            response = make_response(csv_data.getvalue())
-            response.headers.set('Content-Type', 'text/csv')
-            response.headers.set('Content-Disposition', f'attachment; filename=route_{timestamp}.csv')
-            return response
-            
-        elif export_format == 'gpx':
-            # Export as GPX (GPS Exchange Format)
-            gpx = '<?xml version="1.0" encoding="UTF-8"?>\n'
-            gpx += '<gpx version="1.1" creator="CourierNavigator" xmlns="http://www.topografix.com/GPX/1/1">\n'
-            
-            # Add metadata
-            gpx += '  <metadata>\n'
-            gpx += f'    <name>Courier Route {timestamp}</name>\n'
-            gpx += f'    <time>{datetime.now().isoformat()}</time>\n'
-            gpx += '  </metadata>\n'
-            
-            # Add route
-            gpx += '  <rte>\n'
-            gpx += f'    <name>Route {timestamp}</name>\n'
-            
-            # Add route points
-            for i, address in enumerate(route_data.get('addresses', [])):
-                # Skip the last point if it's a return to start
-                if i == len(route_data.get('addresses', [])) - 1 and i > 0 and address == route_data['addresses'][0]:
-                    continue
-                
-                coords = route_data['coordinates'][i]
-                details = route_data.get('location_details', {})[i] if route_data.get('location_details') and i < len(route_data.get('location_details', {})) else {}
-                
-                gpx += '    <rtept lat="{}" lon="{}">\n'.format(coords[1], coords[0])
-                gpx += f'      <name>Stop {i+1}: {address}</name>\n'
-                if details.get('category'):
-                    gpx += f'      <type>{details.get("category")}</type>\n'
-                gpx += '    </rtept>\n'
-            
-            # Add detailed track points if we have them
-            if 'segments' in route_data and route_data['segments']:
-                gpx += '  </rte>\n'
-                gpx += '  <trk>\n'
-                gpx += f'    <name>Detailed Route {timestamp}</name>\n'
-                
-                for i, segment in enumerate(route_data['segments']):
-                    gpx += '    <trkseg>\n'
-                    
-                    if 'geometry' in segment and segment['geometry']:
-                        for point in segment['geometry']:
-                            gpx += '      <trkpt lat="{}" lon="{}">\n'.format(point[1], point[0])
-                            gpx += '      </trkpt>\n'
-                    
-                    gpx += '    </trkseg>\n'
-                
-                gpx += '  </trk>\n'
-            else:
-                gpx += '  </rte>\n'
-            
-            gpx += '</gpx>'
-            
-            response = make_response(gpx)
-            response.headers.set('Content-Type', 'application/gpx+xml')
-            response.headers.set('Content-Disposition', f'attachment; filename=route_{timestamp}.gpx')
-            return response
+        elif export_format in EXPORT_FORMATS:
+            # CSV, GPX, KML and GeoJSON are streamed so large tracks start downloading at once
+            generate, mimetype, extension = EXPORT_FORMATS[export_format]
+            return Response(
+                stream_with_context(generate(route_data, timestamp)),
+                mimetype=mimetype,
+                headers={'Content-Disposition': f'attachment; filename=route_{timestamp}.{extension}'}
+            )
         
         else:
             flash(f"Unsupported export format: {export_format}", "danger")
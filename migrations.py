@@ -0,0 +1,165 @@
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text, DateTime, Integer, LargeBinary, MetaData, Table
+from geometry import pack_coordinates
+
+# Rows converted per statement when backfilling new columns
+BACKFILL_BATCH_SIZE = 1000
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+def add_column(connection, table, column, column_type):
+    """
+    Add a nullable column to an existing table unless it is already there
+
+    db.create_all() only creates missing tables, so columns added to
+    existing models need this on databases created before them.
+    """
+    if column in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return False
+    connection.execute(text(
+        f'ALTER TABLE {_quote(connection, table)} ADD COLUMN {_quote(connection, column)} '
+        f'{column_type.compile(dialect=connection.dialect)}'
+    ))
+    return True
+
+def create_indexes(connection, indexes):
+    """
+    Create the indexes an existing database lacks
+
+    Like columns, indexes added to existing models are not created by
+    db.create_all() on tables that already exist. Migrations list their
+    indexes explicitly rather than reading them from the models, so each
+    keeps describing the schema as of that migration.
+
+    Args:
+        indexes: List of (index name, table, [columns])
+    """
+    created = []
+    for name, table, columns in indexes:
+        if name in {index['name'] for index in inspect(connection).get_indexes(table)}:
+            continue
+        connection.execute(text(
+            f'CREATE INDEX {_quote(connection, name)} ON {_quote(connection, table)} '
+            f'({", ".join(_quote(connection, column) for column in columns)})'
+        ))
+        created.append(name)
+    return created
+
+def drop_index(connection, name, table):
+    """Drop an index unless it is already gone"""
+    if name not in {index['name'] for index in inspect(connection).get_indexes(table)}:
+        return False
+    for index in Table(table, MetaData(), autoload_with=connection).indexes:
+        if index.name == name:
+            index.drop(connection)
+    return True
+
+def _route_coordinates_blob(connection):
+    """Add Route.coordinates_blob and fill it from the JSON coordinates"""
+    add_column(connection, 'route', 'coordinates_blob', LargeBinary())
+
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            'SELECT id, coordinates_json FROM route '
+            'WHERE coordinates_blob IS NULL AND id > :last_id ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            text('UPDATE route SET coordinates_blob = :blob WHERE id = :id'),
+            [{'id': row.id, 'blob': pack_coordinates(json.loads(row.coordinates_json))} for row in rows]
+        )
+        last_id = rows[-1].id
+
+def _analytics_rollups(connection):
+    """Fill the analytics rollup tables (created by create_all) from existing data"""
+    from analytics_rollups import rebuild_rollups
+    rebuild_rollups(connection)
+
+def _lookup_indexes(connection):
+    """Index the columns the views filter, join and sort on"""
+    create_indexes(connection, [
+        ('ix_route_created_at', 'route', ['created_at']),
+        ('ix_location_route_position', 'location', ['route_id', 'position']),
+        ('ix_location_status_completed_at', 'location', ['status', 'completed_at']),
+        ('ix_location_category', 'location', ['category']),
+        ('ix_assignment_courier_assigned_at', 'courier_route_assignment', ['courier_id', 'assigned_at', 'id']),
+        ('ix_assignment_route_courier', 'courier_route_assignment', ['route_id', 'courier_id']),
+        ('ix_assignment_status_courier', 'courier_route_assignment', ['status', 'courier_id']),
+        ('ix_assignment_assigned_at', 'courier_route_assignment', ['assigned_at']),
+    ])
+
+def _change_tracking(connection):
+    """Add updated_at and version to the entities of the change feed, fill them in and index them"""
+    # Best available guess at each row's last change
+    last_changed = {
+        'route': 'created_at',
+        'location': 'completed_at',
+        'courier_route_assignment': 'COALESCE(completed_at, started_at, assigned_at)'
+    }
+    for table, expression in last_changed.items():
+        add_column(connection, table, 'updated_at', DateTime())
+        add_column(connection, table, 'version', Integer())
+        connection.execute(text(
+            f'UPDATE {_quote(connection, table)} SET version = COALESCE(version, 1), '
+            f'updated_at = COALESCE(updated_at, {expression}, :now) WHERE version IS NULL OR updated_at IS NULL'
+        ), {'now': datetime.utcnow()})
+    create_indexes(connection, [
+        ('ix_location_route_updated_at', 'location', ['route_id', 'updated_at']),
+        ('ix_assignment_courier_updated_at', 'courier_route_assignment', ['courier_id', 'updated_at']),
+    ])
+
+def _receipt_expiry_index(connection):
+    """Index receipts by age alone, now that they are expired for all couriers at once"""
+    create_indexes(connection, [
+        ('ix_location_update_receipt_processed_at', 'location_update_receipt', ['processed_at']),
+    ])
+    drop_index(connection, 'ix_location_update_receipt_processed', 'location_update_receipt')
+
+# Applied in order, once per database; names must never change
+MIGRATIONS = [
+    ('0001_route_coordinates_blob', _route_coordinates_blob),
+    ('0002_analytics_rollups', _analytics_rollups),
+    ('0003_lookup_indexes', _lookup_indexes),
+    ('0004_change_tracking', _change_tracking),
+    ('0005_receipt_expiry_index', _receipt_expiry_index),
+]
+
+def run_migrations(db):
+    """
+    Apply pending migrations, recording each in the schema_migrations table
+
+    Raises:
+        RuntimeError: If a migration fails, so the app doesn't start on a
+        half-migrated schema
+    """
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)'
+        ))
+        applied = {row[0] for row in connection.execute(text('SELECT name FROM schema_migrations'))}
+
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                migrate(connection)
+                connection.execute(
+                    text('INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)'),
+                    {'name': name, 'applied_at': datetime.utcnow()}
+                )
+            logging.info(f"Applied migration {name}")
+        except Exception as e:
+            # Another worker starting at the same time may have applied it first
+            with db.engine.connect() as connection:
+                if connection.execute(
+                    text('SELECT 1 FROM schema_migrations WHERE name = :name'), {'name': name}
+                ).first():
+                    continue
+            logging.error(f"Migration {name} failed: {str(e)}")
+            raise RuntimeError(f"Migration {name} failed") from e
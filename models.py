@@ -1,9 +1,23 @@
 from datetime import datetime
 import json
 import uuid
+from sqlalchemy import literal_column
 from app import db
+from geometry import pack_coordinates, unpack_coordinates
 from werkzeug.security import generate_password_hash, check_password_hash
 
+def _change_tracking_columns():
+    """
+    updated_at and version columns, maintained on every UPDATE
+
+    Used by the mobile change feed; version is bumped in SQL, so bulk
+    UPDATE statements count too.
+    """
+    return (
+        db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow),
+        db.Column(db.Integer, nullable=False, default=1, onupdate=literal_column('version + 1'))
+    )
+
 class Courier(db.Model):
     """Model representing a courier user"""
     id = db.Column(db.Integer, primary_key=True)
@@ -18,6 +32,8 @@ class Courier(db.Model):
     
     # User can have many assigned routes
     assigned_routes = db.relationship('CourierRouteAssignment', backref='courier', lazy=True, cascade="all, delete-orphan")
+    update_receipts = db.relationship('LocationUpdateReceipt', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    route_tombstones = db.relationship('RouteTombstone', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -26,6 +42,7 @@ class Courier(db.Model):
         return check_password_hash(self.password_hash, password)
     
     def regenerate_api_key(self):
+        # Callers drop the old key from api_key_cache once this is committed
         self.api_key = str(uuid.uuid4())
         return self.api_key
         
@@ -34,14 +51,22 @@ class Courier(db.Model):
 
 class Route(db.Model):
     """Model representing an optimized route"""
+    
+    # Keys of to_dict(), selectable with the API's fields= parameter
+    API_FIELDS = ('id', 'name', 'created_at', 'total_distance', 'total_time', 'version', 'coordinates', 'locations')
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total_distance = db.Column(db.Float, nullable=False)  # in km
     total_time = db.Column(db.String(20), nullable=False)  # stored as string like "2h 30m"
     
     # Store coordinates as JSON string
     coordinates_json = db.Column(db.Text, nullable=False)
+    # The same coordinates packed as float64 pairs, read instead of the JSON when present
+    coordinates_blob = db.Column(db.LargeBinary, nullable=True)
+    
+    updated_at, version = _change_tracking_columns()
     
     # Relationship with locations
     locations = db.relationship('Location', backref='route', lazy=True, cascade="all, delete-orphan")
@@ -51,29 +76,51 @@ class Route(db.Model):
     
     @property
     def coordinates(self):
-        """Deserialize coordinates from JSON string"""
-        return json.loads(self.coordinates_json)
+        """
+        Coordinates as a list of [lon, lat] points
+        
+        Decoded once per loaded value; the returned list is shared, so assign
+        a new list instead of modifying it in place.
+        """
+        source = self.coordinates_blob if self.coordinates_blob is not None else self.coordinates_json
+        cached = self.__dict__.get('_coordinates_cache')
+        if cached is not None and cached[0] is source:
+            return cached[1]
+        
+        if self.coordinates_blob is not None:
+            coords = unpack_coordinates(self.coordinates_blob)
+        else:
+            coords = json.loads(self.coordinates_json)
+        # Keyed by the column value, so a refresh from the database also invalidates it
+        self.__dict__['_coordinates_cache'] = (source, coords)
+        return coords
     
     @coordinates.setter
     def coordinates(self, coords):
-        """Serialize coordinates to JSON string"""
+        """Serialize coordinates to JSON string and packed binary"""
         self.coordinates_json = json.dumps(coords)
+        self.coordinates_blob = pack_coordinates(coords)
+        self.__dict__.pop('_coordinates_cache', None)
     
-    def to_dict(self):
-        """Convert route to dictionary for API responses"""
-        locations_list = []
-        for loc in sorted(self.locations, key=lambda x: x.position):
-            locations_list.append(loc.to_dict())
-            
-        return {
-            'id': self.id,
-            'name': self.name,
-            'created_at': self.created_at.isoformat(),
-            'total_distance': self.total_distance,
-            'total_time': self.total_time,
-            'coordinates': self.coordinates,
-            'locations': locations_list
+    def to_dict(self, fields=None):
+        """
+        Convert route to dictionary for API responses
+        
+        Args:
+            fields: Optional collection of keys to include; fields left out
+                (e.g. coordinates, locations) are not loaded or decoded
+        """
+        values = {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'created_at': lambda: self.created_at.isoformat(),
+            'total_distance': lambda: self.total_distance,
+            'total_time': lambda: self.total_time,
+            'version': lambda: self.version,
+            'coordinates': lambda: self.coordinates,
+            'locations': lambda: [loc.to_dict() for loc in sorted(self.locations, key=lambda x: x.position)]
         }
+        return {key: value() for key, value in values.items() if fields is None or key in fields}
     
     def __repr__(self):
         return f'<Route {self.id}: {self.name or "Unnamed Route"}>'
@@ -81,6 +128,17 @@ class Route(db.Model):
 
 class Location(db.Model):
     """Model representing a location in a route"""
+    __table_args__ = (
+        # Stops of a route in order; also serves lookups by route_id alone
+        db.Index('ix_location_route_position', 'route_id', 'position'),
+        # Dashboard delivery counts per status and completion day
+        db.Index('ix_location_status_completed_at', 'status', 'completed_at'),
+        # Category distribution
+        db.Index('ix_location_category', 'category'),
+        # Changed stops of a route, for the change feed
+        db.Index('ix_location_route_updated_at', 'route_id', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
     city = db.Column(db.String(100), nullable=False)
@@ -100,10 +158,13 @@ class Location(db.Model):
     delivery_notes = db.Column(db.Text, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    updated_at, version = _change_tracking_columns()
+    
     def to_dict(self):
         """Convert location to dictionary for API responses"""
         return {
             'id': self.id,
+            'version': self.version,
             'position': self.position,
             'address': {
                 'city': self.city,
@@ -131,6 +192,20 @@ class Location(db.Model):
 
 class CourierRouteAssignment(db.Model):
     """Model representing assignment of routes to couriers"""
+    __table_args__ = (
+        # A courier's assignments newest first, as paged by /api/routes; also
+        # serves lookups by courier_id alone
+        db.Index('ix_assignment_courier_assigned_at', 'courier_id', 'assigned_at', 'id'),
+        # Assignment of a route to a courier, and a route's assignments
+        db.Index('ix_assignment_route_courier', 'route_id', 'courier_id'),
+        # Active assignment counts per courier
+        db.Index('ix_assignment_status_courier', 'status', 'courier_id'),
+        # Recent assignments across all couriers
+        db.Index('ix_assignment_assigned_at', 'assigned_at'),
+        # Changed assignments of a courier, for the change feed
+        db.Index('ix_assignment_courier_updated_at', 'courier_id', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     courier_id = db.Column(db.Integer, db.ForeignKey('courier.id'), nullable=False)
     route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
@@ -141,5 +216,130 @@ class CourierRouteAssignment(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    updated_at, version = _change_tracking_columns()
+    
+    def to_dict(self):
+        """Convert assignment to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'route_id': self.route_id,
+            'version': self.version,
+            'status': self.status,
+            'assigned_at': self.assigned_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
     def __repr__(self):
         return f"<Assignment Courier:{self.courier_id} to Route:{self.route_id}>"
+
+def _archive_table(model, *indexes):
+    """
+    Table with the columns of a model's table plus archived_at, for rows
+    moved out of the hot tables by cold_storage.archive_completed_routes()
+
+    Foreign keys and defaults are left out; rows are copied as they are.
+    """
+    columns = [
+        db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable, autoincrement=False)
+        for column in model.__table__.columns
+    ]
+    return db.Table(f'archived_{model.__tablename__}', *columns,
+                    db.Column('archived_at', db.DateTime, nullable=False, default=datetime.utcnow), *indexes)
+
+class ArchivedRoute(db.Model):
+    """Route whose assignments were all finished long ago, kept out of the hot route table"""
+    __table__ = _archive_table(Route, db.Index('ix_archived_route_created_at', 'created_at'))
+
+    locations = db.relationship('ArchivedLocation', primaryjoin='foreign(ArchivedLocation.route_id) == ArchivedRoute.id',
+                                lazy=True, viewonly=True)
+
+    # Read the same way as live routes, so exports handle both
+    coordinates = Route.coordinates
+    to_dict = Route.to_dict
+
+    def __repr__(self):
+        return f'<ArchivedRoute {self.id}: {self.name or "Unnamed Route"}>'
+
+class ArchivedLocation(db.Model):
+    """Location of an archived route"""
+    __table__ = _archive_table(Location, db.Index('ix_archived_location_route_position', 'route_id', 'position'))
+
+    to_dict = Location.to_dict
+
+    def __repr__(self):
+        return f'<ArchivedLocation {self.id}: {self.street} {self.number}, {self.city}>'
+
+class ArchivedAssignment(db.Model):
+    """Assignment of an archived route"""
+    __table__ = _archive_table(
+        CourierRouteAssignment,
+        db.Index('ix_archived_assignment_courier_assigned_at', 'courier_id', 'assigned_at'),
+        db.Index('ix_archived_assignment_route', 'route_id')
+    )
+
+    to_dict = CourierRouteAssignment.to_dict
+
+    def __repr__(self):
+        return f"<ArchivedAssignment Courier:{self.courier_id} to Route:{self.route_id}>"
+
+class RouteTombstone(db.Model):
+    """Record of a deleted route, so couriers it was assigned to can drop it"""
+    __table_args__ = (
+        db.Index('ix_route_tombstone_courier_deleted_at', 'courier_id', 'deleted_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    courier_id = db.Column(db.Integer, db.ForeignKey('courier.id', ondelete='CASCADE'), nullable=False)
+    route_id = db.Column(db.Integer, nullable=False)  # No foreign key; the route is gone
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<RouteTombstone Courier:{self.courier_id} Route:{self.route_id}>"
+
+class LocationUpdateReceipt(db.Model):
+    """Idempotency key of a location update already applied from the mobile app"""
+    __table_args__ = (
+        # Expiring old receipts
+        db.Index('ix_location_update_receipt_processed_at', 'processed_at'),
+    )
+    
+    courier_id = db.Column(db.Integer, db.ForeignKey('courier.id', ondelete='CASCADE'), primary_key=True)
+    idempotency_key = db.Column(db.String(100), primary_key=True)
+    location_id = db.Column(db.Integer, nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<LocationUpdateReceipt {self.courier_id}:{self.idempotency_key}>"
+
+class DailyRouteStats(db.Model):
+    """Per-day rollup of saved and completed routes, maintained incrementally"""
+    day = db.Column(db.Date, primary_key=True)
+    routes_saved = db.Column(db.Integer, nullable=False, default=0)
+    distance_saved = db.Column(db.Float, nullable=False, default=0.0)  # in km
+    stops_saved = db.Column(db.Integer, nullable=False, default=0)
+    routes_completed = db.Column(db.Integer, nullable=False, default=0)
+    distance_completed = db.Column(db.Float, nullable=False, default=0.0)  # in km
+
+    def __repr__(self):
+        return f"<DailyRouteStats {self.day}>"
+
+class MonthlyRouteStats(db.Model):
+    """Per-month rollup of saved and completed routes, maintained incrementally"""
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    routes_saved = db.Column(db.Integer, nullable=False, default=0)
+    distance_saved = db.Column(db.Float, nullable=False, default=0.0)  # in km
+    stops_saved = db.Column(db.Integer, nullable=False, default=0)
+    routes_completed = db.Column(db.Integer, nullable=False, default=0)
+    distance_completed = db.Column(db.Float, nullable=False, default=0.0)  # in km
+
+    def __repr__(self):
+        return f"<MonthlyRouteStats {self.month}>"
+
+class CategoryStats(db.Model):
+    """Number of saved locations per category, maintained incrementally"""
+    category = db.Column(db.String(50), primary_key=True)
+    location_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CategoryStats {self.category}: {self.location_count}>"
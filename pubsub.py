@@ -0,0 +1,59 @@
+import queue
+import threading
+
+class Subscription:
+    """
+    A subscriber's mailbox
+
+    Holds at most one pending notification: subscribers re-read the shared
+    state when woken up, so several publishes between two reads coalesce.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+
+    def notify(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            pass
+
+    def get(self, timeout=None):
+        """Wait for the next notification; raises queue.Empty on timeout"""
+        return self._queue.get(timeout=timeout)
+
+class Broker:
+    """Lightweight in-process publish/subscribe keyed by topic"""
+
+    def __init__(self):
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        subscription = Subscription()
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, topic, subscription):
+        with self._lock:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topic, message=None):
+        """Notify all subscribers of a topic; returns the number notified"""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.notify(message)
+        return len(subscribers)
+
+    def subscriber_count(self, topic):
+        with self._lock:
+            return len(self._topics.get(topic, ()))
+
+# Shared per-process broker
+broker = Broker()
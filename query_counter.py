@@ -0,0 +1,97 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_request_context, request
+from sqlalchemy import event
+import config
+
+class QueryCounter:
+    """Count the SQL statements an engine executes while active, on any thread"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """
+    Fail if the enclosed block runs more than `limit` SQL statements
+
+    For checking that a page's query count doesn't grow with the data:
+
+        with app.test_request_context(), assert_max_queries(db.engine, 6):
+            admin_dashboard()
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(
+            f"{counter.count} queries executed, expected at most {limit}:\n" + '\n'.join(counter.statements)
+        )
+
+def query_budget(limit):
+    """
+    Declare the most SQL statements a view may run, whatever the data size
+
+    Checked per request by the hooks from install_query_budget().
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+def install_query_budget(app, engine):
+    """
+    Count the statements of every request and check views' query budgets
+
+    Over-budget requests are logged, or fail when QUERY_BUDGET_ENFORCE is
+    set (meant for development and CI). In debug mode the count is also
+    sent in an X-Query-Count header.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_request_query(conn, cursor, statement, parameters, context, executemany):
+        # Requests run on their own threads, so statements are counted per request context
+        if has_request_context():
+            statements = g.get('query_statements')
+            if statements is not None:
+                statements.append(statement)
+
+    @app.before_request
+    def start_query_count():
+        g.query_statements = []
+
+    @app.after_request
+    def check_query_budget(response):
+        statements = g.get('query_statements')
+        if statements is None:
+            return response
+
+        if app.debug:
+            response.headers['X-Query-Count'] = str(len(statements))
+
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        if limit is not None and len(statements) > limit:
+            message = f"{request.endpoint} ran {len(statements)} queries, budget is {limit}"
+            if config.QUERY_BUDGET_ENFORCE:
+                raise AssertionError(message + ':\n' + '\n'.join(statements))
+            logging.warning(message)
+        return response
@@ -0,0 +1,148 @@
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import config
+from route_optimizer import geocode_address
+
+def _normalize_stop(address):
+    """Case- and whitespace-insensitive form of a stop address"""
+    address = re.sub(r'\s*,\s*', ', ', address)
+    return re.sub(r'\s+', ' ', address).strip().lower()
+
+def traffic_bucket(departure_time=None, include_traffic=True):
+    """
+    Time bucket whose traffic an optimization result is valid for
+
+    Routes planned without traffic don't depend on the time at all.
+    """
+    if not include_traffic:
+        return None
+    timestamp = departure_time.timestamp() if departure_time else time.time()
+    return int(timestamp // (config.RESULT_CACHE_TRAFFIC_BUCKET_MINUTES * 60))
+
+def optimization_key(addresses, start_location=None, include_traffic=True, departure_time=None, stop_service_times=None):
+    """
+    Canonical hash of everything an optimization result depends on
+
+    Args:
+        addresses: Stop addresses in the order they were entered
+        start_location: Optional starting location [lon, lat]; the cached
+            route starts there, so it is matched exactly
+        include_traffic: Whether traffic is applied to the route
+        departure_time: Optional planned departure datetime
+        stop_service_times: Optional seconds spent at each stop
+    """
+    payload = json.dumps({
+        'stops': [_normalize_stop(address) for address in addresses],
+        'start': [float(value) for value in start_location] if start_location else None,
+        'traffic': bool(include_traffic),
+        'departure': departure_time.isoformat() if departure_time else None,
+        'bucket': traffic_bucket(departure_time, include_traffic),
+        'service': list(stop_service_times or [])
+    }, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class OptimizationCache:
+    """
+    Size-bounded LRU cache of complete optimization results
+
+    Results are copied in and out, as views go on to modify the route data.
+    Also used for geocoding results.
+    """
+
+    def __init__(self, max_entries, name='Optimization'):
+        self.max_entries = max_entries
+        self.name = name
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+        if result is not None:
+            logging.debug(f"{self.name} cache hit ({self.hits} hits, {self.misses} misses)")
+            return copy.deepcopy(result)
+        return None
+
+    def put(self, key, result):
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """Counters for monitoring the cache's effectiveness"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._results),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared per-process cache
+optimization_cache = OptimizationCache(config.RESULT_CACHE_MAX_ENTRIES)
+
+# Geocoding results by normalized address, shared by the views and route imports
+geocode_cache = OptimizationCache(config.GEOCODE_CACHE_MAX_ENTRIES, name='Geocode')
+
+def cached_geocode(address):
+    """geocode_address through the geocode cache; failed lookups are not cached"""
+    key = _normalize_stop(address)
+    result = geocode_cache.get(key)
+    if result is None:
+        result = geocode_address(address)
+        if result:
+            geocode_cache.put(key, result)
+    return result
+
+# Threads geocoding cache misses; shared so their pooled HTTP sessions are
+# reused, and usable whether or not the caller runs an event loop
+_geocode_pool = ThreadPoolExecutor(max_workers=config.GEOCODE_CONCURRENCY, thread_name_prefix='geocode')
+
+def cached_geocode_many(addresses):
+    """
+    Geocode many addresses, from the cache where possible and concurrently otherwise
+
+    Returns:
+        Dictionary of address -> geocoding result, or None where it failed
+    """
+    results = {}
+    missing = []
+    for address in dict.fromkeys(addresses):
+        result = geocode_cache.get(_normalize_stop(address))
+        if result is None:
+            missing.append(address)
+        else:
+            results[address] = result
+
+    if missing:
+        for address, result in zip(missing, _geocode_pool.map(geocode_address, missing)):
+            results[address] = result
+            if result:
+                geocode_cache.put(_normalize_stop(address), result)
+    return results
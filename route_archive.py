@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import config
+from geometry import segment_coordinates
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking on this platform
+    fcntl = None
+
+# Coordinates are stored as int32 microdegrees, exact for polyline precision 5 and 6
+COORDINATE_SCALE = 1e6
+
+# One record per archived route; offsets index into the stops, legs and points files
+ROUTE_DTYPE = np.dtype([
+    ('route_id', '<i8'),
+    ('created_at', '<f8'),  # Unix timestamp; naive datetimes are taken as UTC
+    ('total_distance', '<f4'),  # km
+    ('total_duration', '<f4'),  # seconds
+    ('stop_offset', '<i8'),
+    ('stop_count', '<i4'),
+    ('leg_offset', '<i8'),
+    ('leg_count', '<i4')
+])
+
+# One record per leg; points index into the points file
+LEG_DTYPE = np.dtype([
+    ('distance', '<f4'),  # km
+    ('duration', '<f4'),  # seconds, including traffic delay
+    ('base_duration', '<f4'),  # seconds, without traffic
+    ('traffic_delay', '<f4'),
+    ('traffic_level', 'i1'),
+    ('routed', 'u1'),  # 0 for straight-line fallback legs
+    ('point_offset', '<i8'),
+    ('point_count', '<i4')
+])
+
+COORDINATE_DTYPE = np.dtype(('<i4', (2,)))  # lon, lat
+
+# File name and record type of each column file in a month directory
+ARCHIVE_FILES = {
+    'routes': ('routes.bin', ROUTE_DTYPE),
+    'stops': ('stops.bin', COORDINATE_DTYPE),
+    'legs': ('legs.bin', LEG_DTYPE),
+    'points': ('points.bin', COORDINATE_DTYPE)
+}
+
+_write_lock = threading.Lock()
+
+def _month_dir(created_at, base_dir=None):
+    base_dir = base_dir or config.ROUTE_ARCHIVE_DIR
+    if not base_dir:
+        raise ValueError("ROUTE_ARCHIVE_DIR is not set")
+    return os.path.join(base_dir, created_at.strftime('%Y-%m'))
+
+def _to_fixed(points):
+    return np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * COORDINATE_SCALE).astype('<i4')
+
+def archive_route(route_id, created_at, route_data, base_dir=None):
+    """
+    Append a saved route to the archive of the month it was created in
+
+    Args:
+        route_id: Database id of the route
+        created_at: Creation datetime of the route
+        route_data: Route dictionary as stored in the session, with route_details
+        base_dir: Archive directory, config.ROUTE_ARCHIVE_DIR by default
+    """
+    segments = route_data.get('route_details', {}).get('segments', [])
+    stops = _to_fixed(route_data['coordinates'])
+
+    legs = np.zeros(len(segments), dtype=LEG_DTYPE)
+    leg_points = []
+    for i, segment in enumerate(segments):
+        points = _to_fixed(segment_coordinates(segment))
+        leg_points.append(points)
+        legs[i] = (
+            segment.get('distance', 0), segment.get('duration', 0), segment.get('base_duration', 0),
+            segment.get('traffic_delay', 0), segment.get('traffic_level', 0),
+            segment.get('traffic_color') != 'gray', 0, len(points)
+        )
+    points = np.concatenate(leg_points) if leg_points else np.zeros((0, 2), dtype='<i4')
+
+    month_dir = _month_dir(created_at, base_dir)
+    os.makedirs(month_dir, exist_ok=True)
+
+    with _write_lock, open(os.path.join(month_dir, '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        def count(name):
+            filename, dtype = ARCHIVE_FILES[name]
+            path = os.path.join(month_dir, filename)
+            return os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+
+        point_offset = count('points')
+        if len(legs):
+            legs['point_offset'] = point_offset + np.concatenate(([0], np.cumsum(legs['point_count'])[:-1]))
+
+        record = np.zeros(1, dtype=ROUTE_DTYPE)
+        record[0] = (
+            route_id, created_at.replace(tzinfo=created_at.tzinfo or timezone.utc).timestamp(),
+            float(route_data.get('total_distance') or 0),
+            float(route_data.get('total_duration_seconds') or 0),
+            count('stops'), len(stops), count('legs'), len(legs)
+        )
+
+        # The route record goes last, so readers never see one whose data is missing
+        for name, data in (('stops', stops), ('legs', legs), ('points', points), ('routes', record)):
+            with open(os.path.join(month_dir, ARCHIVE_FILES[name][0]), 'ab') as f:
+                data.tofile(f)
+
+class ArchiveMonth:
+    """
+    Read-only, memory-mapped view of one month of archived routes
+
+    Columns are exposed as NumPy arrays (routes, stops, legs, points), so
+    scans over months of routes only touch the pages they read.
+    """
+
+    def __init__(self, month_dir):
+        self.month_dir = month_dir
+        for name, (filename, dtype) in ARCHIVE_FILES.items():
+            path = os.path.join(month_dir, filename)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size < dtype.itemsize:
+                column = np.zeros((0,) + dtype.shape, dtype=dtype.base)
+            else:
+                column = np.memmap(path, dtype=dtype, mode='r', shape=(size // dtype.itemsize,))
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def stop_coordinates(self, index):
+        """[lon, lat] stops of the route at the given record index"""
+        record = self.routes[index]
+        stops = self.stops[record['stop_offset']:record['stop_offset'] + record['stop_count']]
+        return stops / COORDINATE_SCALE
+
+    def route_legs(self, index):
+        """Leg records of the route at the given record index"""
+        record = self.routes[index]
+        return self.legs[record['leg_offset']:record['leg_offset'] + record['leg_count']]
+
+    def leg_geometry(self, leg):
+        """[lon, lat] points of a leg record"""
+        return self.points[leg['point_offset']:leg['point_offset'] + leg['point_count']] / COORDINATE_SCALE
+
+def iter_archive_months(start=None, end=None, base_dir=None):
+    """
+    Yield (month, ArchiveMonth) for archived months, oldest first
+
+    Args:
+        start, end: Optional 'YYYY-MM' bounds, both inclusive
+    """
+    base_dir = base_dir or config.ROUTE_ARCHIVE_DIR
+    if not os.path.isdir(base_dir):
+        return
+
+    for month in sorted(os.listdir(base_dir)):
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            continue
+        if (start and month < start) or (end and month > end):
+            continue
+        yield month, ArchiveMonth(os.path.join(base_dir, month))
+
+def archive_saved_route(route_id, created_at, route_data):
+    """Archive a route saved from the session; failures are logged, not raised"""
+    if not config.ROUTE_ARCHIVE_ENABLED:
+        return
+    try:
+        archive_route(route_id, created_at, route_data)
+    except Exception as e:
+        logging.error(f"Error archiving route {route_id}: {str(e)}")
@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+from datetime import datetime
+from xml.sax.saxutils import XMLGenerator
+from xml.sax.xmlreader import AttributesImpl
+from geometry import segment_coordinates
+import config
+
+class XMLStreamWriter:
+    """
+    Incremental XML writer
+
+    Elements are written into a small buffer which the caller drains and
+    yields, so a document of any size is produced in bounded memory.
+    """
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._xml = XMLGenerator(self._buffer, encoding='utf-8', short_empty_elements=True)
+        self._xml.startDocument()
+
+    def start(self, name, attrs=None):
+        self._xml.startElement(name, AttributesImpl({key: str(value) for key, value in (attrs or {}).items()}))
+
+    def end(self, name):
+        self._xml.endElement(name)
+
+    def element(self, name, text='', attrs=None):
+        self.start(name, attrs)
+        if text:
+            self._xml.characters(str(text))
+        self.end(name)
+
+    def characters(self, text):
+        self._xml.characters(text)
+
+    def newline(self, indent=0):
+        self._xml.ignorableWhitespace('\n' + '  ' * indent)
+
+    def drain(self):
+        """Return everything written since the last drain"""
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+def route_stops(route_data):
+    """
+    Yield (index, address, [lon, lat], details) for each stop of a route
+
+    The last stop is skipped when it is only the return to the start.
+    """
+    addresses = route_data.get('addresses', [])
+    location_details = route_data.get('location_details') or []
+    for i, address in enumerate(addresses):
+        if i == len(addresses) - 1 and i > 0 and address == addresses[0]:
+            continue
+        details = location_details[i] if i < len(location_details) else {}
+        yield i, address, route_data['coordinates'][i], details
+
+def route_tracks(route_data):
+    """Yield the [lon, lat] points of each segment, decoding one segment at a time"""
+    for segment in route_data.get('route_details', {}).get('segments', []):
+        yield segment_coordinates(segment)
+
+def _chunks(points, size=None):
+    size = size or config.EXPORT_CHUNK_POINTS
+    for start in range(0, len(points), size):
+        yield points[start:start + size]
+
+def csv_stream(route_data, timestamp):
+    """Generate a CSV list of the stops of a route followed by a short summary"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(['Stop', 'Address', 'Coordinates', 'Category', 'Time Window'])
+    for i, address, coords, details in route_stops(route_data):
+        time_window = f"{details.get('time_window_start', '')} - {details.get('time_window_end', '')}" if details.get('time_window_start') else ''
+        writer.writerow([
+            i + 1,
+            address,
+            f"{coords[1]},{coords[0]}",  # Lat, Lon format
+            details.get('category', 'home'),
+            time_window
+        ])
+        yield drain()
+
+    # Add route summary
+    writer.writerow([])
+    writer.writerow(['Total Distance', f"{route_data.get('total_distance', 0)} km"])
+    writer.writerow(['Estimated Time', route_data.get('total_time', '')])
+    if route_data.get('traffic_delay_text'):
+        writer.writerow(['Traffic Info', route_data.get('traffic_delay_text', '')])
+    yield drain()
+
+def gpx_stream(route_data, timestamp):
+    """Generate a GPX 1.1 document for a route"""
+    xml = XMLStreamWriter()
+    xml.start('gpx', {'version': '1.1', 'creator': 'CourierNavigator', 'xmlns': 'http://www.topografix.com/GPX/1/1'})
+
+    xml.newline(1)
+    xml.start('metadata')
+    xml.newline(2)
+    xml.element('name', f'Courier Route {timestamp}')
+    xml.newline(2)
+    xml.element('time', datetime.now().isoformat())
+    xml.newline(1)
+    xml.end('metadata')
+
+    # Stops as route points
+    xml.newline(1)
+    xml.start('rte')
+    xml.newline(2)
+    xml.element('name', f'Route {timestamp}')
+    for i, address, coords, details in route_stops(route_data):
+        xml.newline(2)
+        xml.start('rtept', {'lat': coords[1], 'lon': coords[0]})
+        xml.newline(3)
+        xml.element('name', f'Stop {i + 1}: {address}')
+        if details.get('category'):
+            xml.newline(3)
+            xml.element('type', details['category'])
+        xml.newline(2)
+        xml.end('rtept')
+    xml.newline(1)
+    xml.end('rte')
+    yield xml.drain()
+
+    # Detailed geometry as a track with one segment per leg
+    if route_data.get('route_details', {}).get('segments'):
+        xml.newline(1)
+        xml.start('trk')
+        xml.newline(2)
+        xml.element('name', f'Detailed Route {timestamp}')
+        for points in route_tracks(route_data):
+            xml.newline(2)
+            xml.start('trkseg')
+            for chunk in _chunks(points):
+                for point in chunk:
+                    xml.newline(3)
+                    xml.element('trkpt', attrs={'lat': point[1], 'lon': point[0]})
+                yield xml.drain()
+            xml.newline(2)
+            xml.end('trkseg')
+        xml.newline(1)
+        xml.end('trk')
+
+    xml.newline()
+    xml.end('gpx')
+    xml.newline()
+    yield xml.drain()
+
+def kml_stream(route_data, timestamp):
+    """Generate a KML 2.2 document for a route"""
+    xml = XMLStreamWriter()
+    xml.start('kml', {'xmlns': 'http://www.opengis.net/kml/2.2'})
+    xml.newline(1)
+    xml.start('Document')
+    xml.newline(2)
+    xml.element('name', f'Courier Route {timestamp}')
+
+    for i, address, coords, details in route_stops(route_data):
+        xml.newline(2)
+        xml.start('Placemark')
+        xml.newline(3)
+        xml.element('name', f'Stop {i + 1}: {address}')
+        if details.get('category'):
+            xml.newline(3)
+            xml.element('description', details['category'])
+        xml.newline(3)
+        xml.start('Point')
+        xml.element('coordinates', f'{coords[0]},{coords[1]}')
+        xml.end('Point')
+        xml.newline(2)
+        xml.end('Placemark')
+    yield xml.drain()
+
+    if route_data.get('route_details', {}).get('segments'):
+        xml.newline(2)
+        xml.start('Placemark')
+        xml.newline(3)
+        xml.element('name', f'Detailed Route {timestamp}')
+        xml.newline(3)
+        xml.start('MultiGeometry')
+        for points in route_tracks(route_data):
+            xml.newline(4)
+            xml.start('LineString')
+            xml.start('coordinates')
+            for chunk in _chunks(points):
+                xml.characters(' '.join(f'{point[0]},{point[1]}' for point in chunk) + ' ')
+                yield xml.drain()
+            xml.end('coordinates')
+            xml.end('LineString')
+        xml.newline(3)
+        xml.end('MultiGeometry')
+        xml.newline(2)
+        xml.end('Placemark')
+
+    xml.newline(1)
+    xml.end('Document')
+    xml.newline()
+    xml.end('kml')
+    xml.newline()
+    yield xml.drain()
+
+def geojson_stream(route_data, timestamp):
+    """Generate a GeoJSON FeatureCollection with the stops and one line per leg"""
+    yield '{"type":"FeatureCollection","name":%s,"features":[' % json.dumps(f'Courier Route {timestamp}')
+
+    separator = ''
+    for i, address, coords, details in route_stops(route_data):
+        feature = {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [coords[0], coords[1]]},
+            'properties': {'stop': i + 1, 'address': address, 'category': details.get('category')}
+        }
+        yield separator + json.dumps(feature, separators=(',', ':'))
+        separator = ','
+
+    segments = route_data.get('route_details', {}).get('segments', [])
+    for segment, points in zip(segments, route_tracks(route_data)):
+        properties = {
+            'start_idx': segment.get('start_idx'),
+            'end_idx': segment.get('end_idx'),
+            'distance': segment.get('distance'),
+            'duration': segment.get('duration'),
+            'traffic_level': segment.get('traffic_level')
+        }
+        yield separator + '{"type":"Feature","properties":%s,"geometry":{"type":"LineString","coordinates":[' % (
+            json.dumps(properties, separators=(',', ':'))
+        )
+        separator = ','
+
+        point_separator = ''
+        for chunk in _chunks(points):
+            yield point_separator + ','.join(f'[{point[0]},{point[1]}]' for point in chunk)
+            point_separator = ','
+        yield ']}}'
+
+    yield ']}\n'
+
+# Streamed export formats: generator, mimetype and file extension
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv', 'csv'),
+    'gpx': (gpx_stream, 'application/gpx+xml', 'gpx'),
+    'kml': (kml_stream, 'application/vnd.google-earth.kml+xml', 'kml'),
+    'geojson': (geojson_stream, 'application/geo+json', 'geojson')
+}
@@ -0,0 +1,239 @@
+import csv
+import datetime
+import json
+from sqlalchemy import insert
+import config
+from analytics_rollups import record_routes_saved
+from geometry import pack_coordinates
+from result_cache import cached_geocode_many
+from route_optimizer import calculate_distance
+
+# Stop fields read from import files, besides the route name
+STOP_FIELDS = ('address', 'street', 'number', 'city', 'category', 'time_window_start', 'time_window_end',
+               'estimated_duration', 'latitude', 'longitude')
+
+def _time(value):
+    """Parse an 'HH:MM' time window bound, None if empty or malformed"""
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').time() if value else None
+    except (TypeError, ValueError):
+        return None
+
+def _duration(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 10
+
+def _parse_address(address):
+    """Split a 'Street Number, City' address into its parts"""
+    parts = address.split(',')
+    if len(parts) < 2:
+        return {'street': address, 'number': '', 'city': 'Unknown'}
+    street_parts = parts[0].strip().split(' ')
+    if len(street_parts) >= 2:
+        street, number = ' '.join(street_parts[:-1]), street_parts[-1]
+    else:
+        street, number = parts[0].strip(), ''
+    return {'street': street, 'number': number, 'city': parts[1].strip()}
+
+def route_row(name, coordinates, total_distance, total_time):
+    """Route insert row; coordinates are [lon, lat] points"""
+    return {
+        'name': name,
+        'created_at': datetime.datetime.utcnow(),
+        'total_distance': float(total_distance),
+        'total_time': total_time,
+        'coordinates_json': json.dumps(coordinates),
+        'coordinates_blob': pack_coordinates(coordinates)
+    }
+
+def location_row(position, address, detail=None, coordinates=None):
+    """
+    Location insert row for a stop
+
+    Args:
+        position: Order of the stop in the route
+        address: Formatted address of the stop
+        detail: Stop details as kept in session routes (city, street, number,
+            category, time window strings, longitude, latitude); without them
+            street and city are parsed from the address
+        coordinates: [lon, lat] of the stop, used when there are no details
+    """
+    if detail:
+        row = {
+            'city': detail.get('city', ''),
+            'street': detail.get('street', ''),
+            'number': detail.get('number', ''),
+            'category': detail.get('category') or 'home',
+            'longitude': detail.get('longitude'),
+            'latitude': detail.get('latitude'),
+            'time_window_start': _time(detail.get('time_window_start')),
+            'time_window_end': _time(detail.get('time_window_end')),
+            'estimated_duration': _duration(detail.get('estimated_duration', 10))
+        }
+    else:
+        row = dict(_parse_address(address), category='home', longitude=coordinates[0], latitude=coordinates[1],
+                   time_window_start=None, time_window_end=None, estimated_duration=10)
+    row.update(formatted_address=address, position=position)
+    return row
+
+def insert_routes(session, routes):
+    """
+    Bulk insert routes with their stops, in the caller's transaction
+
+    The routes are also counted in the analytics rollups.
+
+    Args:
+        routes: List of (route_row(), [location_row(), ...]) pairs
+
+    Returns:
+        Ids of the new routes, in the order given
+    """
+    from models import Route, Location
+
+    if not routes:
+        return []
+    route_ids = session.scalars(
+        insert(Route).returning(Route.id, sort_by_parameter_order=True), [row for row, _ in routes]
+    ).all()
+
+    location_rows = [dict(location, route_id=route_id)
+                     for route_id, (_, locations) in zip(route_ids, routes) for location in locations]
+    if location_rows:
+        session.execute(insert(Location), location_rows)
+
+    record_routes_saved(session, [
+        (row['created_at'], row['total_distance'], [location['category'] for location in locations])
+        for row, locations in routes
+    ])
+    return route_ids
+
+def _stop(record):
+    """Stop details, shaped like those of session routes, from a CSV row or NDJSON object"""
+    stop = {field: record.get(field) for field in STOP_FIELDS}
+    if not stop['address']:
+        street = f"{stop['street'] or ''} {stop['number'] or ''}".strip()
+        stop['address'] = f"{street}, {stop['city']}" if stop['city'] else street
+    if not stop['address']:
+        raise ValueError("Stop has no address")
+    if not (stop['street'] and stop['city']):
+        stop.update(_parse_address(stop['address']))
+
+    # Stops are geocoded unless both coordinates are given
+    if stop['latitude'] in (None, '') or stop['longitude'] in (None, ''):
+        stop['latitude'] = stop['longitude'] = None
+    else:
+        stop['latitude'], stop['longitude'] = float(stop['latitude']), float(stop['longitude'])
+    return stop
+
+def read_csv(stream):
+    """
+    Yield (line, route) for a CSV file with one stop per row
+
+    Consecutive rows with the same 'route' column make up a route, in
+    order; line is that of its first row.
+    """
+    reader = csv.DictReader(stream)
+    route, line = None, None
+    for row in reader:
+        name = row.get('route') or ''
+        if route is not None and name != route['name']:
+            yield line, route
+            route = None
+        if route is None:
+            route, line = {'name': name, 'stops': []}, reader.line_num
+        route['stops'].append(row)
+    if route is not None:
+        yield line, route
+
+def read_ndjson(stream):
+    """
+    Yield (line, route) for a file with one JSON route per line
+
+    Routes look like {"name": ..., "total_time": ..., "stops": [{...}, ...]};
+    lines that aren't valid JSON are yielded as the ValueError.
+    """
+    for line, text in enumerate(stream, 1):
+        if text.strip():
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, e
+
+IMPORT_FORMATS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+def _insert_batch(session, batch, errors):
+    """Geocode the stops of a batch of routes that lack coordinates, then insert them"""
+    geocoded = cached_geocode_many([
+        stop['address'] for _, _, _, stops in batch for stop in stops if stop['longitude'] is None
+    ])
+
+    routes = []
+    for line, name, total_time, stops in batch:
+        try:
+            for stop in stops:
+                if stop['longitude'] is None:
+                    result = geocoded.get(stop['address'])
+                    if not result:
+                        raise ValueError(f"Could not geocode address: {stop['address']}")
+                    stop['longitude'], stop['latitude'] = result['coordinates']
+                    stop['formatted_address'] = result['formatted_address']
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+
+        coordinates = [[stop['longitude'], stop['latitude']] for stop in stops]
+        total_distance = round(sum(calculate_distance(a, b) for a, b in zip(coordinates, coordinates[1:])), 1)
+        routes.append((
+            route_row(name, coordinates, total_distance, total_time),
+            [location_row(i, stop.get('formatted_address') or stop['address'], stop) for i, stop in enumerate(stops)]
+        ))
+
+    insert_routes(session, routes)
+    session.commit()
+    return len(routes), sum(len(locations) for _, locations in routes)
+
+def import_routes(session, stream, file_format):
+    """
+    Import routes from a CSV or NDJSON text stream, in batches
+
+    Stops keep the order of the file. Stops without latitude and longitude
+    are geocoded. Routes are inserted with bulk INSERTs and committed every
+    IMPORT_BATCH_STOPS stops, so an import that fails part way keeps the
+    batches before. Imported routes are not optimized; their distance is
+    the straight-line length.
+
+    Returns:
+        Dictionary with the numbers of routes and stops imported and the
+        (line, message) errors of routes that were skipped
+    """
+    batch, batch_stops = [], 0
+    imported = {'routes': 0, 'stops': 0}
+    errors = []
+
+    def flush():
+        routes, stops = _insert_batch(session, batch, errors)
+        imported['routes'] += routes
+        imported['stops'] += stops
+
+    for line, route in IMPORT_FORMATS[file_format](stream):
+        try:
+            if isinstance(route, Exception):
+                raise route
+            stops = [_stop(stop) for stop in route.get('stops') or []]
+            if not stops:
+                raise ValueError("Route has no stops")
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append((line, str(e)))
+            continue
+
+        batch.append((line, route.get('name') or '', route.get('total_time') or '', stops))
+        batch_stops += len(stops)
+        if batch_stops >= config.IMPORT_BATCH_STOPS:
+            flush()
+            batch, batch_stops = [], 0
+    if batch:
+        flush()
+
+    return dict(imported, errors=sorted(errors))
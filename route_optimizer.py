@@ -1,12 +1,76 @@
 import requests
+import httpx
+import asyncio
+import weakref
 import logging
 import json
 import math
+import threading
 import time
-import random
-from itertools import permutations
+from itertools import permutations, accumulate
 import config
 from datetime import datetime
+from traffic_model import traffic_model, TRAFFIC_COLORS
+from geometry import encode_geometry, segment_endpoints, simplified_levels
+
+# Pooled HTTP sessions for the blocking provider calls, so consecutive
+# requests to OpenRouteService/OpenWeatherMap reuse TCP/TLS connections.
+# requests.Session isn't thread-safe, so each worker thread gets its own.
+_thread_local = threading.local()
+
+def _http_session():
+    """Return the pooled HTTP session of the current thread"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    return session
+
+# One pooled async client per event loop (httpx clients are bound to the loop
+# they were first used on)
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    """Return the pooled async HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=config.ASYNC_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=config.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.ASYNC_HTTP_MAX_KEEPALIVE
+            )
+        )
+        _async_clients[loop] = client
+    return client
+
+async def close_async_client():
+    """Close the pooled async HTTP client of the running event loop"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _ors_headers():
+    """Headers for OpenRouteService POST endpoints"""
+    return {
+        'Authorization': config.OPENROUTE_API_KEY,
+        'Content-Type': 'application/json; charset=utf-8',
+        'Accept': 'application/json, application/geo+json, application/gpx+xml'
+    }
+
+def _parse_geocode_response(data, address):
+    """Extract coordinates and label from a geocoding response"""
+    if data['features'] and len(data['features']) > 0:
+        # Extract coordinates [longitude, latitude]
+        coords = data['features'][0]['geometry']['coordinates']
+        formatted_address = data['features'][0]['properties'].get('label', address)
+        return {
+            'coordinates': coords,
+            'formatted_address': formatted_address
+        }
+    else:
+        logging.error(f"No results found for address: {address}")
+        return None
 
 def geocode_address(address):
     """Convert address to coordinates using OpenRouteService Geocoding API"""
@@ -16,44 +80,64 @@ def geocode_address(address):
             'text': address
         }
 
-        response = requests.get(config.OPENROUTE_GEOCODE_URL, params=params)
+        response = _http_session().get(config.OPENROUTE_GEOCODE_URL, params=params)
         response.raise_for_status()
 
-        data = response.json()
-        if data['features'] and len(data['features']) > 0:
-            # Extract coordinates [longitude, latitude]
-            coords = data['features'][0]['geometry']['coordinates']
-            formatted_address = data['features'][0]['properties'].get('label', address)
-            return {
-                'coordinates': coords,
-                'formatted_address': formatted_address
-            }
-        else:
-            logging.error(f"No results found for address: {address}")
-            return None
+        return _parse_geocode_response(response.json(), address)
     except Exception as e:
         logging.error(f"Error geocoding address {address}: {str(e)}")
         return None
 
+async def geocode_address_async(address):
+    """Async counterpart of geocode_address"""
+    try:
+        params = {
+            'api_key': config.OPENROUTE_API_KEY,
+            'text': address
+        }
+
+        response = await get_async_client().get(config.OPENROUTE_GEOCODE_URL, params=params)
+        response.raise_for_status()
+
+        return _parse_geocode_response(response.json(), address)
+    except Exception as e:
+        logging.error(f"Error geocoding address {address}: {str(e)}")
+        return None
+
+def _matrix_request_body(coordinates):
+    """Request body for the OpenRouteService matrix endpoint"""
+    return {
+        'locations': coordinates,
+        'metrics': ['distance', 'duration'],
+        'units': 'km'
+    }
+
 def get_distance_matrix(coordinates):
     """Get distance and duration matrix between all points using OpenRouteService API"""
     try:
-        headers = {
-            'Authorization': config.OPENROUTE_API_KEY,
-            'Content-Type': 'application/json; charset=utf-8',
-            'Accept': 'application/json, application/geo+json, application/gpx+xml'
-        }
+        response = _http_session().post(
+            config.OPENROUTE_MATRIX_URL,
+            headers=_ors_headers(),
+            json=_matrix_request_body(coordinates)
+        )
+        response.raise_for_status()
 
-        body = {
-            'locations': coordinates,
-            'metrics': ['distance', 'duration'],
-            'units': 'km'
+        data = response.json()
+        return {
+            'durations': data['durations'],
+            'distances': data['distances']
         }
+    except Exception as e:
+        logging.error(f"Error getting distance matrix: {str(e)}")
+        return None
 
-        response = requests.post(
+async def get_distance_matrix_async(coordinates):
+    """Async counterpart of get_distance_matrix"""
+    try:
+        response = await get_async_client().post(
             config.OPENROUTE_MATRIX_URL,
-            headers=headers,
-            json=body
+            headers=_ors_headers(),
+            json=_matrix_request_body(coordinates)
         )
         response.raise_for_status()
 
@@ -66,16 +150,52 @@ def get_distance_matrix(coordinates):
         logging.error(f"Error getting distance matrix: {str(e)}")
         return None
 
-def optimize_route(coordinates, start_location=None):
+def parse_departure_time(value):
+    """
+    Parse a departure time from a form/query value
+
+    Accepts ISO datetimes ("2025-04-06T07:30") or a time of day ("07:30",
+    meaning today). Returns None for empty or invalid values.
+    """
+    if not value:
+        return None
+    try:
+        if 'T' in value or '-' in value:
+            parsed = datetime.fromisoformat(value)
+            # Work in naive local time like the rest of the traffic model
+            return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+        return datetime.combine(datetime.now().date(), datetime.strptime(value, '%H:%M').time())
+    except ValueError:
+        logging.error(f"Invalid departure time: {value}")
+        return None
+
+def service_times(location_details):
+    """Seconds spent at each stop, from its estimated_duration in minutes (10 if missing or invalid)"""
+    times = []
+    for detail in location_details:
+        try:
+            minutes = int(detail.get('estimated_duration'))
+        except (TypeError, ValueError):
+            minutes = 10
+        times.append(max(minutes, 0) * 60)
+    return times
+
+def optimize_route(coordinates, start_location=None, departure_time=None, stop_service_times=None):
     """
     Optimize route using current location as starting point
     Args:
         coordinates: List of destination coordinates
         start_location: Optional starting location coordinates [lon, lat]
+        departure_time: Optional datetime of departure; when given, every leg is
+            costed at the time it is actually driven using a time-dependent matrix
+        stop_service_times: Optional seconds spent at each destination, which
+            push back the time the following legs are driven
     """
+    stop_service_times = list(stop_service_times or [0] * len(coordinates))
     if start_location:
         # Add current location as first point
         coordinates.insert(0, start_location)
+        stop_service_times.insert(0, 0)
     try:
         if len(coordinates) <= 1:
             return coordinates, 0, 0
@@ -89,45 +209,51 @@ def optimize_route(coordinates, start_location=None):
         durations = matrix['durations']
         distances = matrix['distances']
 
+        if departure_time:
+            td_matrix = traffic_model.time_dependent_matrix(coordinates, durations, distances, departure_time)
+
+            def route_duration(route):
+                return td_matrix.route_duration(route, stop_service_times)
+
+            leg_duration = td_matrix.travel_time
+        else:
+            def route_duration(route):
+                return stop_service_times[route[0]] + sum(durations[from_idx][to_idx] + stop_service_times[to_idx]
+                                                          for from_idx, to_idx in zip(route, route[1:]))
+
+            def leg_duration(from_idx, to_idx, elapsed):
+                return durations[from_idx][to_idx]
+
         # Keep points in original order since they represent a logical sequence
-        if len(coordinates) <= 8:
+        if len(coordinates) <= config.OPTIMIZE_EXHAUSTIVE_MAX_STOPS:
             # Create route keeping original order but optimizing start point
-            start = 0
             route_indices = list(range(len(coordinates)))
             best_route_indices = route_indices
 
             # Calculate total duration for this route
-            total_duration = 0
-            for i in range(len(route_indices) - 1):
-                from_idx = route_indices[i]
-                to_idx = route_indices[i + 1]
-                total_duration += durations[from_idx][to_idx]
-            min_duration = total_duration
-
-            # Iterate through all possible starting points
-            for start in range(len(coordinates)):
-                for route in permutations(route_indices):
-                    if route[0] == start:
-                        # Calculate total duration for this route
-                        total_duration = 0
-                        for i in range(len(route) - 1):
-                            from_idx = route[i]
-                            to_idx = route[i + 1]
-                            total_duration += durations[from_idx][to_idx]
-
-                        if total_duration < min_duration:
-                            min_duration = total_duration
-                            best_route_indices = route
+            min_duration = route_duration(route_indices)
+
+            # Every ordering, and so every starting point, is tried once
+            for route in permutations(route_indices):
+                # Calculate total duration for this route
+                total_duration = route_duration(route)
+
+                if total_duration < min_duration:
+                    min_duration = total_duration
+                    best_route_indices = route
         else:
             # For larger sets, use a greedy nearest neighbor approach
             start = 0
             current = start
+            elapsed = 0
             route_indices = [current]
             unvisited = set(range(1, len(coordinates)))
 
             while unvisited:
-                # Find nearest unvisited location
-                nearest = min(unvisited, key=lambda x: durations[current][x])
+                # Find nearest unvisited location at the time we would leave for it
+                elapsed += stop_service_times[current]
+                nearest = min(unvisited, key=lambda x: leg_duration(current, x, elapsed))
+                elapsed += leg_duration(current, nearest, elapsed)
                 route_indices.append(nearest)
                 unvisited.remove(nearest)
                 current = nearest
@@ -137,11 +263,7 @@ def optimize_route(coordinates, start_location=None):
             best_route_indices = route_indices
 
             # Calculate total duration
-            min_duration = 0
-            for i in range(len(best_route_indices) - 1):
-                from_idx = best_route_indices[i]
-                to_idx = best_route_indices[i + 1]
-                min_duration += durations[from_idx][to_idx]
+            min_duration = route_duration(best_route_indices)
 
         # Convert route indices to coordinates
         optimized_route = [coordinates[i] for i in best_route_indices]
@@ -167,94 +289,141 @@ def optimize_route(coordinates, start_location=None):
         logging.error(f"Error optimizing route: {str(e)}")
         return None, 0, 0
 
+def _parse_weather_response(data):
+    """Extract relevant weather information from an OpenWeatherMap response"""
+    # Extract relevant weather information
+    weather_data = {
+        'condition': data['weather'][0]['main'],
+        'description': data['weather'][0]['description'],
+        'icon': data['weather'][0]['icon'],
+        'temp': round(data['main']['temp']),
+        'feels_like': round(data['main']['feels_like']),
+        'humidity': data['main']['humidity'],
+        'wind_speed': data['wind']['speed'],
+        'location_name': data['name'],
+        'updated_at': datetime.now().strftime('%H:%M'),
+        'icon_url': f"https://openweathermap.org/img/wn/{data['weather'][0]['icon']}@2x.png"
+    }
+
+    # Add weather alerts if available
+    if 'alerts' in data:
+        weather_data['alerts'] = [{
+            'event': alert['event'],
+            'description': alert['description'],
+            'start': datetime.fromtimestamp(alert['start']).strftime('%Y-%m-%d %H:%M'),
+            'end': datetime.fromtimestamp(alert['end']).strftime('%Y-%m-%d %H:%M')
+        } for alert in data['alerts']]
+    else:
+        weather_data['alerts'] = []
+
+    return weather_data
+
+def _weather_params(coords):
+    """Query parameters for the OpenWeatherMap current weather endpoint"""
+    # Convert coordinates from [longitude, latitude] to [latitude, longitude]
+    lat = coords[1]
+    lon = coords[0]
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'appid': config.WEATHER_API_KEY,
+        'units': 'metric'  # Use metric units (Celsius, km/h)
+    }
+
 def get_weather(coords):
     """Get current weather conditions for a location using OpenWeatherMap API"""
     try:
-        # Convert coordinates from [longitude, latitude] to [latitude, longitude]
-        lat = coords[1]
-        lon = coords[0]
-
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'appid': config.WEATHER_API_KEY,
-            'units': 'metric'  # Use metric units (Celsius, km/h)
-        }
-
-        response = requests.get(config.WEATHER_API_URL, params=params)
+        response = _http_session().get(config.WEATHER_API_URL, params=_weather_params(coords))
         response.raise_for_status()
 
-        data = response.json()
+        return _parse_weather_response(response.json())
+    except Exception as e:
+        logging.error(f"Error fetching weather data: {str(e)}")
+        return None
 
-        # Extract relevant weather information
-        weather_data = {
-            'condition': data['weather'][0]['main'],
-            'description': data['weather'][0]['description'],
-            'icon': data['weather'][0]['icon'],
-            'temp': round(data['main']['temp']),
-            'feels_like': round(data['main']['feels_like']),
-            'humidity': data['main']['humidity'],
-            'wind_speed': data['wind']['speed'],
-            'location_name': data['name'],
-            'updated_at': datetime.now().strftime('%H:%M'),
-            'icon_url': f"https://openweathermap.org/img/wn/{data['weather'][0]['icon']}@2x.png"
-        }
+def _wants_weather(i, coordinates):
+    """
+    Whether to look up the weather at the end of leg i
 
-        # Add weather alerts if available
-        if 'alerts' in data:
-            weather_data['alerts'] = [{
-                'event': alert['event'],
-                'description': alert['description'],
-                'start': datetime.fromtimestamp(alert['start']).strftime('%Y-%m-%d %H:%M'),
-                'end': datetime.fromtimestamp(alert['end']).strftime('%Y-%m-%d %H:%M')
-            } for alert in data['alerts']]
-        else:
-            weather_data['alerts'] = []
+    Only when OpenWeatherMap is configured, and never for the return to start.
+    """
+    return bool(config.WEATHER_API_KEY) and i < len(coordinates) - 2
+
+def without_weather(route_details):
+    """Copy of route details with the weather of each segment left out"""
+    return dict(route_details, segments=[dict(segment, weather=None)
+                                         for segment in route_details.get('segments', [])])
+
+def attach_weather(route_details, coordinates):
+    """Look up the current weather at the end of each segment of a route, in place"""
+    for segment in route_details.get('segments', []):
+        i = segment['start_idx']
+        segment['weather'] = get_weather(coordinates[i + 1]) if _wants_weather(i, coordinates) else None
+    return route_details
+
+async def get_weather_async(coords):
+    """Async counterpart of get_weather"""
+    try:
+        response = await get_async_client().get(config.WEATHER_API_URL, params=_weather_params(coords))
+        response.raise_for_status()
 
-        return weather_data
+        return _parse_weather_response(response.json())
     except Exception as e:
         logging.error(f"Error fetching weather data: {str(e)}")
         return None
 
-def simulate_traffic_conditions(start, end):
+def simulate_traffic_conditions(start, end, distance_km=0, base_duration=0, when=None):
     """
-    Simulates traffic conditions based on time of day and location
+    Estimates traffic conditions for a leg from the time-dependent traffic model
     This is a placeholder for real traffic API data
 
     Returns:
         Integer traffic level (0-3)
         0 = Free flowing, 1 = Light traffic, 2 = Moderate traffic, 3 = Heavy traffic
     """
-    # Get current hour (0-23)
-    current_hour = datetime.now().hour
-
-    # Base probability based on time of day
-    if 7 <= current_hour <= 9:  # Morning rush hour
-        base_probability = 0.7
-    elif 16 <= current_hour <= 19:  # Evening rush hour
-        base_probability = 0.8
-    elif 10 <= current_hour <= 15:  # Midday
-        base_probability = 0.3
-    elif 20 <= current_hour <= 23:  # Evening
-        base_probability = 0.2
-    else:  # Late night/early morning
-        base_probability = 0.1
-
-    # Add some randomness
-    random_factor = random.random() * 0.3 - 0.15  # -0.15 to +0.15
-
-    # Calculate final probability
-    probability = base_probability + random_factor
-
-    # Determine traffic level based on probability
-    if probability < 0.2:
-        return 0  # Free flowing
-    elif probability < 0.5:
-        return 1  # Light traffic
-    elif probability < 0.8:
-        return 2  # Moderate traffic
-    else:
-        return 3  # Heavy traffic
+    _, levels = traffic_model.evaluate_legs([start], [end], [distance_km], [base_duration], when)
+    return int(levels[0])
+
+def apply_traffic_conditions(segments, include_traffic=True, when=None, time_dependent=False):
+    """
+    Apply the traffic model to all routed segments in one vectorized pass
+
+    Sets traffic level, color, delay and adjusted duration on each segment.
+    Straight-line fallback segments are left untouched.
+
+    Args:
+        when: Departure time (default: now)
+        time_dependent: Evaluate each leg at the time it is reached instead of
+            at departure; entry times come from the cumulative durations, so a
+            second pass refines them with the congested durations of the first
+    """
+    routed = [segment for segment in segments if segment['traffic_color'] != 'gray']
+    if not routed:
+        return segments
+
+    endpoints = [segment_endpoints(segment) for segment in routed]
+    starts = [start for start, _ in endpoints]
+    ends = [end for _, end in endpoints]
+    distances = [segment['distance'] for segment in routed]
+    base_durations = [segment['base_duration'] for segment in routed]
+
+    leg_durations = base_durations
+    for _ in range(2 if time_dependent else 1):
+        offsets = [0] + list(accumulate(leg_durations))[:-1] if time_dependent else None
+        factors, levels = traffic_model.evaluate_legs(starts, ends, distances, base_durations, when, offsets)
+        leg_durations = (factors * base_durations).tolist()
+
+    for segment, factor, level in zip(routed, factors.tolist(), levels.tolist()):
+        base_duration = segment['base_duration']
+        traffic_delay = round(base_duration * (factor - 1), 1) if include_traffic else 0
+
+        segment['traffic_level'] = level
+        segment['traffic_color'] = TRAFFIC_COLORS[level]
+        segment['traffic_delay'] = traffic_delay
+        segment['duration'] = base_duration + traffic_delay
+
+    return segments
 
 def calculate_distance(point1, point2):
     """Calculate straight-line distance between two points in km"""
@@ -276,50 +445,155 @@ def calculate_distance(point1, point2):
 
     return distance
 
-import time
+def _directions_request_body(start, end):
+    """Request body for a single leg of the OpenRouteService Directions API"""
+    return {
+        "coordinates": [[start[0], start[1]], [end[0], end[1]]],
+        "instructions": True,
+        "format": "geojson"
+    }
 
-def get_route_details(coordinates, include_traffic=True, retry_count=3, retry_delay=1):
+def _build_route_segment(i, start, end, route_data, weather_data):
+    """
+    Build a route segment from a Directions API response
+
+    Returns:
+        Segment dictionary, or None if the response contains no route
+    """
+    if 'features' not in route_data or len(route_data['features']) == 0:
+        return None
+
+    feature = route_data['features'][0]
+    properties = feature['properties']
+    geometry = feature['geometry']
+
+    # Traffic fields are filled in by apply_traffic_conditions once all legs are known
+    base_duration = properties['summary']['duration']
+
+    segment = {
+        'start_idx': i,
+        'end_idx': i + 1,
+        'distance': properties['summary']['distance'] / 1000,  # Convert to km
+        'duration': base_duration,  # seconds, including traffic delay
+        'base_duration': base_duration,  # seconds, without traffic
+        'traffic_delay': 0,  # seconds of delay due to traffic
+        'traffic_level': 0,  # 0-3 scale
+        'traffic_color': TRAFFIC_COLORS[0],  # Color to use when displaying on map
+        'start': start,
+        'end': end,
+        'geometry': encode_geometry(geometry['coordinates']),  # encoded polyline
+        'geometry_precision': config.POLYLINE_PRECISION,
+        'simplified': simplified_levels(geometry['coordinates']),  # encoded polylines per zoom level
+        'weather': weather_data
+    }
+
+    # Get maneuver instructions if available
+    instructions = []
+    if 'segments' in properties:
+        for segment_data in properties['segments']:
+            for step in segment_data['steps']:
+                instructions.append({
+                    'instruction': step['instruction'],
+                    'distance': step['distance'],
+                    'duration': step['duration']
+                })
+    segment['instructions'] = instructions
+
+    return segment
+
+def _fallback_segment(i, start, end):
+    """Straight-line segment used when a leg can't be routed"""
+    return {
+        'start_idx': i,
+        'end_idx': i + 1,
+        'distance': calculate_distance(start, end),
+        'duration': 0,  # Cannot determine duration
+        'base_duration': 0,
+        'traffic_delay': 0,
+        'traffic_level': 0,
+        'traffic_color': 'gray',
+        'start': start,
+        'end': end,
+        'geometry': encode_geometry([start, end]),
+        'geometry_precision': config.POLYLINE_PRECISION,
+        'instructions': [],
+        'weather': None
+    }
+
+def summarize_route(route_segments, include_traffic):
+    """Aggregate route segments into the route details dictionary"""
+    total_distance = 0
+    total_duration = 0
+    traffic_conditions = []
+    traffic_delay_seconds = 0
+
+    for segment in route_segments:
+        # Straight-line fallbacks carry no routing data and are left out of the totals
+        if segment['traffic_color'] == 'gray':
+            continue
+
+        total_distance += segment['distance']
+        total_duration += segment['duration']
+        traffic_delay_seconds += segment['traffic_delay']
+        traffic_conditions.append({
+            'segment': segment['start_idx'],
+            'level': segment['traffic_level'],
+            'color': segment['traffic_color'],
+            'delay_seconds': segment['traffic_delay']
+        })
+
+    # Format total_duration as a string (e.g., "2h 30m")
+    hours = int(total_duration / 3600)
+    minutes = int((total_duration % 3600) / 60)
+    formatted_duration = ''
+    if hours > 0:
+        formatted_duration += f"{hours}h "
+    formatted_duration += f"{minutes}m"
+
+    # Format traffic delay as a string
+    delay_minutes = int(traffic_delay_seconds / 60)
+    traffic_delay_text = f"+{delay_minutes}m due to traffic" if delay_minutes > 0 else "No delays"
+
+    return {
+        'segments': route_segments,
+        'total_distance': round(total_distance, 2),
+        'total_duration': formatted_duration,
+        'total_duration_seconds': total_duration,
+        'base_duration_seconds': total_duration - traffic_delay_seconds,
+        'traffic_delay_seconds': traffic_delay_seconds,
+        'traffic_delay_text': traffic_delay_text,
+        'traffic_conditions': traffic_conditions,
+        'has_traffic_data': include_traffic,
+        'timestamp': int(time.time())
+    }
+
+def get_route_details(coordinates, include_traffic=True, retry_count=3, retry_delay=1, departure_time=None):
     """
     Get detailed route information between consecutive points with rate limit handling
 
     Args:
         coordinates: List of longitude/latitude pairs
         include_traffic: Whether to include real-time traffic data (default: True)
+        departure_time: Optional datetime of departure; traffic on each leg is
+            then evaluated at the time that leg is reached
 
     Returns:
         Dictionary with route segments, total distance, and duration
     """
     route_segments = []
-    total_distance = 0
-    total_duration = 0
-    traffic_conditions = []
-    traffic_delay_seconds = 0
 
     # Calculate route between each consecutive point
     for i in range(len(coordinates) - 1):
         start = coordinates[i]
         end = coordinates[i + 1]
 
-        # Call OpenRouteService Directions API
-        headers = {
-            'Authorization': config.OPENROUTE_API_KEY,
-            'Content-Type': 'application/json; charset=utf-8'
-        }
-
-        # Base parameters
-        body = {
-            "coordinates": [[start[0], start[1]], [end[0], end[1]]],
-            "instructions": True,
-            "format": "geojson"
-        }
-
         try:
             # Add retry logic for rate limiting
             for attempt in range(retry_count):
-                response = requests.post(
+                response = _http_session().post(
                     config.OPENROUTE_DIRECTIONS_URL,
-                    json=body, 
-                    headers=headers
+                    json=_directions_request_body(start, end),
+                    headers=_ors_headers()
                 )
 
                 if response.status_code == 429:  # Too Many Requests
@@ -331,178 +605,109 @@ def get_route_details(coordinates, include_traffic=True, retry_count=3, retry_de
                 route_data = response.json()
                 break
 
-            # Extract route details
-            if 'features' in route_data and len(route_data['features']) > 0:
-                feature = route_data['features'][0]
-                properties = feature['properties']
-                geometry = feature['geometry']
-
-                # Extract traffic conditions if available
-                # This is where you would parse traffic info from the API response
-                # For demonstration, we'll simulate traffic conditions
-                traffic_level = simulate_traffic_conditions(start, end)
-
-                # Calculate simulated delay based on traffic level
-                # In a real implementation, this would come from the API
-                base_duration = properties['summary']['duration']
-                if include_traffic and traffic_level > 0:
-                    # Add delay based on traffic level (0-3)
-                    delay_factor = [0, 0.15, 0.3, 0.6][traffic_level]
-                    traffic_delay = base_duration * delay_factor
-                else:
-                    traffic_delay = 0
-
-                # Store the adjusted duration
-                adjusted_duration = base_duration + traffic_delay
-
-                # Set the color based on traffic level
-                if traffic_level == 0:
-                    traffic_color = 'green'  # Free flowing
-                elif traffic_level == 1:
-                    traffic_color = 'yellow'  # Light traffic
-                elif traffic_level == 2:
-                    traffic_color = 'orange'  # Moderate traffic
-                else:
-                    traffic_color = 'red'     # Heavy traffic
-
-                # Get weather data for each destination point
-                weather_data = None
-                if i < len(coordinates) - 2:  # Don't get weather for the return to start
-                    weather_data = get_weather(end)
-
-                segment = {
-                    'start_idx': i,
-                    'end_idx': i + 1,
-                    'distance': properties['summary']['distance'] / 1000,  # Convert to km
-                    'duration': adjusted_duration,  # seconds, including traffic delay
-                    'base_duration': base_duration,  # seconds, without traffic
-                    'traffic_delay': traffic_delay,  # seconds of delay due to traffic
-                    'traffic_level': traffic_level,  # 0-3 scale
-                    'traffic_color': traffic_color,  # Color to use when displaying on map
-                    'geometry': geometry['coordinates'],
-                    'weather': weather_data
-                }
-
-                # Get maneuver instructions if available
-                instructions = []
-                if 'segments' in properties:
-                    for segment_data in properties['segments']:
-                        for step in segment_data['steps']:
-                            instructions.append({
-                                'instruction': step['instruction'],
-                                'distance': step['distance'],
-                                'duration': step['duration']
-                            })
-                segment['instructions'] = instructions
-
-                total_distance += segment['distance']
-                total_duration += segment['duration']
-                traffic_delay_seconds += traffic_delay
-                traffic_conditions.append({
-                    'segment': i,
-                    'level': traffic_level,
-                    'color': traffic_color,
-                    'delay_seconds': traffic_delay
-                })
+            # Get weather data for each destination point
+            weather_data = get_weather(end) if _wants_weather(i, coordinates) else None
+
+            segment = _build_route_segment(i, start, end, route_data, weather_data)
+            if segment:
                 route_segments.append(segment)
         except Exception as e:
             logging.error(f"Error fetching route details: {str(e)}")
             # Fall back to a simple straight line if route can't be calculated
-            segment = {
-                'start_idx': i,
-                'end_idx': i + 1,
-                'distance': calculate_distance(start, end),
-                'duration': 0,  # Cannot determine duration
-                'base_duration': 0,
-                'traffic_delay': 0,
-                'traffic_level': 0,
-                'traffic_color': 'gray',
-                'geometry': [[start[0], start[1]], [end[0], end[1]]],
-                'instructions': [],
-                'weather': None
-            }
-            route_segments.append(segment)
+            route_segments.append(_fallback_segment(i, start, end))
 
-    # Format total_duration as a string (e.g., "2h 30m")
-    hours = int(total_duration / 3600)
-    minutes = int((total_duration % 3600) / 60)
-    formatted_duration = ''
-    if hours > 0:
-        formatted_duration += f"{hours}h "
-    formatted_duration += f"{minutes}m"
+    apply_traffic_conditions(route_segments, include_traffic, departure_time, time_dependent=departure_time is not None)
+    return summarize_route(route_segments, include_traffic)
 
-    # Format traffic delay as a string
-    delay_minutes = int(traffic_delay_seconds / 60)
-    traffic_delay_text = f"+{delay_minutes}m due to traffic" if delay_minutes > 0 else "No delays"
+async def _fetch_route_segment_async(i, coordinates, retry_count, retry_delay, semaphore):
+    """Fetch directions and weather for one leg concurrently"""
+    start = coordinates[i]
+    end = coordinates[i + 1]
+    client = get_async_client()
 
-    return {
-        'segments': route_segments,
-        'total_distance': round(total_distance, 2),
-        'total_duration': formatted_duration,
-        'total_duration_seconds': total_duration,
-        'base_duration_seconds': total_duration - traffic_delay_seconds,
-        'traffic_delay_seconds': traffic_delay_seconds,
-        'traffic_delay_text': traffic_delay_text,
-        'traffic_conditions': traffic_conditions,
-        'has_traffic_data': include_traffic,
-        'timestamp': int(time.time())
-    }
+    try:
+        async with semaphore:
+            # Add retry logic for rate limiting
+            for attempt in range(retry_count):
+                response = await client.post(
+                    config.OPENROUTE_DIRECTIONS_URL,
+                    json=_directions_request_body(start, end),
+                    headers=_ors_headers()
+                )
 
-def check_for_traffic_updates(route_data, threshold_percent=15):
+                if response.status_code == 429:  # Too Many Requests
+                    if attempt < retry_count - 1:
+                        await asyncio.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+                        continue
+
+                response.raise_for_status()
+                route_data = response.json()
+                break
+
+        # Get weather data for each destination point
+        weather_data = await get_weather_async(end) if _wants_weather(i, coordinates) else None
+
+        return _build_route_segment(i, start, end, route_data, weather_data)
+    except Exception as e:
+        logging.error(f"Error fetching route details: {str(e)}")
+        # Fall back to a simple straight line if route can't be calculated
+        return _fallback_segment(i, start, end)
+
+async def get_route_details_async(coordinates, include_traffic=True, retry_count=3, retry_delay=1, departure_time=None):
     """
-    Check if traffic conditions have changed significantly since route was created
+    Async counterpart of get_route_details
+
+    All legs (and their weather lookups) are requested concurrently over the
+    pooled client, bounded by config.ASYNC_DIRECTIONS_CONCURRENCY so we stay
+    within the OpenRouteService rate limit.
+    """
+    semaphore = asyncio.Semaphore(config.ASYNC_DIRECTIONS_CONCURRENCY)
+    segments = await asyncio.gather(*[
+        _fetch_route_segment_async(i, coordinates, retry_count, retry_delay, semaphore)
+        for i in range(len(coordinates) - 1)
+    ])
+
+    route_segments = [segment for segment in segments if segment]
+    apply_traffic_conditions(route_segments, include_traffic, departure_time, time_dependent=departure_time is not None)
+    return summarize_route(route_segments, include_traffic)
+
+async def get_leg_segments_async(legs, retry_count=3, retry_delay=1):
+    """
+    Fetch directions for independent legs concurrently
+
+    No weather lookups are made and no traffic is applied; callers run
+    apply_traffic_conditions on the assembled route.
 
     Args:
-        route_data: The original route data
-        threshold_percent: Percentage change threshold to trigger update
+        legs: List of (start, end) coordinate pairs
 
     Returns:
-        Dictionary with update status and new route data if needed
+        List of segments (or None where the leg has no route), in the order of legs
     """
-    # If no timestamp or over 10 minutes old, always update
-    if 'timestamp' not in route_data or time.time() - route_data.get('timestamp', 0) > 600:
-        # Make sure we have coordinates to work with
-        if 'coordinates' not in route_data:
-            return {
-                'needs_update': False,
-                'reason': 'No coordinates available to check for updates'
-            }
-
-        new_route = get_route_details(route_data['coordinates'])
-        return {
-            'needs_update': True,
-            'reason': 'Route information is outdated',
-            'new_route': new_route
-        }
+    semaphore = asyncio.Semaphore(config.ASYNC_DIRECTIONS_CONCURRENCY)
+    return await asyncio.gather(*[
+        _fetch_route_segment_async(0, [start, end], retry_count, retry_delay, semaphore)
+        for start, end in legs
+    ])
 
-    # Check each segment for traffic changes
-    if 'route_details' in route_data and 'segments' in route_data['route_details']:
-        segments = route_data['route_details']['segments']
-        coordinates = [segment['geometry'][0] for segment in segments]
-    else:
-        # If we don't have detailed segment information, use the original coordinates
-        if 'coordinates' not in route_data:
-            return {
-                'needs_update': False,
-                'reason': 'No route details available to check for updates'
-            }
-        coordinates = route_data['coordinates']
-        updated_route = get_route_details(coordinates)
-        return {
-            'needs_update': True,
-            'reason': 'Route information needs to be refreshed',
-            'new_route': updated_route
-        }
+def compare_route_traffic(segments, new_segments, threshold_percent=15):
+    """
+    Compare per-segment durations of two versions of the same route
 
-    # Get current traffic conditions
-    updated_route = get_route_details(coordinates)
+    Args:
+        segments: Previously known route segments
+        new_segments: Freshly fetched segments for the same legs
+        threshold_percent: Percentage change threshold to flag an update
 
+    Returns:
+        Dictionary with update status, reason and per-segment changes
+    """
     # Compare segment durations
     duration_changes = []
     max_change_percent = 0
     changed_segment_idx = -1
 
-    for i, (old_segment, new_segment) in enumerate(zip(segments, updated_route['segments'])):
+    for i, (old_segment, new_segment) in enumerate(zip(segments, new_segments)):
         if 'duration' not in old_segment or 'duration' not in new_segment:
             continue
 
@@ -531,7 +736,7 @@ def check_for_traffic_updates(route_data, threshold_percent=15):
 
     if needs_update and changed_segment_idx >= 0:
         old_segment = segments[changed_segment_idx] 
-        new_segment = updated_route['segments'][changed_segment_idx]
+        new_segment = new_segments[changed_segment_idx]
 
         # Get the location names for better context
         from_location = f"point {changed_segment_idx + 1}"
@@ -557,6 +762,58 @@ def check_for_traffic_updates(route_data, threshold_percent=15):
         'reason': reason,
         'max_change_percent': max_change_percent,
         'changed_segment': changed_segment_idx if needs_update else -1,
-        'duration_changes': duration_changes,
-        'new_route': updated_route if needs_update else None
-    }
\ No newline at end of file
+        'duration_changes': duration_changes
+    }
+
+def check_for_traffic_updates(route_data, threshold_percent=15):
+    """
+    Check if traffic conditions have changed significantly since route was created
+
+    Args:
+        route_data: The original route data
+        threshold_percent: Percentage change threshold to trigger update
+
+    Returns:
+        Dictionary with update status and new route data if needed
+    """
+    # If no timestamp or over 10 minutes old, always update
+    if 'timestamp' not in route_data or time.time() - route_data.get('timestamp', 0) > 600:
+        # Make sure we have coordinates to work with
+        if 'coordinates' not in route_data:
+            return {
+                'needs_update': False,
+                'reason': 'No coordinates available to check for updates'
+            }
+
+        new_route = get_route_details(route_data['coordinates'])
+        return {
+            'needs_update': True,
+            'reason': 'Route information is outdated',
+            'new_route': new_route
+        }
+
+    # Check each segment for traffic changes
+    if 'route_details' in route_data and 'segments' in route_data['route_details']:
+        segments = route_data['route_details']['segments']
+        coordinates = [segment_endpoints(segment)[0] for segment in segments]
+    else:
+        # If we don't have detailed segment information, use the original coordinates
+        if 'coordinates' not in route_data:
+            return {
+                'needs_update': False,
+                'reason': 'No route details available to check for updates'
+            }
+        coordinates = route_data['coordinates']
+        updated_route = get_route_details(coordinates)
+        return {
+            'needs_update': True,
+            'reason': 'Route information needs to be refreshed',
+            'new_route': updated_route
+        }
+
+    # Get current traffic conditions
+    updated_route = get_route_details(coordinates)
+
+    comparison = compare_route_traffic(segments, updated_route['segments'], threshold_percent)
+    comparison['new_route'] = updated_route if comparison['needs_update'] else None
+    return comparison
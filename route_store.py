@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from flask import session
+import config
+
+class MemoryRouteStore:
+    """In-process route store with LRU eviction and expiry (single worker only)"""
+
+    def __init__(self, max_routes, ttl):
+        self.max_routes = max_routes
+        self.ttl = ttl
+        self._routes = OrderedDict()  # route id -> (stored_at, route data)
+        self._lock = threading.Lock()
+
+    def save(self, route_id, route_data):
+        with self._lock:
+            self._routes[route_id] = (time.time(), dict(route_data))
+            self._routes.move_to_end(route_id)
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+
+    def load(self, route_id):
+        with self._lock:
+            entry = self._routes.get(route_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._routes[route_id]
+                return None
+            self._routes.move_to_end(route_id)
+            # Views update top-level keys in place; hand out a copy
+            return dict(entry[1])
+
+    def delete(self, route_id):
+        with self._lock:
+            self._routes.pop(route_id, None)
+
+class SQLiteRouteStore:
+    """Route store in a local SQLite file, shared by all workers on the host"""
+
+    def __init__(self, path, max_routes, ttl):
+        self.path = path
+        self.max_routes = max_routes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS routes ('
+                'id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_routes_updated_at ON routes (updated_at)')
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, route_id, route_data):
+        payload = zlib.compress(json.dumps(route_data, separators=(',', ':')).encode('utf-8'))
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO routes (id, data, updated_at) VALUES (?, ?, ?)',
+                (route_id, payload, time.time())
+            )
+
+        # Evict expired and excess routes every now and then rather than on each write
+        self._saves += 1
+        if self._saves % 100 == 0:
+            self.evict()
+
+    def load(self, route_id):
+        row = self._connection().execute(
+            'SELECT data, updated_at FROM routes WHERE id = ?', (route_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def delete(self, route_id):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM routes WHERE id = ?', (route_id,))
+
+    def evict(self):
+        """Remove expired routes and trim the store to max_routes"""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM routes WHERE updated_at < ?', (time.time() - self.ttl,))
+            conn.execute(
+                'DELETE FROM routes WHERE id NOT IN '
+                '(SELECT id FROM routes ORDER BY updated_at DESC LIMIT ?)',
+                (self.max_routes,)
+            )
+
+def create_route_store():
+    """Create the route store configured in config.ROUTE_STORE_BACKEND"""
+    if config.ROUTE_STORE_BACKEND == 'memory':
+        return MemoryRouteStore(config.ROUTE_STORE_MAX_ROUTES, config.ROUTE_STORE_TTL)
+
+    path = config.ROUTE_STORE_PATH or os.path.join(tempfile.gettempdir(), 'courier_routes.sqlite3')
+    return SQLiteRouteStore(path, config.ROUTE_STORE_MAX_ROUTES, config.ROUTE_STORE_TTL)
+
+route_store = create_route_store()
+
+def load_session_route():
+    """
+    Return the route referenced by the current session, or {}
+
+    Routes stored in the cookie by older versions are moved to the store.
+    """
+    legacy_route = session.pop('optimized_route', None)
+    if legacy_route:
+        save_session_route(legacy_route)
+        return legacy_route
+
+    route_id = session.get('route_id')
+    if not route_id:
+        return {}
+
+    route_data = route_store.load(route_id)
+    if route_data is None:
+        logging.debug(f"Route {route_id} is no longer in the route store")
+        session.pop('route_id', None)
+        return {}
+    return route_data
+
+def save_session_route(route_data, new_route=False):
+    """
+    Store a route server-side and keep only its id in the session
+
+    Args:
+        route_data: Route dictionary to store
+        new_route: Give the route a fresh id instead of updating the current one
+    """
+    route_id = session.get('route_id')
+    if new_route or not route_id:
+        route_id = uuid.uuid4().hex
+        session['route_id'] = route_id
+
+    route_store.save(route_id, route_data)
+    return route_id
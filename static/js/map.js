@@ -3,6 +3,14 @@ let markers = [];
 let routePolylines = [];
 let trafficUpdateTimer;
 let lastTrafficUpdateTime = 0;
+let currentRouteData = null;
+let routeVersion = 0;
+let trafficStream = null;
+let routeGeometryZoom = null;
+let geometryRequestPending = false;
+
+// Zoom level to request geometry for before the route's bounds are known
+const DEFAULT_ROUTE_ZOOM = 12;
 
 // Get current location before form submission
 document.getElementById('route-form').addEventListener('submit', function(e) {
@@ -97,11 +105,57 @@ function initMap() {
         locateControl.addTo(map);
     }
     
+    // Fetch more detailed geometry when zooming in past what the route was simplified for
+    map.on('zoomend', refreshRouteGeometry);
+    
     // Set up automatic traffic updates
     setupTrafficUpdates();
 }
 
+function routeUrl(path, params = {}) {
+    // Ask the server for geometry simplified for the current zoom level
+    const zoom = map ? map.getZoom() : DEFAULT_ROUTE_ZOOM;
+    const query = new URLSearchParams(Object.assign({zoom: currentRouteData ? zoom : DEFAULT_ROUTE_ZOOM}, params));
+    return `${path}?${query}`;
+}
+
+function refreshRouteGeometry() {
+    if (!currentRouteData || routeGeometryZoom === null || map.getZoom() <= routeGeometryZoom || geometryRequestPending) {
+        return;
+    }
+    
+    geometryRequestPending = true;
+    fetch(routeUrl('/get_route'))
+        .then(response => response.json())
+        .then(data => {
+            if (data && data.coordinates) {
+                // The traffic stream sends geometry for the zoom it was opened with
+                if (trafficStream) {
+                    trafficStream.close();
+                    trafficStream = null;
+                }
+                displayRoute(data, true);
+            }
+        })
+        .catch(error => console.error('Error fetching route geometry:', error))
+        .finally(() => {
+            geometryRequestPending = false;
+        });
+}
+
 function setupTrafficUpdates() {
+    // Browsers with server-sent events get updates pushed (see openTrafficStream)
+    if (window.EventSource) {
+        return;
+    }
+    startTrafficPolling();
+}
+
+function startTrafficPolling() {
+    if (trafficUpdateTimer) {
+        return;
+    }
+    
     // Check for traffic updates every 2 minutes
     trafficUpdateTimer = setInterval(checkTrafficUpdates, 120000);
     
@@ -133,21 +187,111 @@ function checkTrafficUpdates() {
     
     lastTrafficUpdateTime = now;
     
-    // Make AJAX request to get updated route information
-    fetch('/get_route?check_traffic=true')
-        .then(response => response.json())
+    // Ask only for changes since the version we are displaying
+    const url = currentRouteData ? routeUrl('/get_route', {since: routeVersion}) : routeUrl('/get_route');
+    fetch(url)
+        .then(response => response.status === 304 ? null : response.json())
         .then(data => {
-            if (data && data.has_traffic_update) {
+            if (!data) {
+                return; // Nothing changed since our version
+            }
+            
+            if (data.delta) {
+                applyRouteDelta(data);
+            } else if (data.coordinates) {
+                displayRoute(data);
+            }
+            
+            if (data.has_traffic_update) {
                 // Show notification about traffic update
                 showTrafficUpdateNotification(data.traffic_update_reason);
-                
-                // Update the displayed route with new traffic information
-                displayRoute(data);
             }
         })
         .catch(error => console.error('Error checking for traffic updates:', error));
 }
 
+function openTrafficStream() {
+    // One stream per tab, unless the server asked this tab to poll; the
+    // server only writes when traffic actually changes
+    if (!window.EventSource || trafficStream || trafficUpdateTimer) {
+        return;
+    }
+    
+    trafficStream = new EventSource(routeUrl('/route_stream', {since: routeVersion}));
+    
+    trafficStream.addEventListener('traffic', event => {
+        const delta = JSON.parse(event.data);
+        lastTrafficUpdateTime = Date.now();
+        applyRouteDelta(delta);
+        
+        if (delta.has_traffic_update) {
+            showTrafficUpdateNotification(delta.traffic_update_reason);
+        }
+    });
+    
+    trafficStream.addEventListener('reload', () => {
+        // Our version is unknown to the server; fetch the full route again
+        fetch(routeUrl('/get_route'))
+            .then(response => response.json())
+            .then(data => {
+                if (data && data.coordinates) {
+                    displayRoute(data);
+                }
+            })
+            .catch(error => console.error('Error reloading route:', error));
+    });
+    
+    trafficStream.addEventListener('poll', () => {
+        // The server is serving as many streams as it allows; poll instead
+        trafficStream.close();
+        trafficStream = null;
+        startTrafficPolling();
+    });
+    
+    trafficStream.onerror = () => {
+        // No route in the session (404) closes the stream for good
+        if (trafficStream.readyState === EventSource.CLOSED) {
+            trafficStream = null;
+        }
+    };
+}
+
+function applyRouteDelta(delta) {
+    // Merge changed segments and new totals into the displayed route
+    if (!currentRouteData || !currentRouteData.route_details) {
+        return;
+    }
+    
+    const segments = currentRouteData.route_details.segments || [];
+    delta.segments.forEach(changed => {
+        const segment = segments.find(s => s.start_idx === changed.start_idx);
+        if (segment) {
+            Object.assign(segment, changed);
+        } else {
+            segments.push(changed);
+        }
+    });
+    segments.sort((a, b) => a.start_idx - b.start_idx);
+    currentRouteData.route_details.segments = segments;
+    if (currentRouteData.segments) {
+        currentRouteData.segments = segments;
+    }
+    
+    ['total_time', 'total_distance', 'total_duration_seconds', 'traffic_delay_text',
+     'traffic_conditions', 'last_traffic_update', 'traffic_version'].forEach(field => {
+        currentRouteData[field] = delta[field];
+    });
+    currentRouteData.route_details.total_duration = delta.total_time;
+    currentRouteData.route_details.total_duration_seconds = delta.total_duration_seconds;
+    currentRouteData.route_details.traffic_conditions = delta.traffic_conditions;
+    
+    if (delta.segments.length > 0) {
+        displayRoute(currentRouteData);
+    } else {
+        routeVersion = delta.traffic_version;
+    }
+}
+
 function showTrafficUpdateNotification(reason) {
     // Create notification element
     const notification = document.createElement('div');
@@ -191,7 +335,7 @@ function playNotificationSound() {
     }
 }
 
-function displayRoute(routeData) {
+function displayRoute(routeData, keepView = false) {
     // Clear existing markers and polyline
     clearMap();
     
@@ -323,7 +467,9 @@ function displayRoute(routeData) {
         // Draw each segment separately with its traffic color
         for (const segment of routeData.route_details.segments) {
             // Get route data for this segment
-            const segmentPoints = segment.geometry.map(coord => [coord[1], coord[0]]);
+            const segmentPoints = typeof segment.geometry === 'string'
+                ? decodePolyline(segment.geometry, segment.geometry_precision || 5)
+                : segment.geometry.map(coord => [coord[1], coord[0]]);
             
             // Determine color based on traffic level
             let segmentColor = '#0d6efd'; // Default blue
@@ -403,13 +549,21 @@ function displayRoute(routeData) {
         routePolylines.push(routePolyline);
     }
     
-    // Fit the map bounds to show all markers
-    if (routePolylines.length > 0) {
+    // Remember what we display so traffic polls can ask for deltas only
+    currentRouteData = routeData;
+    routeVersion = routeData.traffic_version || 0;
+    routeGeometryZoom = routeData.geometry_zoom === undefined ? null : routeData.geometry_zoom;
+    
+    // Fit the map bounds to show all markers (zooming in may fetch finer geometry)
+    if (routePolylines.length > 0 && !keepView) {
         // Create a feature group with all polylines
         const featureGroup = L.featureGroup(routePolylines);
         map.fitBounds(featureGroup.getBounds(), {
             padding: [50, 50]
         });
+        
+        // fitBounds only fires zoomend when the zoom level changes
+        refreshRouteGeometry();
     }
     
     // Show route summary
@@ -418,10 +572,41 @@ function displayRoute(routeData) {
     // Show the navigation button
     document.getElementById('start-navigation-btn').classList.remove('d-none');
     
+    openTrafficStream();
+    
     // Store route data in session storage for the navigation button
     sessionStorage.setItem('routeData', JSON.stringify(routeData));
 }
 
+function decodePolyline(encoded, precision) {
+    // Decode an encoded polyline into Leaflet [lat, lng] points
+    const factor = Math.pow(10, precision);
+    const points = [];
+    let index = 0;
+    let lat = 0;
+    let lng = 0;
+    
+    while (index < encoded.length) {
+        const deltas = [0, 0];
+        for (let i = 0; i < 2; i++) {
+            let result = 0;
+            let shift = 0;
+            let byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas[i] = (result & 1) ? ~(result >> 1) : (result >> 1);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        points.push([lat / factor, lng / factor]);
+    }
+    
+    return points;
+}
+
 function startNavigation() {
     // Get the route data first
     const routeData = JSON.parse(sessionStorage.getItem('routeData') || '{}');
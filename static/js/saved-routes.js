@@ -0,0 +1,156 @@
+// Lazy loading of saved routes: the page renders the first page, further
+// pages are fetched from /saved_routes as the "Load more" row comes into view.
+// Route pickers (select.saved-routes-select, e.g. on the admin assignment
+// form) get the next page each time they are focused.
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('select.saved-routes-select').forEach(function(select) {
+        select.addEventListener('focus', function() {
+            fetchNextSavedRoutes(select, routes => {
+                routes.forEach(route => select.add(new Option(route.name || `Route ${route.id}`, route.id)));
+            });
+        });
+    });
+
+    document.querySelectorAll('.saved-routes-list').forEach(function(list) {
+        const more = list.parentElement.querySelector('.saved-routes-more');
+        if (!more) {
+            return;
+        }
+        const button = more.querySelector('button');
+        button.addEventListener('click', function() {
+            loadMoreSavedRoutes(list, more);
+        });
+
+        // Load the next page automatically when the button scrolls into view
+        if ('IntersectionObserver' in window) {
+            const observer = new IntersectionObserver(function(entries) {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadMoreSavedRoutes(list, more);
+                }
+            });
+            observer.observe(more);
+        }
+    });
+});
+
+function loadMoreSavedRoutes(list, more) {
+    fetchNextSavedRoutes(list, routes => {
+        routes.forEach(route => {
+            list.appendChild(list.dataset.variant === 'modal' ? savedRouteModalItem(route) : savedRouteCardItem(route));
+        });
+        more.classList.toggle('d-none', !list.dataset.nextCursor);
+    });
+}
+
+// Fetch the page after the element's data-next-cursor, once at a time
+function fetchNextSavedRoutes(element, onRoutes) {
+    const cursor = element.dataset.nextCursor;
+    if (!cursor || element.dataset.loading === 'true') {
+        return;
+    }
+    element.dataset.loading = 'true';
+
+    fetch(`/saved_routes?cursor=${encodeURIComponent(cursor)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            element.dataset.nextCursor = data.next_cursor || '';
+            onRoutes(data.routes);
+        })
+        .catch(error => {
+            console.error('Error loading saved routes:', error);
+        })
+        .finally(() => {
+            element.dataset.loading = 'false';
+        });
+}
+
+function createElement(tag, className, text) {
+    const element = document.createElement(tag);
+    if (className) {
+        element.className = className;
+    }
+    if (text !== undefined) {
+        element.textContent = text;
+    }
+    return element;
+}
+
+function withIcon(element, icon, text) {
+    element.appendChild(createElement('i', icon));
+    element.appendChild(document.createTextNode(text));
+    return element;
+}
+
+function savedRouteActions(route, buttonClass, showLabels) {
+    const group = createElement('div', 'btn-group');
+
+    const load = withIcon(createElement('a', `btn ${buttonClass} btn-secondary`),
+        showLabels ? 'fas fa-sync-alt me-1' : 'fas fa-sync-alt', ' Load');
+    load.href = `/load_route/${route.id}`;
+    group.appendChild(load);
+
+    const form = createElement('form', 'd-inline');
+    form.method = 'post';
+    form.action = `/delete_route/${route.id}`;
+    const remove = createElement('button', `btn ${buttonClass} btn-danger`);
+    remove.type = 'submit';
+    remove.addEventListener('click', function(event) {
+        if (!confirm('Are you sure you want to delete this route?')) {
+            event.preventDefault();
+        }
+    });
+    if (showLabels) {
+        withIcon(remove, 'fas fa-trash-alt me-1', ' Delete');
+    } else {
+        remove.appendChild(createElement('i', 'fas fa-trash-alt'));
+    }
+    form.appendChild(remove);
+    group.appendChild(form);
+    return group;
+}
+
+function formatSavedRouteDate(isoDate) {
+    return isoDate.slice(0, 16).replace('T', ' ');
+}
+
+function savedRouteCardItem(route) {
+    const item = createElement('li', 'list-group-item');
+    const row = createElement('div', 'd-flex justify-content-between align-items-center');
+    const info = document.createElement('div');
+
+    info.appendChild(createElement('h6', 'mb-1', route.name || `Route ${route.id}`));
+    info.appendChild(withIcon(createElement('small', 'text-muted'), 'fas fa-calendar-alt me-1',
+        formatSavedRouteDate(route.created_at)));
+    info.appendChild(document.createElement('br'));
+    const totals = withIcon(createElement('small', 'text-muted'), 'fas fa-road me-1', `${route.total_distance} km, `);
+    withIcon(totals, 'fas fa-clock ms-1 me-1', route.total_time);
+    info.appendChild(totals);
+
+    row.appendChild(info);
+    row.appendChild(savedRouteActions(route, 'btn-sm', false));
+    item.appendChild(row);
+    return item;
+}
+
+function savedRouteModalItem(route) {
+    const item = createElement('div', 'list-group-item bg-dark text-light border-secondary mb-2');
+    const row = createElement('div', 'd-flex justify-content-between align-items-center');
+    const info = document.createElement('div');
+
+    info.appendChild(createElement('h5', 'mb-1', route.name || `Route ${route.id}`));
+    const details = createElement('div', 'd-flex mb-1');
+    details.appendChild(withIcon(createElement('div', 'me-3'), 'fas fa-calendar-alt me-1',
+        formatSavedRouteDate(route.created_at)));
+    details.appendChild(withIcon(createElement('div', 'me-3'), 'fas fa-road me-1', `${route.total_distance} km`));
+    details.appendChild(withIcon(document.createElement('div'), 'fas fa-clock me-1', route.total_time));
+    info.appendChild(details);
+    info.appendChild(createElement('small', 'text-muted', `${route.stop_count} stops`));
+
+    row.appendChild(info);
+    row.appendChild(savedRouteActions(route, '', true));
+    item.appendChild(row);
+    return item;
+}
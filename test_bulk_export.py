@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from bulk_export import saved_route_data
+
+def location(position, street, longitude=None, latitude=None):
+    return SimpleNamespace(position=position, street=street, number='1', city='Bratislava', formatted_address=None,
+                           category='home', time_window_start=None, time_window_end=None,
+                           longitude=longitude, latitude=latitude)
+
+def route(coordinates, locations):
+    return SimpleNamespace(coordinates=coordinates, locations=locations, total_distance=1.0, total_time='1h')
+
+def test_stops_use_their_own_coordinates():
+    # The route starts at the courier's position, which isn't a stop
+    data = saved_route_data(route([[17.0, 48.0], [17.1, 48.1], [17.2, 48.2]],
+                                  [location(1, 'Second', 17.2, 48.2), location(0, 'First', 17.1, 48.1)]))
+
+    assert data['coordinates'] == [[17.1, 48.1], [17.2, 48.2]]
+    assert data['addresses'] == ['First 1, Bratislava', 'Second 1, Bratislava']
+
+def test_route_coordinates_are_used_only_when_they_match_the_stops():
+    locations = [location(0, 'First'), location(1, 'Second', 17.2, 48.2)]
+
+    matching = saved_route_data(route([[17.1, 48.1], [17.9, 48.9]], locations))
+    assert matching['coordinates'] == [[17.1, 48.1], [17.2, 48.2]]
+
+    # Stops without a position are left out rather than given another stop's
+    mismatched = saved_route_data(route([[17.0, 48.0], [17.1, 48.1], [17.2, 48.2]], locations))
+    assert mismatched['coordinates'] == [[17.2, 48.2]]
+    assert mismatched['addresses'] == ['Second 1, Bratislava']
+    assert len(mismatched['location_details']) == 1
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from geometry import (decode_geometry, encode_geometry, pack_coordinates, segment_coordinates, segment_geometry,
+                      simplified_levels, unpack_coordinates)
+
+def assert_points(actual, expected, precision=5):
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=0.5 * 10 ** -precision)
+
+LINE = [[17.10674, 48.14816], [17.10891, 48.14532], [17.11523, 48.14401], [17.12001, 48.14125]]
+
+def test_polyline_round_trip_keeps_lon_lat_order():
+    assert_points(decode_geometry(encode_geometry(LINE)), LINE)
+
+def test_polyline_round_trip_at_precision_6():
+    line = [[17.106741, 48.148163], [17.108912, 48.145327]]
+    encoded = encode_geometry(line, 6)
+
+    assert encoded != encode_geometry(line, 5)
+    assert_points(decode_geometry(encoded, 6), line, 6)
+
+def test_segment_coordinates_decodes_encoded_geometry():
+    segment = {'geometry': encode_geometry(LINE, 6), 'geometry_precision': 6}
+    assert_points(segment_coordinates(segment), LINE, 6)
+
+def test_segment_coordinates_passes_legacy_lists_through():
+    assert segment_coordinates({'geometry': LINE}) is LINE
+    assert segment_coordinates({}) == []
+
+def noisy_line():
+    """A line along which detours of a few metres to a few hundred metres alternate"""
+    rng = np.random.default_rng(1)
+    lon = np.linspace(17.0, 17.2, 200)
+    lat = 48.1 + rng.normal(0, 1, 200) * np.resize([0.00002, 0.0002, 0.002], 200)
+    return np.column_stack((lon, lat)).tolist()
+
+def test_coarser_levels_keep_fewer_points():
+    line = noisy_line()
+    levels = {int(zoom): decode_geometry(encoded) for zoom, encoded in simplified_levels(line).items()}
+
+    assert sorted(levels) == [8, 10, 12, 14]
+    counts = [len(levels[zoom]) for zoom in sorted(levels)]
+    assert counts == sorted(counts) and counts[0] < counts[-1] < len(line)
+    for points in levels.values():
+        assert_points([points[0], points[-1]], [line[0], line[-1]])
+
+def test_straight_line_keeps_only_its_endpoints():
+    levels = simplified_levels([[17.0, 48.0], [17.1, 48.0], [17.2, 48.0]])
+    assert {len(decode_geometry(encoded)) for encoded in levels.values()} == {2}
+
+def test_levels_keeping_every_point_are_left_out():
+    assert simplified_levels([[17.0, 48.0], [17.1, 48.1], [17.2, 48.0]]) == {}
+    assert simplified_levels([[17.0, 48.0], [17.1, 48.0]]) == {}
+
+@pytest.mark.parametrize('zoom, expected', [(None, 'full'), (7, '8'), (8, '8'), (9, '12'), (13, 'full')])
+def test_segment_geometry_uses_finest_level_at_or_above_zoom(zoom, expected):
+    segment = {'geometry': 'full', 'simplified': {'8': '8', '12': '12'}}
+    assert segment_geometry(segment, zoom) == expected
+
+def test_packed_coordinates_round_trip_exactly():
+    packed = pack_coordinates(LINE)
+
+    assert len(packed) == 16 * len(LINE)
+    assert unpack_coordinates(packed) == LINE
+
+def test_packed_coordinates_are_little_endian_lon_lat_pairs():
+    assert pack_coordinates([[1.0, -2.0]]) == bytes.fromhex('000000000000f03f00000000000000c0')
+    assert unpack_coordinates(pack_coordinates([])) == []
@@ -0,0 +1,39 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+import config
+from http_cache import json_response
+
+PAYLOAD = {'segments': ['x' * 100] * 50}
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, 'RESPONSE_COMPRESS_MIN_BYTES', 100)
+    app = Flask(__name__)
+    app.add_url_rule('/route', 'route', lambda: json_response(PAYLOAD))
+    return app.test_client()
+
+def test_each_encoding_has_its_own_etag(client):
+    identity = client.get('/route', headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get('/route', headers={'Accept-Encoding': 'gzip'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.data) == identity.data
+    assert identity.headers['ETag'] != gzipped.headers['ETag']
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+
+def test_conditional_get_matches_the_representation(client):
+    etag = client.get('/route', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+    assert client.get('/route', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+    # A client that can't take gzip must not be told its cached gzip body is current
+    response = client.get('/route', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+def test_small_bodies_are_not_compressed(client, monkeypatch):
+    monkeypatch.setattr(config, 'RESPONSE_COMPRESS_MIN_BYTES', 10 ** 6)
+    response = client.get('/route', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,68 @@
+import asyncio
+import datetime
+
+import result_cache
+from result_cache import OptimizationCache, optimization_key, traffic_bucket
+
+STOPS = ['Obchodná 1, Bratislava', 'Hlavná 5, Košice']
+MONDAY_9 = datetime.datetime(2024, 3, 4, 9, 0, tzinfo=datetime.timezone.utc)
+
+def test_stops_are_case_and_whitespace_insensitive():
+    assert optimization_key(STOPS) == optimization_key(['  obchodná 1 ,Bratislava', 'HLAVNÁ   5,  košice '])
+
+def test_stop_order_matters():
+    assert optimization_key(STOPS) != optimization_key(STOPS[::-1])
+
+def test_start_location_is_matched_exactly():
+    key = optimization_key(STOPS, [17.10674, 48.14816])
+
+    assert optimization_key(STOPS, ['17.10674', '48.14816']) == key
+    assert optimization_key(STOPS, [17.106741, 48.148159]) != key
+    assert optimization_key(STOPS) != key
+
+def test_traffic_and_departure_time_are_part_of_the_key():
+    key = optimization_key(STOPS, departure_time=MONDAY_9)
+
+    assert optimization_key(STOPS, include_traffic=False, departure_time=MONDAY_9) != key
+    assert optimization_key(STOPS, departure_time=MONDAY_9 + datetime.timedelta(hours=1)) != key
+    assert optimization_key(STOPS, departure_time=MONDAY_9) == key
+
+def test_service_times_are_part_of_the_key():
+    assert optimization_key(STOPS, stop_service_times=[600, 600]) != optimization_key(STOPS, stop_service_times=[600, 1200])
+
+def test_routes_without_traffic_have_no_bucket():
+    assert traffic_bucket(MONDAY_9, include_traffic=False) is None
+    assert traffic_bucket(MONDAY_9 + datetime.timedelta(minutes=14)) == traffic_bucket(MONDAY_9)
+    assert traffic_bucket(MONDAY_9 + datetime.timedelta(minutes=15)) == traffic_bucket(MONDAY_9) + 1
+
+def test_cache_copies_results_and_evicts_least_recently_used():
+    cache = OptimizationCache(max_entries=2)
+    result = {'addresses': STOPS}
+    cache.put('a', result)
+    result['addresses'] = []
+    cache.put('b', {})
+    cache.get('a')['addresses'].append('Extra')
+    cache.put('c', {})
+
+    assert cache.get('a') == {'addresses': STOPS}
+    assert cache.get('b') is None
+    assert cache.evictions == 1
+
+def test_geocode_many_skips_cached_addresses_and_runs_inside_event_loops(monkeypatch):
+    geocoded = []
+
+    def geocode_address(address):
+        geocoded.append(address)
+        return None if address == 'Nowhere' else {'coordinates': [17.0, 48.0]}
+
+    monkeypatch.setattr(result_cache, 'geocode_address', geocode_address)
+    monkeypatch.setattr(result_cache, 'geocode_cache', OptimizationCache(max_entries=10))
+    result_cache.cached_geocode_many([STOPS[0]])
+
+    async def from_a_running_loop():
+        return result_cache.cached_geocode_many([STOPS[0], STOPS[1], STOPS[1], 'Nowhere'])
+
+    results = asyncio.run(from_a_running_loop())
+
+    assert results == {STOPS[0]: {'coordinates': [17.0, 48.0]}, STOPS[1]: {'coordinates': [17.0, 48.0]}, 'Nowhere': None}
+    assert sorted(geocoded) == sorted([STOPS[0], STOPS[1], 'Nowhere'])
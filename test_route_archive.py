@@ -0,0 +1,27 @@
+import datetime
+
+import pytest
+
+import config
+import route_archive
+
+ROUTE = {'coordinates': [[17.1, 48.1], [17.2, 48.2]], 'route_details': {'segments': []}}
+
+def test_archive_is_off_without_a_directory(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'ROUTE_ARCHIVE_DIR', '')
+    monkeypatch.setattr(config, 'ROUTE_ARCHIVE_ENABLED', False)
+
+    route_archive.archive_saved_route(1, datetime.datetime(2024, 5, 1), ROUTE)
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(ValueError):
+        route_archive.archive_route(1, datetime.datetime(2024, 5, 1), ROUTE)
+
+def test_archived_routes_are_read_back(tmp_path):
+    route_archive.archive_route(7, datetime.datetime(2024, 5, 1), ROUTE, base_dir=str(tmp_path))
+
+    months = list(route_archive.iter_archive_months(base_dir=str(tmp_path)))
+    assert [month for month, _ in months] == ['2024-05']
+    archive = months[0][1]
+    assert len(archive) == 1
+    assert archive.stop_coordinates(0).tolist() == ROUTE['coordinates']
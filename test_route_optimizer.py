@@ -0,0 +1,103 @@
+import threading
+from datetime import datetime
+from itertools import permutations
+from unittest import mock
+
+import numpy as np
+
+import config
+import route_optimizer
+from route_optimizer import _http_session, _wants_weather
+from traffic_model import TimeDependentMatrix
+
+COORDINATES = [[17.1, 48.1], [17.2, 48.2], [17.1, 48.1]]
+
+def test_each_thread_has_its_own_http_session():
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(_http_session()))
+    thread.start()
+    thread.join()
+
+    assert _http_session() is _http_session()
+    assert sessions[0] is not _http_session()
+
+def test_weather_is_only_fetched_when_configured(monkeypatch):
+    monkeypatch.setattr(config, 'WEATHER_API_KEY', '')
+    assert not _wants_weather(0, COORDINATES)
+
+    monkeypatch.setattr(config, 'WEATHER_API_KEY', 'key')
+    assert _wants_weather(0, COORDINATES)
+    # Never for the return to start
+    assert not _wants_weather(1, COORDINATES)
+
+def directions(start, end):
+    return {'features': [{'geometry': {'coordinates': [start, end]},
+                          'properties': {'summary': {'distance': 1000, 'duration': 60}}}]}
+
+def fake_session():
+    """Session answering every Directions request with a straight leg"""
+    session = mock.Mock()
+    session.post.side_effect = lambda url, json, headers: mock.Mock(
+        status_code=200, json=lambda: directions(*json['coordinates']))
+    return session
+
+def test_route_details_fetch_weather_only_when_configured(monkeypatch):
+    session = fake_session()
+    get_weather = mock.Mock(return_value={'condition': 'Clear'})
+    monkeypatch.setattr(route_optimizer, '_http_session', lambda: session)
+    monkeypatch.setattr(route_optimizer, 'get_weather', get_weather)
+
+    monkeypatch.setattr(config, 'WEATHER_API_KEY', '')
+    details = route_optimizer.get_route_details(COORDINATES, include_traffic=False)
+    assert [segment['weather'] for segment in details['segments']] == [None, None]
+    assert not get_weather.called
+
+    monkeypatch.setattr(config, 'WEATHER_API_KEY', 'key')
+    details = route_optimizer.get_route_details(COORDINATES, include_traffic=False)
+    assert [segment['weather'] for segment in details['segments']] == [{'condition': 'Clear'}, None]
+
+def test_service_time_delays_later_legs(monkeypatch):
+    # Point 2 is cheap to reach in the first hour and very slow after it
+    durations = [[0, 600, 600], [600, 0, 600], [600, 600, 0]]
+    monkeypatch.setattr(route_optimizer, 'get_distance_matrix',
+                        lambda coordinates: {'durations': durations, 'distances': durations})
+    slots = np.array([[[0, 600, 600], [600, 0, 600], [600, 600, 0]],
+                      [[0, 600, 9000], [600, 0, 9000], [9000, 9000, 0]]], dtype=np.float32)
+    monkeypatch.setattr(route_optimizer.traffic_model, 'time_dependent_matrix',
+                        lambda *args: TimeDependentMatrix(slots, 3600))
+    departure = datetime(2024, 5, 6, 8, 0)
+
+    # Without service time every order of the three points is done within the hour
+    route, total_time, _ = route_optimizer.optimize_route([[0, 0], [1, 1], [2, 2]], departure_time=departure)
+    assert route == [[0, 0], [1, 1], [2, 2]] and total_time == '0h 20m'
+
+    # Half an hour at points 0 and 1 would reach point 2 after the hour, so it is visited early
+    route, total_time, _ = route_optimizer.optimize_route([[0, 0], [1, 1], [2, 2]], departure_time=departure,
+                                                          stop_service_times=[1800, 1800, 0])
+    assert route == [[0, 0], [2, 2], [1, 1]]
+    assert total_time == '1h 20m'
+
+def test_exhaustive_search_tries_each_ordering_once(monkeypatch):
+    size = 6
+    durations = [[abs(i - j) for j in range(size)] for i in range(size)]
+    monkeypatch.setattr(route_optimizer, 'get_distance_matrix',
+                        lambda coordinates: {'durations': durations, 'distances': durations})
+    calls = []
+    monkeypatch.setattr(route_optimizer, 'permutations', lambda indices: calls.append(1) or permutations(indices))
+
+    route, _, _ = route_optimizer.optimize_route([[i, i] for i in range(size)])
+    assert route == [[i, i] for i in range(size)]
+    assert len(calls) == 1
+
+def test_cached_routes_get_current_weather(monkeypatch):
+    monkeypatch.setattr(config, 'WEATHER_API_KEY', 'key')
+    monkeypatch.setattr(route_optimizer, 'get_weather', lambda coords: {'location': coords})
+    details = {'segments': [{'start_idx': 0, 'weather': {'condition': 'Snow'}},
+                            {'start_idx': 1, 'weather': None}]}
+
+    cached = route_optimizer.without_weather(details)
+    assert [segment['weather'] for segment in cached['segments']] == [None, None]
+    assert details['segments'][0]['weather'] == {'condition': 'Snow'}
+
+    route_optimizer.attach_weather(cached, COORDINATES)
+    assert [segment['weather'] for segment in cached['segments']] == [{'location': COORDINATES[1]}, None]
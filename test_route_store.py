@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from flask import Flask, session
+
+import route_store
+from route_store import MemoryRouteStore, SQLiteRouteStore, load_session_route, save_session_route
+
+ROUTE = {'addresses': ['Main 1, Bratislava', 'Main 2, Bratislava'], 'coordinates': [[17.1, 48.1], [17.2, 48.2]]}
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryRouteStore(max_routes=10, ttl=60)
+    monkeypatch.setattr(route_store, 'route_store', store)
+    return store
+
+@pytest.fixture
+def request_context():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    with app.test_request_context():
+        yield
+
+def test_legacy_cookie_route_moves_to_the_store(store, request_context):
+    session['optimized_route'] = ROUTE
+
+    assert load_session_route() == ROUTE
+    assert 'optimized_route' not in session
+    assert store.load(session['route_id']) == ROUTE
+    # Later requests read it from the store
+    assert load_session_route() == ROUTE
+
+def test_session_without_route(store, request_context):
+    assert load_session_route() == {}
+
+def test_expired_route_is_dropped_from_the_session(store, request_context):
+    route_id = save_session_route(ROUTE)
+    store.delete(route_id)
+
+    assert load_session_route() == {}
+    assert 'route_id' not in session
+
+def test_new_route_gets_a_fresh_id(store, request_context):
+    route_id = save_session_route(ROUTE)
+
+    assert save_session_route(dict(ROUTE, name='Updated')) == route_id
+    assert save_session_route(ROUTE, new_route=True) != route_id
+    assert store.load(route_id)['name'] == 'Updated'
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryRouteStore(max_routes=2, ttl=60)
+    store.save('a', ROUTE)
+    store.save('b', ROUTE)
+    store.load('a')
+    store.save('c', ROUTE)
+
+    assert store.load('b') is None
+    assert store.load('a') == store.load('c') == ROUTE
+
+def test_sqlite_store_round_trip_and_expiry(tmp_path, monkeypatch):
+    store = SQLiteRouteStore(str(tmp_path / 'routes.sqlite3'), max_routes=10, ttl=60)
+    store.save('a', ROUTE)
+    assert store.load('a') == ROUTE
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert store.load('a') is None
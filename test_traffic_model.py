@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from traffic_model import TrafficModel, ROAD_MOTORWAY, ROAD_ARTERIAL, ROAD_LOCAL, hour_of_week
+
+STARTS = [[17.10, 48.14], [17.12, 48.15], [17.20, 48.20]]
+ENDS = [[17.12, 48.15], [17.20, 48.20], [17.25, 48.22]]
+DISTANCES = [2.0, 8.0, 5.0]  # km
+DURATIONS = [300, 360, 180]  # seconds: 24, 80 and 100 km/h
+RUSH_HOUR = datetime(2024, 5, 6, 8, 0)  # Monday
+
+def test_same_seed_gives_same_results():
+    first = TrafficModel(seed=7).evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, RUSH_HOUR)
+    second = TrafficModel(seed=7).evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, RUSH_HOUR)
+    other_seed = TrafficModel(seed=8).evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, RUSH_HOUR)
+
+    assert np.array_equal(first[0], second[0]) and np.array_equal(first[1], second[1])
+    assert not np.array_equal(first[0], other_seed[0])
+
+def test_unseeded_model_has_no_segment_variation():
+    model = TrafficModel()
+    factors, _ = model.evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, RUSH_HOUR)
+    expected = model.congestion_factors(model.road_classes(DISTANCES, DURATIONS), hour_of_week(RUSH_HOUR))
+    assert np.allclose(factors, expected)
+
+def test_factors_and_levels_are_in_range():
+    model = TrafficModel(seed=1)
+    for hour in range(0, 168, 5):
+        factors, levels = model.evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS,
+                                               RUSH_HOUR + timedelta(hours=hour))
+        assert (factors >= 1).all()
+        assert ((levels >= 0) & (levels <= 3)).all()
+
+def test_rush_hour_is_slower_than_night():
+    model = TrafficModel()
+    night = datetime(2024, 5, 6, 3, 0)
+    assert (model.evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, RUSH_HOUR)[0]
+            > model.evaluate_legs(STARTS, ENDS, DISTANCES, DURATIONS, night)[0]).all()
+
+def test_road_classes_follow_free_flow_speed():
+    classes = TrafficModel.road_classes(DISTANCES + [1.0], DURATIONS + [0])
+    # A leg without a duration is treated as arterial
+    assert classes.tolist() == [ROAD_LOCAL, ROAD_MOTORWAY, ROAD_MOTORWAY, ROAD_ARTERIAL]
+
+def test_route_duration_evaluates_legs_at_arrival_time():
+    from traffic_model import TimeDependentMatrix
+
+    # Two 60 s slots: leg 0 -> 1 takes 50 s in the first, 1 -> 2 takes 100 s in the second
+    durations = np.array([
+        [[0, 50, 10], [50, 0, 20], [10, 20, 0]],
+        [[0, 70, 30], [70, 0, 100], [30, 100, 0]],
+    ], dtype=np.float32)
+    matrix = TimeDependentMatrix(durations, 60)
+
+    assert matrix.route_duration([0]) == 0
+    # 0 -> 1 departs at 0 s (50 s), 1 -> 2 at 50 s, still in the first slot (20 s)
+    assert matrix.route_duration([0, 1, 2]) == 70
+    # 0 -> 2 (10 s), then 2 -> 1 at 10 s (20 s), then 1 -> 0 at 30 s (50 s)
+    assert matrix.route_duration([0, 2, 1, 0]) == 80
+    # ... and 2 -> 1 back, entered at 70 s, in the second slot (100 s)
+    assert matrix.route_duration([0, 1, 2, 1]) == 170
+    # Times past the last slot use the last slot
+    assert matrix.travel_time(1, 2, 3600) == 100
+
+    # 15 s at stop 1 push 1 -> 2 into the second slot: 5 + 50 + 15 + 100 + 0
+    assert matrix.route_duration([0, 1, 2], service_times=[5, 15, 0]) == 170
+
+def test_time_dependent_matrix_scales_free_flow_durations():
+    coordinates = STARTS
+    durations = [[0, 300, 600], [300, 0, 360], [600, 360, 0]]
+    distances = [[0, 2, 10], [2, 0, 8], [10, 8, 0]]
+
+    matrix = TrafficModel(seed=3).time_dependent_matrix(
+        coordinates, durations, distances, RUSH_HOUR, horizon_hours=2, slot_minutes=15)
+
+    assert matrix.durations.shape == (8, 3, 3)
+    assert matrix.slot_seconds == 900
+    assert (matrix.durations >= np.asarray(durations, dtype=np.float32) - 1e-3).all()
+    assert np.array_equal(matrix.durations, TrafficModel(seed=3).time_dependent_matrix(
+        coordinates, durations, distances, RUSH_HOUR, horizon_hours=2, slot_minutes=15).durations)
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import traffic_refresher
+from traffic_refresher import route_key, traffic_delta, traffic_event_stream
+
+ROUTE = {'coordinates': [[17.1, 48.1], [17.2, 48.2]], 'has_traffic_data': True}
+
+@pytest.fixture(autouse=True)
+def refresher(monkeypatch):
+    """A refresher that never starts its background worker"""
+    refresher = traffic_refresher.TrafficRefresher()
+    monkeypatch.setattr(refresher, '_ensure_started', lambda: None)
+    monkeypatch.setattr(traffic_refresher, 'traffic_refresher', refresher)
+    return refresher
+
+def segment(idx, duration):
+    return {'start_idx': idx, 'end_idx': idx + 1, 'distance': 1000, 'duration': duration, 'base_duration': 60,
+            'traffic_delay': duration - 60, 'traffic_level': 1, 'traffic_color': 'yellow', 'geometry': f'geometry{idx}'}
+
+@pytest.fixture
+def published(refresher):
+    """Version 2 of ROUTE: segment 1's traffic changed in version 2, its geometry never did"""
+    refresher._states[route_key(ROUTE['coordinates'])] = {
+        'version': 2,
+        'route_details': {'segments': [segment(0, 70), segment(1, 90)], 'total_duration': '3 min',
+                          'total_distance': 2.0, 'total_duration_seconds': 160},
+        'reason': 'Heavier traffic',
+        'updated_at': 1700000000,
+        'segment_versions': {0: 1, 1: 2},
+        'geometry_versions': {0: 1, 1: 1}
+    }
+
+def test_delta_is_none_when_client_is_current(published):
+    assert traffic_delta(ROUTE, 2) is None
+
+def test_delta_is_none_for_untracked_route_at_its_own_version():
+    assert traffic_delta(dict(ROUTE, traffic_version=3), 3) is None
+
+@pytest.mark.parametrize('since', [-1, 3])
+def test_unknown_versions_need_a_full_reload(published, since):
+    assert traffic_delta(ROUTE, since) is False
+
+def test_unknown_route_needs_a_full_reload():
+    assert traffic_delta(ROUTE, 1) is False
+
+def test_delta_has_only_segments_changed_since_the_client_version(published):
+    delta = traffic_delta(ROUTE, 1)
+    assert delta['traffic_version'] == 2
+    assert [changed['start_idx'] for changed in delta['segments']] == [1]
+    assert delta['segments'][0]['duration'] == 90
+    # The geometry didn't change, so it isn't resent
+    assert 'geometry' not in delta['segments'][0]
+    assert delta['segment_count'] == 2 and delta['has_traffic_update']
+
+def test_delta_from_version_zero_resends_geometry(published):
+    delta = traffic_delta(ROUTE, 0)
+    assert [changed['geometry'] for changed in delta['segments']] == ['geometry0', 'geometry1']
+
+def routed(idx, start, end):
+    return dict(segment(idx, 60), start=start, end=end, traffic_delay=0, traffic_color='green', weather=None)
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Record the legs the refresher fetches directions for, answering each with a routed segment"""
+    legs = []
+
+    async def get_leg_segments_async(requested):
+        legs.extend(requested)
+        return [routed(0, start, end) for start, end in requested]
+
+    monkeypatch.setattr(traffic_refresher, 'get_leg_segments_async', get_leg_segments_async)
+    return legs
+
+def test_refresh_reapplies_traffic_without_fetching_routed_legs(refresher, fetched):
+    coords = ROUTE['coordinates']
+    details = {'segments': [routed(0, coords[0], coords[1])], 'total_duration': '1 min',
+               'total_distance': 1.0, 'total_duration_seconds': 60}
+    key = refresher.track(coords, details, departure_time=datetime(2024, 5, 6, 8, 0))
+
+    refresher.refresh_once()
+
+    assert fetched == []
+    state = refresher.get_state(key)
+    assert state['route_details']['segments'][0]['geometry'] == 'geometry0'
+    assert state['route_details']['segments'][0]['base_duration'] == 60
+
+def test_refresh_fetches_each_missing_leg_once(refresher, fetched):
+    refresher.track([[17.1, 48.1], [17.2, 48.2], [17.3, 48.3]])
+    refresher.track([[17.1, 48.1], [17.2, 48.2]], include_traffic=False)
+
+    assert refresher.refresh_once() == 2
+    assert fetched == [([17.1, 48.1], [17.2, 48.2]), ([17.2, 48.2], [17.3, 48.3])]
+
+    # Published legs aren't fetched again
+    refresher.refresh_once()
+    assert len(fetched) == 2
+
+def test_routes_with_other_departures_have_their_own_state(refresher, published):
+    departure = datetime.now() + timedelta(days=1)
+    route = dict(ROUTE, departure_time=departure.isoformat())
+
+    assert route_key(ROUTE['coordinates'], departure_time=departure) != route_key(ROUTE['coordinates'])
+    assert traffic_delta(ROUTE, 1)
+    assert traffic_delta(route, 1) is False
+
+def test_streams_over_the_limit_are_told_to_poll(monkeypatch):
+    monkeypatch.setattr(traffic_refresher, '_stream_slots', traffic_refresher.threading.BoundedSemaphore(1))
+    first = traffic_event_stream(ROUTE, keepalive=0.01, max_seconds=5)
+    assert next(first) == 'retry: 5000\n\n'
+
+    second = list(traffic_event_stream(ROUTE))
+    assert len(second) == 1 and second[0].startswith('event: poll\n')
+
+    # Closing a stream frees its slot
+    first.close()
+    assert next(traffic_event_stream(ROUTE, keepalive=0.01, max_seconds=5)) == 'retry: 5000\n\n'
+
+def test_streams_end_after_their_lifetime(monkeypatch):
+    monkeypatch.setattr(traffic_refresher, '_stream_slots', traffic_refresher.threading.BoundedSemaphore(1))
+    events = list(traffic_event_stream(ROUTE, keepalive=0.01, max_seconds=0.05))
+
+    assert events[0] == 'retry: 5000\n\n'
+    assert set(events[1:]) <= {': keepalive\n\n'}
+    # The slot was released when the stream ended
+    assert traffic_refresher._stream_slots.acquire(blocking=False)
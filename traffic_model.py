@@ -0,0 +1,232 @@
+import numpy as np
+from datetime import datetime
+import config
+
+# Road classes derived from the free-flow speed of a leg
+ROAD_MOTORWAY = 0
+ROAD_ARTERIAL = 1
+ROAD_LOCAL = 2
+
+# Free-flow speed thresholds (km/h) separating the road classes
+MOTORWAY_MIN_SPEED = 70
+ARTERIAL_MIN_SPEED = 35
+
+# Travel-time multiplier of an arterial road for each hour of a working day
+WEEKDAY_PROFILE = [
+    1.00, 1.00, 1.00, 1.00, 1.00, 1.02,  # 00-05 night
+    1.10, 1.35, 1.45, 1.25,              # 06-09 morning rush
+    1.12, 1.12, 1.15, 1.15, 1.12,        # 10-14 midday
+    1.20, 1.40, 1.50, 1.40, 1.20,        # 15-19 evening rush
+    1.08, 1.05, 1.02, 1.00               # 20-23 evening
+]
+
+# Travel-time multiplier of an arterial road for each hour of a weekend day
+WEEKEND_PROFILE = [
+    1.00, 1.00, 1.00, 1.00, 1.00, 1.00,
+    1.00, 1.02, 1.05, 1.08,
+    1.12, 1.18, 1.20, 1.18, 1.15,
+    1.12, 1.12, 1.10, 1.08, 1.05,
+    1.04, 1.02, 1.00, 1.00
+]
+
+# How strongly each weekday (Mon..Sun) follows its profile
+DAY_SCALE = [1.0, 1.0, 1.0, 1.0, 1.1, 1.0, 0.8]
+
+# How strongly each road class reacts to congestion (motorway, arterial, local)
+CLASS_SCALE = [0.8, 1.0, 0.6]
+
+# Upper bounds of the congestion excess (multiplier - 1) for traffic levels 0-2;
+# anything above the last bound is level 3
+LEVEL_THRESHOLDS = [0.10, 0.25, 0.40]
+
+TRAFFIC_COLORS = ['green', 'yellow', 'orange', 'red']
+
+# Number of per-segment variation buckets used when the model is seeded
+SEGMENT_BUCKETS = 1024
+
+def build_speed_table():
+    """
+    Precompute the hour-of-week x road-class travel-time multipliers
+
+    Returns:
+        float32 array of shape (168, 3)
+    """
+    weekday = np.asarray(WEEKDAY_PROFILE, dtype=np.float32) - 1
+    weekend = np.asarray(WEEKEND_PROFILE, dtype=np.float32) - 1
+
+    excess = np.empty((7, 24), dtype=np.float32)
+    excess[:5] = weekday
+    excess[5:] = weekend
+    excess *= np.asarray(DAY_SCALE, dtype=np.float32)[:, None]
+
+    table = 1 + excess.reshape(168, 1) * np.asarray(CLASS_SCALE, dtype=np.float32)[None, :]
+    return table.astype(np.float32)
+
+def hour_of_week(when):
+    """Fractional hour of the week (0 = Monday 00:00) for a datetime"""
+    return when.weekday() * 24 + when.hour + when.minute / 60 + when.second / 3600
+
+class TrafficModel:
+    """
+    Deterministic time-dependent traffic model
+
+    Congestion is looked up in a precomputed hour-of-week x road-class table
+    (linearly interpolated between hours). When seeded, every leg also gets a
+    stable per-segment variation so that parallel roads don't all behave the
+    same; the same seed always produces the same results.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.table = build_speed_table()
+
+        if seed is None:
+            self.segment_variation = np.zeros(SEGMENT_BUCKETS, dtype=np.float32)
+        else:
+            rng = np.random.default_rng(seed)
+            self.segment_variation = rng.uniform(-0.25, 0.25, SEGMENT_BUCKETS).astype(np.float32)
+
+    @staticmethod
+    def road_classes(distances_km, base_durations):
+        """Classify legs by their free-flow speed"""
+        distances_km = np.asarray(distances_km, dtype=np.float64)
+        base_durations = np.asarray(base_durations, dtype=np.float64)
+
+        speeds = np.divide(
+            distances_km * 3600, base_durations,
+            out=np.full(distances_km.shape, float(ARTERIAL_MIN_SPEED)),
+            where=base_durations > 0
+        )
+        return np.where(
+            speeds >= MOTORWAY_MIN_SPEED, ROAD_MOTORWAY,
+            np.where(speeds >= ARTERIAL_MIN_SPEED, ROAD_ARTERIAL, ROAD_LOCAL)
+        )
+
+    @staticmethod
+    def segment_buckets(starts, ends):
+        """Stable variation bucket for each leg, from its quantized endpoints"""
+        points = np.concatenate([np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)], axis=-1)
+        quantized = np.round(points * 1e4).astype(np.int64)
+        primes = np.array([73856093, 19349663, 83492791, 50331653], dtype=np.int64)
+        return np.bitwise_xor.reduce(quantized * primes, axis=-1) % SEGMENT_BUCKETS
+
+    def congestion_factors(self, road_classes, hours, buckets=None):
+        """
+        Travel-time multipliers (>= 1) for legs at given hours of the week
+
+        Args:
+            road_classes: Integer road class per leg
+            hours: Fractional hour of week; broadcast against road_classes
+            buckets: Optional per-leg variation bucket (see segment_buckets)
+        """
+        hours = np.mod(np.asarray(hours, dtype=np.float64), 168)
+        lower = np.floor(hours).astype(np.int64)
+        upper = (lower + 1) % 168
+        fraction = (hours - lower).astype(np.float32)
+
+        road_classes = np.asarray(road_classes)
+        excess = (
+            (self.table[lower, road_classes] - 1) * (1 - fraction)
+            + (self.table[upper, road_classes] - 1) * fraction
+        )
+        if buckets is not None:
+            excess = excess * (1 + self.segment_variation[np.asarray(buckets)])
+        return 1 + excess
+
+    @staticmethod
+    def traffic_levels(factors):
+        """Map travel-time multipliers to the 0-3 traffic level scale"""
+        return np.searchsorted(LEVEL_THRESHOLDS, np.asarray(factors) - 1, side='right')
+
+    def evaluate_legs(self, starts, ends, distances_km, base_durations, when=None, offsets=None):
+        """
+        Evaluate the model for a batch of legs
+
+        Args:
+            when: Reference time (default: now)
+            offsets: Optional seconds after `when` at which each leg is entered
+
+        Returns:
+            Tuple (factors, levels) of per-leg arrays
+        """
+        when = when or datetime.now()
+        hours = hour_of_week(when)
+        if offsets is not None:
+            hours = hours + np.asarray(offsets, dtype=np.float64) / 3600
+
+        classes = self.road_classes(distances_km, base_durations)
+        buckets = self.segment_buckets(starts, ends)
+        factors = self.congestion_factors(classes, hours, buckets)
+        return factors, self.traffic_levels(factors)
+
+    def time_dependent_matrix(self, coordinates, durations, distances, departure,
+                              horizon_hours=None, slot_minutes=None):
+        """
+        Build a time-bucketed travel-time matrix
+
+        Args:
+            coordinates: [lon, lat] of the n matrix points
+            durations: Free-flow n x n durations in seconds
+            distances: n x n distances in km
+            departure: Datetime of the first slot
+            horizon_hours: Time span covered by the slots
+            slot_minutes: Width of a slot
+
+        Returns:
+            TimeDependentMatrix with a float32 (slots, n, n) duration array
+        """
+        horizon_hours = horizon_hours or config.TD_MATRIX_HORIZON_HOURS
+        slot_minutes = slot_minutes or config.TD_MATRIX_SLOT_MINUTES
+
+        durations = np.asarray(durations, dtype=np.float64)
+        points = np.asarray(coordinates, dtype=np.float64)
+        n = len(points)
+        slot_count = max(1, int(np.ceil(horizon_hours * 60 / slot_minutes)))
+
+        classes = self.road_classes(distances, durations)
+        buckets = self.segment_buckets(
+            np.broadcast_to(points[:, None, :], (n, n, 2)),
+            np.broadcast_to(points[None, :, :], (n, n, 2))
+        )
+        # Slot midpoints, broadcast against the n x n pair grid
+        hours = hour_of_week(departure) + (np.arange(slot_count) + 0.5) * slot_minutes / 60
+        factors = self.congestion_factors(classes[None, :, :], hours[:, None, None], buckets[None, :, :])
+
+        return TimeDependentMatrix((durations[None, :, :] * factors).astype(np.float32), slot_minutes * 60)
+
+class TimeDependentMatrix:
+    """Travel times per departure slot, looked up by time since route start"""
+
+    def __init__(self, durations, slot_seconds):
+        self.durations = durations  # float32 array (slots, n, n)
+        self.slot_seconds = slot_seconds
+        self._slots = durations.tolist()  # nested lists for fast scalar lookups in the solver
+        self._last_slot = len(self._slots) - 1
+
+    def travel_time(self, from_idx, to_idx, elapsed):
+        """Duration of a leg entered `elapsed` seconds after departure"""
+        slot = min(int(elapsed // self.slot_seconds), self._last_slot)
+        return self._slots[slot][from_idx][to_idx]
+
+    def route_duration(self, route, service_times=None):
+        """
+        Total duration of a route, evaluating each leg at the time it is entered
+
+        Args:
+            route: Sequence of matrix indices
+            service_times: Optional seconds spent at each point (by index),
+                which delay the legs after it
+        """
+        if not service_times:
+            elapsed = 0
+            for from_idx, to_idx in zip(route, route[1:]):
+                elapsed += self.travel_time(from_idx, to_idx, elapsed)
+            return elapsed
+
+        elapsed = service_times[route[0]]
+        for from_idx, to_idx in zip(route, route[1:]):
+            elapsed += self.travel_time(from_idx, to_idx, elapsed) + service_times[to_idx]
+        return elapsed
+
+# Shared model instance
+traffic_model = TrafficModel(seed=config.TRAFFIC_MODEL_SEED)
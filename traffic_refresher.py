@@ -0,0 +1,432 @@
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+import config
+from geometry import segment_geometry
+from pubsub import broker
+from route_optimizer import (
+    get_leg_segments_async, apply_traffic_conditions, compare_route_traffic, summarize_route,
+    close_async_client, parse_departure_time
+)
+
+# Segment fields that change with traffic and are sent in delta updates
+TRAFFIC_FIELDS = ('distance', 'duration', 'base_duration', 'traffic_delay', 'traffic_level', 'traffic_color')
+
+def route_key(coordinates, include_traffic=True, departure_time=None):
+    """
+    Stable key identifying a route by its ordered stops
+
+    Routes planned for different departures have different traffic, so the
+    departure time is part of the key.
+    """
+    departure = departure_time.isoformat() if departure_time else None
+    payload = json.dumps([coordinates, bool(include_traffic), departure], separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+class TrafficRefresher:
+    """
+    Background worker keeping traffic data of active routes up to date
+
+    Views register the routes they serve with track(). Once per interval the
+    worker re-applies the traffic model to the routed legs of all active
+    routes; directions are only fetched for legs that have none yet, once per
+    unique leg however many routes share it. Significant changes are
+    published as a new state version, so a poll is just a dictionary lookup
+    no matter how many browsers watch the same route.
+    """
+
+    def __init__(self, interval=None, idle_timeout=None, threshold_percent=15):
+        self.interval = interval or config.TRAFFIC_REFRESH_INTERVAL
+        self.idle_timeout = idle_timeout or config.TRAFFIC_ROUTE_IDLE_TIMEOUT
+        self.threshold_percent = threshold_percent
+        self._routes = {}  # route key -> coordinates, traffic flag, last poll time
+        self._states = {}  # route key -> latest published state
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, coordinates, route_details=None, include_traffic=True, departure_time=None):
+        """
+        Register a route as active and return its key
+
+        Args:
+            coordinates: Ordered [lon, lat] stops of the route
+            route_details: Details the route was created with, used as version 0
+            include_traffic: Whether traffic delays are applied to the route
+            departure_time: Planned departure; traffic is evaluated from then
+                on while it is still in the future
+        """
+        key = route_key(coordinates, include_traffic, departure_time)
+        now = time.time()
+
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                self._routes[key] = {
+                    'coordinates': [list(coord) for coord in coordinates],
+                    'include_traffic': bool(include_traffic),
+                    'departure_time': departure_time,
+                    'last_seen': now
+                }
+            else:
+                route['last_seen'] = now
+
+            if key not in self._states and route_details:
+                self._states[key] = {
+                    'version': 0,
+                    'route_details': route_details,
+                    'reason': None,
+                    'updated_at': now
+                }
+
+        self._ensure_started()
+        return key
+
+    def get_state(self, key):
+        """Return the latest published state of a route, or None"""
+        return self._states.get(key)
+
+    def _ensure_started(self):
+        """Start the worker thread on first use (after any fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='traffic-refresher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        """Worker loop: refresh all active routes once per interval"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.refresh_once(loop)
+                except Exception as e:
+                    logging.error(f"Error refreshing traffic: {str(e)}")
+        finally:
+            loop.run_until_complete(close_async_client())
+            loop.close()
+
+    def _active_routes(self):
+        """Drop routes nobody polled recently and return a snapshot of the rest"""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            for key in [key for key, route in self._routes.items() if route['last_seen'] < cutoff]:
+                del self._routes[key]
+                self._states.pop(key, None)
+            return dict(self._routes)
+
+    async def _fetch_legs(self, legs):
+        """Fetch the given unique legs and map each leg to its segment"""
+        segments = await get_leg_segments_async([(list(start), list(end)) for start, end in legs])
+        return dict(zip(legs, segments))
+
+    def refresh_once(self, loop=None):
+        """
+        Run a single refresh pass over all active routes
+
+        Returns:
+            Number of routes that got a new published version
+        """
+        routes = self._active_routes()
+        if not routes:
+            return 0
+
+        # Traffic comes from the local model, so routed legs are reused with
+        # their base durations; only legs without one are fetched, once each
+        leg_segments = self._routed_legs(routes)
+        legs = []
+        for route in routes.values():
+            coords = route['coordinates']
+            for start, end in zip(coords, coords[1:]):
+                leg = (tuple(start), tuple(end))
+                if leg not in leg_segments and leg not in legs:
+                    legs.append(leg)
+
+        if legs:
+            if loop is None:
+                leg_segments.update(asyncio.run(self._fetch_legs_once(legs)))
+            else:
+                leg_segments.update(loop.run_until_complete(self._fetch_legs(legs)))
+
+        published = 0
+        now = time.time()
+        for key, route in routes.items():
+            state = self._states.get(key)
+            old_segments = state['route_details'].get('segments', []) if state else []
+            new_segments = self._assemble_segments(route, leg_segments, old_segments)
+            departure = max(route['departure_time'] or datetime.now(), datetime.now())
+            apply_traffic_conditions(new_segments, route['include_traffic'], departure, time_dependent=True)
+            new_details = summarize_route(new_segments, route['include_traffic'])
+
+            if state is None:
+                reason = 'Route information has been refreshed'
+            else:
+                comparison = compare_route_traffic(old_segments, new_segments, self.threshold_percent)
+                if not comparison['needs_update']:
+                    with self._lock:
+                        state['checked_at'] = now
+                    continue
+                reason = comparison['reason']
+
+            version = (state['version'] + 1) if state else 1
+            segment_versions, geometry_versions = self._segment_versions(state, old_segments, new_segments, version)
+
+            with self._lock:
+                if key in self._routes:
+                    self._states[key] = {
+                        'version': version,
+                        'route_details': new_details,
+                        'reason': reason,
+                        'updated_at': now,
+                        'checked_at': now,
+                        'segment_versions': segment_versions,
+                        'geometry_versions': geometry_versions
+                    }
+                    published += 1
+            broker.publish(key, version)
+
+        return published
+
+    def _routed_legs(self, routes):
+        """Map the legs of the given routes to a routed segment from their published states"""
+        leg_segments = {}
+        for key, route in routes.items():
+            state = self._states.get(key)
+            if not state:
+                continue
+            coords = route['coordinates']
+            for segment in state['route_details'].get('segments', []):
+                idx = segment.get('start_idx')
+                # Straight-line fallbacks are fetched again
+                if segment['traffic_color'] != 'gray' and idx is not None and idx + 1 < len(coords):
+                    leg_segments.setdefault((tuple(coords[idx]), tuple(coords[idx + 1])), segment)
+        return leg_segments
+
+    async def _fetch_legs_once(self, legs):
+        """Fetch legs on a throwaway event loop (used outside the worker thread)"""
+        try:
+            return await self._fetch_legs(legs)
+        finally:
+            await close_async_client()
+
+    @staticmethod
+    def _segment_versions(state, old_segments, new_segments, version):
+        """
+        Track the version in which each segment's traffic and geometry last changed
+
+        Returns:
+            Tuple of dictionaries keyed by segment start_idx
+        """
+        segment_versions = dict(state.get('segment_versions', {})) if state else {}
+        geometry_versions = dict(state.get('geometry_versions', {})) if state else {}
+        previous_segments = {old.get('start_idx'): old for old in old_segments}
+
+        for segment in new_segments:
+            idx = segment['start_idx']
+            previous = previous_segments.get(idx)
+            if previous is None or any(previous.get(field) != segment.get(field) for field in TRAFFIC_FIELDS):
+                segment_versions[idx] = version
+            if previous is None or previous.get('geometry') != segment.get('geometry'):
+                geometry_versions[idx] = version
+
+        return segment_versions, geometry_versions
+
+    @staticmethod
+    def _assemble_segments(route, leg_segments, old_segments):
+        """Build a route's segment list from the shared leg results"""
+        coords = route['coordinates']
+        previous_segments = {old.get('start_idx'): old for old in old_segments}
+        segments = []
+        for i, (start, end) in enumerate(zip(coords, coords[1:])):
+            leg_segment = leg_segments.get((tuple(start), tuple(end)))
+            previous = previous_segments.get(i)
+            if not leg_segment:
+                continue
+
+            # A failed fetch must not replace a routed leg with a straight line
+            if leg_segment['traffic_color'] == 'gray' and previous and previous.get('traffic_color') != 'gray':
+                segments.append(dict(previous))
+                continue
+
+            segment = dict(leg_segment)
+            segment['start_idx'] = i
+            segment['end_idx'] = i + 1
+            # Weather is not part of the traffic refresh; keep what the route was built with
+            segment['weather'] = previous.get('weather') if previous else None
+            segments.append(segment)
+        return segments
+
+# Shared per-process refresher used by the Flask views
+traffic_refresher = TrafficRefresher()
+
+def _track_route(route_data):
+    """Register a session route with the shared refresher and return its key"""
+    return traffic_refresher.track(
+        route_data['coordinates'],
+        route_data.get('route_details'),
+        route_data.get('has_traffic_data', True),
+        parse_departure_time(route_data.get('departure_time'))
+    )
+
+def merge_traffic_state(route_data):
+    """
+    Bring a session route up to date with the shared traffic state
+
+    Args:
+        route_data: Route dictionary as stored in the session
+
+    Returns:
+        Tuple (route_data, update) where update is the newly published state,
+        or None if the route already reflects the latest version
+    """
+    state = traffic_refresher.get_state(_track_route(route_data))
+    if not state or state['version'] <= route_data.get('traffic_version', 0):
+        return route_data, None
+
+    new_route = state['route_details']
+    route_data['total_time'] = new_route['total_duration']
+    route_data['total_duration_seconds'] = new_route['total_duration_seconds']
+    route_data['traffic_delay_text'] = new_route.get('traffic_delay_text', '')
+    route_data['traffic_conditions'] = new_route.get('traffic_conditions', [])
+    route_data['route_details'] = new_route
+    if 'segments' in route_data:
+        route_data['segments'] = new_route.get('segments', [])
+    route_data['last_traffic_update'] = int(state['updated_at'])
+    route_data['traffic_version'] = state['version']
+    return route_data, state
+
+def traffic_delta(route_data, since, zoom=None):
+    """
+    Describe what changed in a route's traffic state since a client's version
+
+    Args:
+        route_data: Route dictionary as stored in the session
+        since: Last traffic version the client has applied
+        zoom: Map zoom level the client draws changed geometries at
+
+    Returns:
+        None if the client is up to date, False if it must reload the full
+        route, otherwise a delta with the changed segments and new totals
+    """
+    key = route_key(route_data['coordinates'], route_data.get('has_traffic_data', True),
+                    parse_departure_time(route_data.get('departure_time')))
+    state = traffic_refresher.get_state(key)
+    version = state['version'] if state else route_data.get('traffic_version', 0)
+
+    if since == version:
+        return None
+    if state is None or since < 0 or since > version:
+        return False
+
+    segment_versions = state.get('segment_versions', {})
+    geometry_versions = state.get('geometry_versions', {})
+    segments = []
+    for segment in state['route_details'].get('segments', []):
+        idx = segment['start_idx']
+        if segment_versions.get(idx, 0) <= since and geometry_versions.get(idx, 0) <= since:
+            continue
+
+        changed = {field: segment[field] for field in TRAFFIC_FIELDS if field in segment}
+        changed['start_idx'] = idx
+        if geometry_versions.get(idx, 0) > since:
+            changed['geometry'] = segment_geometry(segment, zoom)
+            changed['geometry_precision'] = segment.get('geometry_precision')
+            changed['instructions'] = segment.get('instructions', [])
+        segments.append(changed)
+
+    details = state['route_details']
+    return {
+        'delta': True,
+        'since': since,
+        'traffic_version': version,
+        'segments': segments,
+        'segment_count': len(details.get('segments', [])),
+        'total_time': details['total_duration'],
+        'total_distance': details['total_distance'],
+        'total_duration_seconds': details['total_duration_seconds'],
+        'traffic_delay_text': details.get('traffic_delay_text', ''),
+        'traffic_conditions': details.get('traffic_conditions', []),
+        'last_traffic_update': int(state['updated_at']),
+        'has_traffic_update': bool(segments),
+        'traffic_update_reason': state['reason']
+    }
+
+def _sse_event(event, data, event_id=None):
+    """Format one server-sent event"""
+    message = f"id: {event_id}\n" if event_id is not None else ''
+    return message + f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+# Streams served at once by this process; each holds a worker thread
+_stream_slots = threading.BoundedSemaphore(config.SSE_MAX_STREAMS)
+
+def traffic_event_stream(route_data, since=0, keepalive=None, zoom=None, max_seconds=None):
+    """
+    Generate server-sent events with the traffic updates of a route
+
+    Nothing is sent until the refresher publishes a new version of the route
+    (apart from keep-alive comments), so an idle subscriber costs a blocked
+    wait rather than a recomputation per tick. That wait still holds a
+    worker thread, so only SSE_MAX_STREAMS streams run at once: over the
+    limit a single 'poll' event tells the client to poll /get_route instead.
+    Streams end after max_seconds; EventSource then reconnects and resumes
+    from its Last-Event-ID.
+
+    Args:
+        route_data: Route dictionary as stored in the session
+        since: Last traffic version the client has applied
+        keepalive: Seconds between keep-alive comments
+        zoom: Map zoom level the client draws changed geometries at
+        max_seconds: Lifetime of the stream, SSE_STREAM_MAX_SECONDS by default
+    """
+    keepalive = keepalive or config.SSE_KEEPALIVE_SECONDS
+    max_seconds = max_seconds or config.SSE_STREAM_MAX_SECONDS
+    if not _stream_slots.acquire(blocking=False):
+        yield _sse_event('poll', {'traffic_version': since})
+        return
+
+    subscription = None
+    try:
+        key = _track_route(route_data)
+        subscription = broker.subscribe(key)
+        deadline = time.monotonic() + max_seconds
+        yield 'retry: 5000\n\n'
+        while True:
+            delta = traffic_delta(route_data, since, zoom)
+            if delta is False:
+                # The client's version is unknown here; it has to refetch the full route
+                state = traffic_refresher.get_state(key)
+                since = state['version'] if state else 0
+                yield _sse_event('reload', {'traffic_version': since}, since)
+            elif delta:
+                since = delta['traffic_version']
+                yield _sse_event('traffic', delta, since)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                subscription.get(timeout=min(keepalive, remaining))
+            except queue.Empty:
+                # Keep the route active in the refresher while someone listens
+                _track_route(route_data)
+                yield ': keepalive\n\n'
+    finally:
+        if subscription is not None:
+            broker.unsubscribe(key, subscription)
+        _stream_slots.release()